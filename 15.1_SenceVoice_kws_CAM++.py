@@ -5,15 +5,14 @@ import threading
 import numpy as np
 import time
 from queue import Queue
-import webrtcvad
 import os
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from transformers import Qwen2VLForConditionalGeneration, AutoTokenizer, AutoProcessor
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
 from qwen_vl_utils import process_vision_info
 import torch
 from funasr import AutoModel
-import pygame
 import edge_tts
 import asyncio
 from time import sleep
@@ -24,6 +23,14 @@ from pypinyin import pinyin, Style
 from modelscope.pipelines import pipeline
 # 需提前安装: pip install modelscope
 from modelscope import snapshot_download
+from speaker_index import SpeakerIndex, extract_embedding
+from streaming_vad import StreamingVAD
+from inference_scheduler import InferenceScheduler
+from pcm_playback import PCMPlaybackEngine, decode_audio
+from frame_bus import FrameBus
+from qwen_vl_local import LocalQwenVL
+from session_replay import SessionRecorder, SessionReplay, TurnLatencyTracker
+from av_segment_buffer import AVSegmentBuffer, MultimodalTurn
 
 # --- 配置huggingFace国内镜像 ---
 import os
@@ -34,8 +41,22 @@ AUDIO_RATE = 16000        # 音频采样率
 AUDIO_CHANNELS = 1        # 单声道
 CHUNK = 1024              # 音频块大小
 VAD_MODE = 3              # VAD 模式 (0-3, 数字越大越敏感)
+VAD_FRAME_MS = 30         # VAD 帧长，单位：毫秒 (10/20/30)
+VAD_PRE_ROLL_MS = 300     # 语音起点前保留的音频，单位：毫秒
 OUTPUT_DIR = "./output"   # 输出目录
 NO_SPEECH_THRESHOLD = 1   # 无效语音阈值，单位：秒
+TTS_SAMPLE_RATE = 24000   # Edge-TTS 输出采样率，播放引擎按此采样率常驻
+VIDEO_BUS_NAME = "sensevoice_camera"  # 摄像头共享内存帧总线名称，其他进程可按名称挂载读取
+VIDEO_BUS_SLOTS = 8       # 帧槽数量，内存占用固定
+VIDEO_FRAMES_PER_TURN = 4 # 每个语音段挑选的关键帧数量 K
+VIDEO_SAMPLE_INTERVAL = 0.5  # 关键帧候选采样间隔，单位：秒
+SAVE_UTTERANCE_WAV = True # 是否保存每段语音为 wav（异步旁路，不在推理关键路径上）
+VL_MAX_VISION_TOKENS = 512  # 本地 Qwen2-VL 每轮视觉 token 预算
+VL_MAX_FRAMES = 4         # 本地 Qwen2-VL 每轮最多帧数
+SESSION_RECORD_PATH = os.getenv('SESSION_RECORD_PATH')    # 录制本次会话（麦克风 PCM + 摄像头 JPEG），用于复现延迟问题
+SESSION_REPLAY_PATH = os.getenv('SESSION_REPLAY_PATH')    # 用录制文件代替麦克风和摄像头
+SESSION_REPLAY_SPEED = float(os.getenv('SESSION_REPLAY_SPEED', '1'))  # 回放倍速
+LATENCY_REPORT_PATH = os.getenv('LATENCY_REPORT_PATH')    # 退出时写出逐轮延迟报告（JSON）
 folder_path = "./Test_QWen2_VL/"
 audio_file_count = 0
 audio_file_count_tmp = 0
@@ -44,16 +65,20 @@ audio_file_count_tmp = 0
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(folder_path, exist_ok=True)
 
-# 队列用于音频和视频同步缓存
+# 队列用于音频缓存；视频帧写入固定大小的共享内存帧总线，不再使用无界队列
 audio_queue = Queue()
-video_queue = Queue()
+# VAD 语音段结束事件队列：(int16 音频, 起始时间, 结束时间)
+utterance_queue = Queue()
 
 # 全局变量
-last_active_time = time.time()
 recording_active = True
-segments_to_save = []
 saved_intervals = []
-last_vad_end_time = 0  # 上次保存的 VAD 有效段结束时间
+# 音视频同步缓冲：保留与最长语音段等长的视频候选帧，内存固定
+av_buffer = AVSegmentBuffer(seconds=30, sample_interval=VIDEO_SAMPLE_INTERVAL)
+# 会话录制 / 回放与逐轮延迟统计（语音结束 → 回答文本 / 开始播放）
+session_recorder = SessionRecorder(SESSION_RECORD_PATH, sample_rate=AUDIO_RATE) if SESSION_RECORD_PATH else None
+session_replay = SessionReplay(SESSION_REPLAY_PATH, speed=SESSION_REPLAY_SPEED) if SESSION_REPLAY_PATH else None
+latency_tracker = TurnLatencyTracker(AUDIO_RATE)
 
 
 # --- 唤醒词、声纹变量配置 ---
@@ -64,13 +89,15 @@ flag_KWS = 0
 
 flag_KWS_used = 1
 flag_sv_used = 1
+flag_video_used = 0  # 开启摄像头，每个语音段附带同时间段的关键帧
+flag_vl_used = 0     # 有关键帧时使用本地 Qwen2-VL 多模态推理（自动开启摄像头）
+if flag_vl_used:
+    flag_video_used = 1
 
 flag_sv_enroll = 0
 thred_sv = 0.35
-
-# 初始化 WebRTC VAD
-vad = webrtcvad.Vad()
-vad.set_mode(VAD_MODE)
+# 已注册用户说出该指令后，下一段有效语音将注册为新的说话人
+set_SV_enroll_KWS = "zhu ce sheng wen"
 
 
 def extract_chinese_and_convert_to_pinyin(input_string):
@@ -95,62 +122,83 @@ def extract_chinese_and_convert_to_pinyin(input_string):
 
 # 音频录制线程
 def audio_recorder():
-    global audio_queue, recording_active, last_active_time, segments_to_save, last_vad_end_time
+    global audio_queue, recording_active
     
     p = pyaudio.PyAudio()
-    stream = p.open(format=pyaudio.paInt16,
-                    channels=AUDIO_CHANNELS,
-                    rate=AUDIO_RATE,
-                    input=True,
-                    frames_per_buffer=CHUNK)
+    if session_replay:
+        stream = session_replay.mic_stream()
+        print(f"使用录制文件代替麦克风: {SESSION_REPLAY_PATH}（{SESSION_REPLAY_SPEED}x）")
+    else:
+        stream = p.open(format=pyaudio.paInt16,
+                        channels=AUDIO_CHANNELS,
+                        rate=AUDIO_RATE,
+                        input=True,
+                        frames_per_buffer=CHUNK)
     
-    audio_buffer = []
+    # 流式 VAD：按帧精确检测，语音段结束时推送事件，不再每 0.5 秒拼接缓冲区
+    stream_vad = StreamingVAD(
+        sample_rate=AUDIO_RATE,
+        frame_ms=VAD_FRAME_MS,
+        mode=VAD_MODE,
+        pre_roll_ms=VAD_PRE_ROLL_MS,
+        hangover_ms=int(NO_SPEECH_THRESHOLD * 1000),
+        on_speech_start=on_speech_start,
+        on_speech_end=lambda pcm, start_time, end_time: on_speech_end(stream_vad, pcm, start_time, end_time),
+    )
     print("音频录制已开始")
     
     while recording_active:
-        data = stream.read(CHUNK)
-        audio_buffer.append(data)
-        
-        # 每 0.5 秒检测一次 VAD
-        if len(audio_buffer) * CHUNK / AUDIO_RATE >= 0.5:
-            # 拼接音频数据并检测 VAD
-            raw_audio = b''.join(audio_buffer)
-            vad_result = check_vad_activity(raw_audio)
-            
-            if vad_result:
-                print("检测到语音活动")
-                last_active_time = time.time()
-                segments_to_save.append((raw_audio, time.time()))
-            else:
-                print("静音中...")
-            
-            audio_buffer = []  # 清空缓冲区
-        
-        # 检查无效语音时间
-        if time.time() - last_active_time > NO_SPEECH_THRESHOLD:
-            # 检查是否需要保存
-            if segments_to_save and segments_to_save[-1][1] > last_vad_end_time:
-                save_audio_video()
-                last_active_time = time.time()
-            else:
-                pass
-                # print("无新增语音段，跳过保存")
+        data = stream.read(CHUNK, exception_on_overflow=False)
+        latency_tracker.mark_audio(CHUNK)
+        if session_recorder:
+            session_recorder.write_audio(data)
+        stream_vad.process(data)
     
+    stream_vad.flush()
+    utterance_queue.put(None)  # 通知分发线程退出
     stream.stop_stream()
     stream.close()
     p.terminate()
 
+# 语音开始：插话打断，取消正在进行的推理、待合成语音和播放
+def on_speech_start(start_time):
+    print("检测到语音活动")
+    inference_scheduler.barge_in()
+
+# 语音结束：按该段末尾样本的采集时间开始本轮延迟计时，交给分发线程
+def on_speech_end(stream_vad, pcm, start_time, end_time):
+    latency_tracker.speech_end(audio_end_ms=(end_time - stream_vad.t0) * 1000)
+    utterance_queue.put((pcm, start_time, end_time))
+
+# 语音段分发线程：阻塞等待 VAD 结束事件，避免保存/推理阻塞录音
+def utterance_dispatcher():
+    while True:
+        item = utterance_queue.get()
+        if item is None:
+            break
+        save_audio_video(*item)
+
 # 视频录制线程
 def video_recorder():
-    global video_queue, recording_active
+    global recording_active
     
-    cap = cv2.VideoCapture(0)  # 使用默认摄像头
+    cap = session_replay.video_capture() if session_replay else cv2.VideoCapture(0)  # 使用默认摄像头
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    video_bus = FrameBus.create(VIDEO_BUS_NAME, (480, 640, 3), slots=VIDEO_BUS_SLOTS)
     print("视频录制已开始")
     
     while recording_active:
         ret, frame = cap.read()
         if ret:
-            video_queue.put((frame, time.time()))
+            if frame.shape[:2] != (480, 640):
+                frame = cv2.resize(frame, (640, 480))
+            # 写入帧总线（环形覆盖），显示/上传/本地模型等消费者零拷贝读取
+            frame_time = time.time()
+            video_bus.publish(frame, frame_time)
+            av_buffer.add_frame(frame, frame_time)
+            if session_recorder:
+                session_recorder.write_frame(frame, frame_time)
             
             # 实时显示摄像头画面
             cv2.imshow("Real Camera", frame)
@@ -160,30 +208,41 @@ def video_recorder():
             print("无法获取摄像头画面")
     
     cap.release()
+    video_bus.close()
     cv2.destroyAllWindows()
 
-# 检测 VAD 活动
-def check_vad_activity(audio_data):
-    # 将音频数据分块检测
-    num, rate = 0, 0.5
-    step = int(AUDIO_RATE * 0.02)  # 20ms 块大小
-    flag_rate = round(rate * len(audio_data) // step)
+# wav 异步写入线程（单线程，保证写入顺序）
+wav_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wav_writer")
 
-    for i in range(0, len(audio_data), step):
-        chunk = audio_data[i:i + step]
-        if len(chunk) == step:
-            if vad.is_speech(chunk, sample_rate=AUDIO_RATE):
-                num += 1
 
-    if num > flag_rate:
-        return True
-    return False
+def pcm_to_float32(pcm):
+    """16-bit PCM（字节或 int16 数组）转换为 [-1, 1] 的 float32 数组，SenseVoice 和 CAM++ 均可直接使用"""
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
 
-# 保存音频和视频
-def save_audio_video():
-    pygame.mixer.init()
 
-    global segments_to_save, video_queue, last_vad_end_time, saved_intervals
+def write_wav(path, pcm_bytes):
+    """将 16-bit PCM 写入 wav 文件"""
+    try:
+        wf = wave.open(path, 'wb')
+        wf.setnchannels(AUDIO_CHANNELS)
+        wf.setsampwidth(2)  # 16-bit PCM
+        wf.setframerate(AUDIO_RATE)
+        wf.writeframes(pcm_bytes)
+        wf.close()
+        print(f"音频保存至 {path}")
+    except Exception as e:
+        print(f"音频保存失败: {e}")
+
+# 保存音频和视频
+def save_audio_video(segment_pcm, start_time, end_time):
+    """
+    处理一个 VAD 语音段
+    
+    :param segment_pcm: 该段 16kHz int16 音频
+    :param start_time: 语音段起始时间 (time.time() 时间轴)
+    :param end_time: 语音段结束时间
+    """
+    global saved_intervals
 
     # 全局变量，用于保存音频文件名计数
     global audio_file_count
@@ -191,82 +250,70 @@ def save_audio_video():
     global set_SV_enroll
 
     if flag_sv_enroll:
-        audio_output_path = f"{set_SV_enroll}/enroll_0.wav"
+        enroll_name = f"enroll_{len(speaker_index)}"
+        audio_output_path = f"{set_SV_enroll}/{enroll_name}.wav"
     else:
         audio_file_count += 1
         audio_output_path = f"{OUTPUT_DIR}/audio_{audio_file_count}.wav"
     # audio_output_path = f"{OUTPUT_DIR}/audio_0.wav"
 
-    if not segments_to_save:
+    if len(segment_pcm) == 0:
         return
     
-    # 停止当前播放的音频
-    if pygame.mixer.music.get_busy():
-        pygame.mixer.music.stop()
-        print("检测到新的有效音，已停止当前音频播放")
-        
-    # 获取有效段的时间范围
-    start_time = segments_to_save[0][1]
-    end_time = segments_to_save[-1][1]
-    
-    # 检查是否与之前的片段重叠
-    if saved_intervals and saved_intervals[-1][1] >= start_time:
-        print("当前片段与之前片段重叠，跳过保存")
-        segments_to_save.clear()
-        return
-    
-    # 保存音频
-    audio_frames = [seg[0] for seg in segments_to_save]
+    # 音频在内存中直接交给模型（int16 -> float32，16kHz 单声道）
     if flag_sv_enroll:
-        audio_length = 0.5 * len(segments_to_save)
+        audio_length = len(segment_pcm) / AUDIO_RATE
         if audio_length < 3:
             print("声纹注册语音需大于3秒，请重新注册")
             return 1
 
-    wf = wave.open(audio_output_path, 'wb')
-    wf.setnchannels(AUDIO_CHANNELS)
-    wf.setsampwidth(2)  # 16-bit PCM
-    wf.setframerate(AUDIO_RATE)
-    wf.writeframes(b''.join(audio_frames))
-    wf.close()
-    print(f"音频保存至 {audio_output_path}")
+    pcm_bytes = segment_pcm.tobytes()
+    audio_data = pcm_to_float32(segment_pcm)
+
+    # wav 落盘走异步旁路；注册语音始终保存，便于重建声纹索引
+    if flag_sv_enroll or SAVE_UTTERANCE_WAV:
+        wav_writer.submit(write_wav, audio_output_path, pcm_bytes)
 
     # Inference()
 
     if flag_sv_enroll:
-        text = "声纹注册完成！现在只有你可以命令我啦！"
+        # 注册时只提取一次 embedding 写入索引，后续验证不再重复读取注册音频
+        speaker_index.add(enroll_name, extract_embedding(sv_pipeline, audio_data))
+        if len(speaker_index) > 1:
+            text = f"声纹注册完成！当前共有{len(speaker_index)}位用户可以命令我啦！"
+        else:
+            text = "声纹注册完成！现在只有你可以命令我啦！"
         print(text)
         flag_sv_enroll = 0
         system_introduction(text)
     else:
-    # 使用线程执行推理
-        inference_thread = threading.Thread(target=Inference, args=(audio_output_path,))
-        inference_thread.start()
+        # 音频与同时间段的关键帧组成一个轮次，提交到推理调度器（单工作线程，新请求会取消旧推理）
+        frames = av_buffer.select(start_time, end_time, VIDEO_FRAMES_PER_TURN) if flag_video_used else []
+        inference_scheduler.submit(MultimodalTurn(audio_data, start_time, end_time, frames))
         
         # 记录保存的区间
         saved_intervals.append((start_time, end_time))
-        
-    # 清空缓冲区
-    segments_to_save.clear()
 
 # --- 播放音频 -
-def play_audio(file_path):
+def play_audio(pcm, cancel_token=None):
+    """将 PCM 送入常驻播放引擎，播放结束立即返回，被插话取消时立即停止"""
     try:
-        pygame.mixer.init()
-        pygame.mixer.music.load(file_path)
-        pygame.mixer.music.play()
-        while pygame.mixer.music.get_busy():
-            time.sleep(1)  # 等待音频播放结束
-        print("播放完成！")
+        playback.enqueue(pcm)
+        if playback.wait(cancel_token):
+            print("播放完成！")
+        else:
+            print("播放已取消")
     except Exception as e:
         print(f"播放失败: {e}")
-    finally:
-        pygame.mixer.quit()
 
-async def amain(TEXT, VOICE, OUTPUT_FILE) -> None:
-    """Main function"""
+async def amain(TEXT, VOICE) -> np.ndarray:
+    """Edge-TTS 合成，MP3 在内存中解码为 PCM，不落盘"""
     communicate = edge_tts.Communicate(TEXT, VOICE)
-    await communicate.save(OUTPUT_FILE)
+    mp3_chunks = []
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            mp3_chunks.append(chunk["data"])
+    return decode_audio(b''.join(mp3_chunks), TTS_SAMPLE_RATE)
 
 import os
 
@@ -303,6 +350,11 @@ sv_pipeline = pipeline(
     model='damo/speech_campplus_sv_zh-cn_16k-common',
     model_revision='v1.0.0'
 )
+# 注册声纹索引：注册 embedding 只计算一次并持久化，兼容已有的注册 wav 文件
+set_SV_index = './SpeakerVerification_DIR/speaker_index.npz'
+speaker_index = SpeakerIndex(set_SV_index)
+os.makedirs(set_SV_enroll, exist_ok=True)
+speaker_index.build_from_dir(set_SV_enroll, lambda path: extract_embedding(sv_pipeline, path))
 
 # --------- QWen2.5大语言模型 ---------------
 # model_name = r"E:\2_PYTHON\Project\GPT\QWen\Qwen2.5-0.5B-Instruct"  # Windows路径,Linux环境无效
@@ -318,8 +370,17 @@ model = AutoModelForCausalLM.from_pretrained(
     trust_remote_code=True
 )
 tokenizer = AutoTokenizer.from_pretrained(qwen_local_dir, trust_remote_code=True)
+
+# --------- QWen2-VL 多模态模型（可选） ---------------
+vl_model = None
+if flag_vl_used:
+    vl_local_dir = snapshot_download(model_id="qwen/Qwen2-VL-2B-Instruct")
+    vl_model = LocalQwenVL(vl_local_dir, max_vision_tokens=VL_MAX_VISION_TOKENS, max_frames=VL_MAX_FRAMES)
 # ---------- 模型加载结束 -----------------------
 
+# -------- 常驻 PCM 播放引擎（回调输出流，毫秒级停止） --------
+playback = PCMPlaybackEngine(sample_rate=TTS_SAMPLE_RATE)
+
 class ChatMemory:
     def __init__(self, max_length=2048):
         self.history = []
@@ -345,26 +406,93 @@ class ChatMemory:
 # -------- memory 初始化 --------
 memory = ChatMemory(max_length=512)
 
-def system_introduction(text):
+def system_introduction(text, cancel_token=None):
     global audio_file_count
     global folder_path
     text = text
     print("LLM output:", text)
     used_speaker = "zh-CN-XiaoyiNeural"
-    asyncio.run(amain(text, used_speaker, os.path.join(folder_path,f"sft_tmp_{audio_file_count}.mp3")))
-    play_audio(f'{folder_path}/sft_tmp_{audio_file_count}.mp3')
+    pcm = asyncio.run(amain(text, used_speaker))
+    if cancel_token and cancel_token.cancelled:
+        return
+    play_audio(pcm, cancel_token)
+
+
+def stop_playback():
+    """停止当前播放（插话时由推理调度器调用）"""
+    if playback.is_busy():
+        playback.stop()
+        print("检测到新的有效音，已停止当前音频播放")
+
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """推理被取消时立即停止 LLM 生成"""
+
+    def __init__(self, cancel_token):
+        self.cancel_token = cancel_token
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancel_token.cancelled,
+                          dtype=torch.bool, device=input_ids.device)
+
+
+class StageTimer:
+    """记录单轮对话各阶段耗时（毫秒）"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
 
-def Inference(TEMP_AUDIO_FILE=f"{OUTPUT_DIR}/audio_0.wav"):
+    def timed(self, name, func, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stages[name] = (time.perf_counter() - t0) * 1000
+
+    def report(self):
+        stages = " | ".join(f"{name} {ms:.0f}ms" for name, ms in self.stages.items())
+        total = (time.perf_counter() - self.start) * 1000
+        print(f"[Timing] {stages} | total {total:.0f}ms")
+
+
+# ASR 与声纹 embedding 提取并行执行的线程池（每轮两个分支）
+stage_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stage")
+
+
+def run_asr(audio):
+    """SenseVoice 语音识别，返回去掉情感/语种标签后的文本"""
+    res = model_senceVoice.generate(
+        input=audio,
+        cache={},
+        language="auto", # "zn", "en", "yue", "ja", "ko", "nospeech"
+        use_itn=False,
+    )
+    return res[0]['text'].split(">")[-1]
+
+
+def run_sv(audio):
+    """CAM++ 声纹验证，返回 (说话人, 得分)"""
+    sv_emb = extract_embedding(sv_pipeline, audio)
+    return speaker_index.verify(sv_emb, thred_sv)
+
+
+def Inference(TEMP_AUDIO_FILE=f"{OUTPUT_DIR}/audio_0.wav", cancel_token=None, frames=None):
     '''
+    TEMP_AUDIO_FILE: wav 路径，或录音线程直接传入的 16kHz float32 音频数组（无需落盘）
+    cancel_token: 推理调度器传入的取消标记，被插话取消时尽早放弃后续阶段
+    frames: 与该语音段同时间段的关键帧 [(timestamp, BGR 帧)]
     1. 使用senceVoice做asr，转换为拼音，检测唤醒词
         - 首先检测声纹注册文件夹是否有注册文件，如果无，启动声纹注册
     2. 使用CAM++做声纹识别
-        - 设置固定声纹注册语音目录，每次输入音频均进行声纹对比
+        - 每次输入音频只提取一次 embedding，与声纹索引中所有注册用户做余弦比对
+        - ASR 与声纹提取并行执行，任一分支失败即放弃等待另一分支
     3. 以上两者均通过，则进行大模型推理
     '''
     global audio_file_count
 
     global set_SV_enroll
+    global set_SV_enroll_KWS
     global flag_sv_enroll
     global thred_sv
     global flag_sv_used
@@ -375,107 +503,164 @@ def Inference(TEMP_AUDIO_FILE=f"{OUTPUT_DIR}/audio_0.wav"):
     
     os.makedirs(set_SV_enroll, exist_ok=True)
     # --- 如果开启声纹识别，且声纹文件夹为空，则开始声纹注册。设定注册语音有效长度需大于3秒
-    if flag_sv_used and is_folder_empty(set_SV_enroll):
+    if flag_sv_used and speaker_index.is_empty():
         text = f"无声纹注册文件！请先注册声纹，需大于三秒哦~"
         print(text)
         system_introduction(text)
         flag_sv_enroll = 1
-    
-    else:
-        # -------- SenceVoice 推理 ---------
-        input_file = (TEMP_AUDIO_FILE)
-        res = model_senceVoice.generate(
-            input=input_file,
-            cache={},
-            language="auto", # "zn", "en", "yue", "ja", "ko", "nospeech"
-            use_itn=False,
-        )
-        prompt = res[0]['text'].split(">")[-1]
-        prompt_pinyin = extract_chinese_and_convert_to_pinyin(prompt)
-        print(prompt, prompt_pinyin)
-
-        # --- 判断是否启动KWS
-        if not flag_KWS_used:
-            flag_KWS = 1
-        if not flag_KWS:
-            if set_KWS in prompt_pinyin:
-                flag_KWS = 1
-        
-        # --- KWS成功，或不设置KWS
-        if flag_KWS:
-            sv_score = sv_pipeline([os.path.join(set_SV_enroll, "enroll_0.wav"), TEMP_AUDIO_FILE], thr=thred_sv)
-            print(sv_score)
-            sv_result = sv_score['text']
-            if sv_result == "yes":
-
-                # --- 读取历史对话 ---
-                context = memory.get_context()
-                
-                # prompt_tmp = res[0]['text'].split(">")[-1] + "，回答简短一些，保持50字以内！"
-                prompt_tmp = res[0]['text'].split(">")[-1]
-                prompt = f"{context}\nUser:{prompt_tmp}\n"
-
-                print("History:", context)
-                print("ASR OUT:", prompt)
-                # ---------SenceVoice --end----------
-                # -------- 模型推理阶段，将语音识别结果作为大模型Prompt ------
-                messages = [
-                    {"role": "system", "content": "你叫小千，是一个18岁的女大学生，性格活泼开朗，说话俏皮简洁，回答问题不会超过50字。"},
-                    {"role": "user", "content": prompt},
-                ]
-                text = tokenizer.apply_chat_template(
-                    messages,
-                    tokenize=False,
-                    add_generation_prompt=True,
-                )
-                model_inputs = tokenizer([text], return_tensors="pt").to(model.device)
-
-                generated_ids = model.generate(
-                    **model_inputs,
-                    max_new_tokens=512,
-                )
-                generated_ids = [
-                    output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-                ]
-
-                output_text = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-
-                print("answer", output_text)
-
-                # -------- 更新记忆库 -----
-                memory.add_to_history(prompt_tmp, output_text)
-
-                # 输入文本
-                text = output_text
-                # 语种识别 -- langid
-                language, confidence = langid.classify(text)
-                # 语种识别 -- langdetect 
-                # language = detect(text).split("-")[0]
-
-                language_speaker = {
-                "ja" : "ja-JP-NanamiNeural",            # ok
-                "fr" : "fr-FR-DeniseNeural",            # ok
-                "es" : "ca-ES-JoanaNeural",             # ok
-                "de" : "de-DE-KatjaNeural",             # ok
-                "zh" : "zh-CN-XiaoyiNeural",            # ok
-                "en" : "en-US-AnaNeural",               # ok
-                }
-
-                if language not in language_speaker.keys():
-                    used_speaker = "zh-CN-XiaoyiNeural"
-                else:
-                    used_speaker = language_speaker[language]
-                    print("检测到语种：", language, "使用音色：", language_speaker[language])
-
-                asyncio.run(amain(text, used_speaker, os.path.join(folder_path,f"sft_{audio_file_count}.mp3")))
-                play_audio(f'{folder_path}/sft_{audio_file_count}.mp3')
-            else:
+        return
+
+    timer = StageTimer()
+    if frames:
+        print(f"[Video] 本轮附带 {len(frames)} 帧: " + ", ".join(f"{ts:.2f}" for ts, _ in frames))
+    # -------- SenceVoice ASR 与 CAM++ 声纹提取并行 ---------
+    asr_future = stage_executor.submit(timer.timed, "asr", run_asr, TEMP_AUDIO_FILE)
+    sv_future = None
+    if flag_sv_used:
+        sv_future = stage_executor.submit(timer.timed, "sv", run_sv, TEMP_AUDIO_FILE)
+
+    pending = {asr_future, sv_future} - {None}
+    prompt_pinyin = ""
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+        if sv_future in done:
+            sv_speaker, sv_score = sv_future.result()
+            print(f"声纹验证: {sv_speaker}, score: {sv_score:.3f}")
+            if not sv_speaker:
+                # 声纹失败：不再等待 ASR 分支
+                asr_future.cancel()
                 text = "很抱歉，声纹验证失败，我无法为您服务"
                 print(text)
                 # system_introduction(text)
-        else:
-            text = "很抱歉，唤醒词错误，请说出正确的唤醒词哦"
-            system_introduction(text)
+                timer.report()
+                return
+
+        if asr_future in done:
+            prompt_tmp = asr_future.result()
+            prompt_pinyin = extract_chinese_and_convert_to_pinyin(prompt_tmp)
+            print(prompt_tmp, prompt_pinyin)
+
+            # --- 判断是否启动KWS
+            if not flag_KWS_used:
+                flag_KWS = 1
+            if not flag_KWS:
+                if set_KWS in prompt_pinyin:
+                    flag_KWS = 1
+            if not flag_KWS:
+                # 唤醒词错误：不再等待声纹分支
+                if sv_future:
+                    sv_future.cancel()
+                text = "很抱歉，唤醒词错误，请说出正确的唤醒词哦"
+                system_introduction(text, cancel_token)
+                timer.report()
+                return
+
+    if cancel_token and cancel_token.cancelled:
+        timer.report()
+        return
+
+    # --- KWS成功（或不设置KWS），且声纹通过（或不设置声纹）
+    if flag_sv_used and set_SV_enroll_KWS in prompt_pinyin:
+        text = "好的，请说一段大于三秒的话，完成新用户的声纹注册~"
+        print(text)
+        system_introduction(text, cancel_token)
+        flag_sv_enroll = 1
+        timer.report()
+        return
+
+    # --- 读取历史对话 ---
+    context = memory.get_context()
+    
+    # prompt_tmp = prompt_tmp + "，回答简短一些，保持50字以内！"
+    prompt = f"{context}\nUser:{prompt_tmp}\n"
+
+    print("History:", context)
+    print("ASR OUT:", prompt)
+    # ---------SenceVoice --end----------
+    # -------- 模型推理阶段，将语音识别结果作为大模型Prompt ------
+    stopping_criteria = StoppingCriteriaList([CancelStoppingCriteria(cancel_token)]) if cancel_token else None
+    if vl_model is not None and frames:
+        # -------- 本地 Qwen2-VL：语音识别结果 + 同时间段关键帧 ------
+        system_prompt = "你叫小千，是一个18岁的女大学生，性格活泼开朗，说话俏皮简洁，回答问题不会超过50字。你能通过摄像头看到用户。"
+        output_text, vl_stats = timer.timed("llm", vl_model.chat,
+            [frame for _, frame in frames], prompt, system_prompt,
+            max_new_tokens=512,
+            stopping_criteria=stopping_criteria,
+        )
+        print(f"[VL] 视觉编码 {vl_stats['vision_ms']:.0f}ms | prefill {vl_stats['prefill_ms']:.0f}ms | "
+              f"视觉 token {vl_stats['vision_tokens']}/{vl_stats['vision_budget']}"
+              f"（缓存复用 {vl_stats['cached_frames']}/{vl_stats['frames']} 帧）| "
+              f"prompt token {vl_stats['prompt_tokens']} | 生成 token {vl_stats['new_tokens']}")
+    else:
+        messages = [
+            {"role": "system", "content": "你叫小千，是一个18岁的女大学生，性格活泼开朗，说话俏皮简洁，回答问题不会超过50字。"},
+            {"role": "user", "content": prompt},
+        ]
+        text = tokenizer.apply_chat_template(
+            messages,
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+        model_inputs = tokenizer([text], return_tensors="pt").to(model.device)
+
+        generated_ids = timer.timed("llm", model.generate,
+            **model_inputs,
+            max_new_tokens=512,
+            stopping_criteria=stopping_criteria,
+        )
+        generated_ids = [
+            output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
+        ]
+        output_text = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
+
+    if cancel_token and cancel_token.cancelled:
+        print("LLM 生成已取消")
+        timer.report()
+        return
+
+    print("answer", output_text)
+    latency_tracker.first_text()
+
+    # -------- 更新记忆库 -----
+    memory.add_to_history(prompt_tmp, output_text)
+
+    # 输入文本
+    text = output_text
+    # 语种识别 -- langid
+    language, confidence = langid.classify(text)
+    # 语种识别 -- langdetect 
+    # language = detect(text).split("-")[0]
+
+    language_speaker = {
+    "ja" : "ja-JP-NanamiNeural",            # ok
+    "fr" : "fr-FR-DeniseNeural",            # ok
+    "es" : "ca-ES-JoanaNeural",             # ok
+    "de" : "de-DE-KatjaNeural",             # ok
+    "zh" : "zh-CN-XiaoyiNeural",            # ok
+    "en" : "en-US-AnaNeural",               # ok
+    }
+
+    if language not in language_speaker.keys():
+        used_speaker = "zh-CN-XiaoyiNeural"
+    else:
+        used_speaker = language_speaker[language]
+        print("检测到语种：", language, "使用音色：", language_speaker[language])
+
+    pcm = timer.timed("tts", asyncio.run, amain(text, used_speaker))
+    timer.report()
+    if cancel_token and cancel_token.cancelled:
+        return
+    latency_tracker.first_audio()
+    play_audio(pcm, cancel_token)
+    latency_tracker.response_done()
+
+# -------- 推理调度器：单工作线程 + 有界队列，新语音取消旧推理 --------
+inference_scheduler = InferenceScheduler(
+    handler=lambda turn, token: Inference(turn.audio, cancel_token=token, frames=turn.frames),
+    max_pending=1,
+    on_cancel=stop_playback,
+)
 
 # 主函数
 if __name__ == "__main__":
@@ -483,9 +668,13 @@ if __name__ == "__main__":
     try:
         # 启动音视频录制线程
         audio_thread = threading.Thread(target=audio_recorder)
-        # video_thread = threading.Thread(target=video_recorder)
+        dispatcher_thread = threading.Thread(target=utterance_dispatcher, daemon=True)
+        dispatcher_thread.start()
+        inference_scheduler.start()
+        video_thread = threading.Thread(target=video_recorder) if flag_video_used else None
         audio_thread.start()
-        # video_thread.start()
+        if video_thread:
+            video_thread.start()
 
         flag_info = f'{flag_sv_used}-{flag_KWS_used}'
         dict_flag_info = {
@@ -506,5 +695,14 @@ if __name__ == "__main__":
         print("录制停止中...")
         recording_active = False
         audio_thread.join()
-        # video_thread.join()
+        inference_scheduler.shutdown()
+        playback.close()
+        if video_thread:
+            video_thread.join()
+        if session_recorder:
+            session_recorder.close()
+            print(f"会话已录制到 {SESSION_RECORD_PATH}")
+        if LATENCY_REPORT_PATH:
+            latency_tracker.save(LATENCY_REPORT_PATH, replay=SESSION_REPLAY_PATH)
+            print(f"延迟报告已写入 {LATENCY_REPORT_PATH}")
         print("录制已停止")
@@ -0,0 +1,109 @@
+"""
+上传音频的本地 VAD 门控（qwen_video_server.py）
+VideoAnalysisSession 关闭了上游的服务端 VAD（enable_turn_detection=False），原来 /api/session/<id>/audio
+把每个音频块原样转发，静音也占用上游带宽和处理时间。这里复用 streaming_vad.StreamingVAD（WebRTC VAD）：
+- AudioGate: 会话级流式门控，只转发语音段（含 pre-roll / 拖尾），静音块直接丢弃；
+  语音结束时可回调提交输入（自动 commit + 生成回复）
+- trim_silence: 一次性音频（/api/analyze-video）裁掉首尾静音，整段没有语音时返回空
+
+音频格式与上游 input_audio_format 一致：16kHz 单声道 16-bit PCM
+"""
+
+import base64
+import threading
+import numpy as np
+from streaming_vad import StreamingVAD
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+
+
+def _samples(pcm_bytes):
+    """bytes → int16 数组（奇数长度时丢弃最后一个字节）"""
+    return np.frombuffer(pcm_bytes[:len(pcm_bytes) // 2 * 2], dtype=np.int16)
+
+
+def trim_silence(pcm_bytes, mode=2, pre_roll_ms=300, hangover_ms=600, sample_rate=SAMPLE_RATE):
+    """
+    裁掉 PCM 音频首尾的静音（语音段前后各保留 pre_roll_ms），中间的停顿保持不变
+
+    :return: 裁剪后的 PCM bytes；没有检测到语音时返回 b""
+    """
+    samples = _samples(pcm_bytes)
+    segments = []
+    vad = StreamingVAD(sample_rate, FRAME_MS, mode, pre_roll_ms=pre_roll_ms, hangover_ms=hangover_ms,
+                       on_speech_end=lambda pcm, start, end: segments.append((start, end)))
+    # capture_time 取音频时长，使 VAD 时间轴从 0 开始，回调时间即音频内的秒数
+    vad.process(samples, capture_time=len(samples) / sample_rate)
+    vad.flush()
+    if not segments:
+        return b""
+    start = max(0, int(round(segments[0][0] * sample_rate)))
+    end = min(len(samples), int(round(segments[-1][1] * sample_rate)))
+    return samples[start:end].tobytes()
+
+
+class AudioGate:
+    """
+    会话级流式 VAD 门控
+
+    :param send: send(audio_b64) 把语音音频转发到上游
+    :param on_speech_end: 语音段结束时调用（如提交输入触发回复），为 None 时不自动提交
+    """
+
+    def __init__(self, send, on_speech_end=None, mode=2, pre_roll_ms=300, hangover_ms=600,
+                 sample_rate=SAMPLE_RATE):
+        self.send = send
+        self.on_speech_end = on_speech_end
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        self._pending = []  # 本次 feed 中待转发的语音音频，None 表示语音段在此处结束
+        self.vad = StreamingVAD(sample_rate, FRAME_MS, mode, pre_roll_ms=pre_roll_ms, hangover_ms=hangover_ms,
+                                on_speech_audio=lambda view: self._pending.append(view.tobytes()),
+                                on_speech_end=lambda pcm, start, end: self._pending.append(None))
+        self.stats = {"received_bytes": 0, "forwarded_bytes": 0, "segments": 0}
+
+    def feed(self, pcm_bytes):
+        """
+        输入一块 PCM 音频，转发其中的语音部分
+
+        :return: {"speech": 当前是否处于语音段, "forwarded_bytes": 本次转发字节数, "segments_ended": 本次结束的语音段数}
+        """
+        with self.lock:
+            self.stats["received_bytes"] += len(pcm_bytes)
+            self.vad.process(_samples(pcm_bytes))
+            forwarded, ended = self._drain()
+            return {"speech": self.vad.triggered, "forwarded_bytes": forwarded, "segments_ended": ended}
+
+    def flush(self):
+        """
+        音频输入结束：结束当前语音段（会触发 on_speech_end）
+
+        :return: {"forwarded_bytes": 转发的尾部语音字节数, "segments_ended": 结束的语音段数}
+        """
+        with self.lock:
+            self.vad.flush()
+            forwarded, ended = self._drain()
+            return {"forwarded_bytes": forwarded, "segments_ended": ended}
+
+    def _drain(self):
+        """按顺序转发暂存的语音音频，在语音段结束处提交（调用方持有 self.lock）"""
+        forwarded, ended, buffer = 0, 0, []
+        for item in self._pending + [b""]:
+            if item:
+                buffer.append(item)
+                continue
+            # 语音段结束（None）或本次输入结束（b""）：先转发已暂存的音频
+            if buffer:
+                audio = b"".join(buffer)
+                self.send(base64.b64encode(audio).decode("ascii"))
+                forwarded += len(audio)
+                buffer = []
+            if item is None:
+                ended += 1
+                if self.on_speech_end:
+                    self.on_speech_end()
+        self._pending = []
+        self.stats["forwarded_bytes"] += forwarded
+        self.stats["segments"] += ended
+        return forwarded, ended
@@ -0,0 +1,220 @@
+"""
+上传音频的流式解码 / 重采样（qwen_video_server.py）
+上游会话配置为 16kHz 单声道 16-bit PCM，原来浏览器上传的 webm/opus 等压缩音频被原样 Base64 后 append_audio。这里：
+- detect_container: 按文件头识别容器（webm/mkv、ogg、wav、mp4、带 ID3 的 mp3），无法识别的视为已是 PCM16k；
+  stream_start_format 判断分片是否开始新的录音（Ogg 续页不算）
+- StreamingAudioDecoder: 会话级流式解码器。后台线程上的 PyAV 解复用器从阻塞读取器中读数据，
+  MediaRecorder 分片上传的后续块直接接着解码，不重新解析容器；解码后用 AudioResampler 转为 16kHz 单声道 s16
+- decode_to_pcm16k: 一次性解码完整音频文件（/api/analyze-video）
+- OpusStreamEncoder: 下行方向把上游 24kHz PCM 回复音频编码为 Opus 包（qwen_video_server_realtime.py 的 audio_codec=opus）
+"""
+
+import io
+import logging
+import threading
+from collections import deque
+import av
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FEED_TIMEOUT_S = 2.0  # feed() 等待解码器消费完输入的最长时间
+OPUS_FRAME_MS = 20  # Opus 每包时长（libopus 支持 2.5/5/10/20/40/60ms）
+
+# (文件头偏移, 魔数, PyAV 格式名)
+_SIGNATURES = (
+    (0, b"\x1a\x45\xdf\xa3", "matroska"),  # webm / mkv
+    (0, b"OggS", "ogg"),
+    (0, b"RIFF", "wav"),
+    (4, b"ftyp", "mp4"),
+    (0, b"ID3", "mp3"),  # 不识别无 ID3 头的 MP3 帧同步字：两个字节的魔数在原始 PCM 中太容易误判
+)
+
+
+def detect_container(data):
+    """按文件头识别音频容器，返回 PyAV 格式名；无法识别（视为原始 PCM）时返回 None"""
+    for offset, magic, fmt in _SIGNATURES:
+        if data[offset:offset + len(magic)] == magic:
+            return fmt
+    return None
+
+
+def stream_start_format(data):
+    """
+    片段是否开始一段新的录音：是则返回容器格式，否则返回 None
+    Ogg 的每一页都以 OggS 开头（Firefox MediaRecorder 按页切分片段），只有带 BOS 标志的页才是流的开头
+    """
+    container_format = detect_container(data)
+    if container_format == "ogg" and not (len(data) > 5 and data[5] & 0x02):
+        return None
+    return container_format
+
+
+def _resampler():
+    return av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+
+
+def _pcm_bytes(frames):
+    return b"".join(frame.to_ndarray().tobytes() for frame in frames)
+
+
+def decode_to_pcm16k(data, container_format=None):
+    """把完整的压缩音频解码为 16kHz 单声道 16-bit PCM bytes"""
+    resampler = _resampler()
+    out = []
+    with av.open(io.BytesIO(data), format=container_format or detect_container(data)) as container:
+        for frame in container.decode(container.streams.audio[0]):
+            out.append(_pcm_bytes(resampler.resample(frame)))
+    out.append(_pcm_bytes(resampler.resample(None)))
+    return b"".join(out)
+
+
+class _BlockingReader:
+    """供 PyAV 读取的不可 seek 流：没有数据时阻塞，直到 feed 新数据或结束"""
+
+    def __init__(self, cond):
+        self.cond = cond
+        self.chunks = deque()
+        self.eof = False
+        self.starving = False  # 解码线程正在等待输入（已消费完所有数据）
+
+    def read(self, size=-1):
+        with self.cond:
+            while not self.chunks and not self.eof:
+                self.starving = True
+                self.cond.notify_all()
+                self.cond.wait()
+            self.starving = False
+            if not self.chunks:
+                return b""
+            chunk = self.chunks.popleft()
+            if 0 <= size < len(chunk):
+                self.chunks.appendleft(chunk[size:])
+                chunk = chunk[:size]
+            return chunk
+
+
+class StreamingAudioDecoder:
+    """
+    会话级流式音频解码器：feed() 输入容器数据的后续片段，返回新解码出的 16kHz 单声道 PCM
+
+    :param container_format: PyAV 格式名（见 detect_container）
+    """
+
+    def __init__(self, container_format):
+        self.container_format = container_format
+        self.cond = threading.Condition()
+        self.reader = _BlockingReader(self.cond)
+        self.output = []
+        self.error = None
+        self.finished = False
+        self.stats = {"input_bytes": 0, "output_bytes": 0}
+        self.thread = threading.Thread(target=self._run, daemon=True, name="audio-decoder")
+        self.thread.start()
+
+    def _run(self):
+        resampler = _resampler()
+        try:
+            # 小探测量：容器头里已有编解码参数，不必预读大量数据
+            with av.open(self.reader, format=self.container_format,
+                         options={"probesize": "4096", "analyzeduration": "0"}) as container:
+                for frame in container.decode(container.streams.audio[0]):
+                    self._emit(_pcm_bytes(resampler.resample(frame)))
+            self._emit(_pcm_bytes(resampler.resample(None)))
+        except Exception as e:
+            logger.warning(f"音频解码失败（{self.container_format}）: {e}")
+            self.error = e
+        finally:
+            with self.cond:
+                self.finished = True
+                self.cond.notify_all()
+
+    def _emit(self, pcm):
+        if pcm:
+            with self.cond:
+                self.output.append(pcm)
+
+    def _take(self):
+        pcm = b"".join(self.output)
+        self.output = []
+        self.stats["output_bytes"] += len(pcm)
+        return pcm
+
+    def feed(self, data, timeout=FEED_TIMEOUT_S):
+        """输入一段容器数据，等待解码线程消费完后返回已解码的 PCM（解码器已出错时抛出该异常）"""
+        with self.cond:
+            if self.error is not None:
+                raise self.error
+            self.stats["input_bytes"] += len(data)
+            self.reader.chunks.append(data)
+            self.reader.starving = False
+            self.cond.notify_all()
+            self.cond.wait_for(lambda: self.finished or (self.reader.starving and not self.reader.chunks), timeout)
+            if self.error is not None and not self.output:
+                raise self.error
+            return self._take()
+
+    def close(self, timeout=FEED_TIMEOUT_S):
+        """输入结束：解码剩余数据并返回尾部 PCM（解码出错且没有输出时抛出该异常）"""
+        with self.cond:
+            self.reader.eof = True
+            self.cond.notify_all()
+            self.cond.wait_for(lambda: self.finished, timeout)
+            if self.error is not None and not self.output:
+                raise self.error
+            return self._take()
+
+
+class OpusStreamEncoder:
+    """
+    会话级 Opus 编码器：任意长度的 16-bit 单声道 PCM 块 → 固定时长的 Opus 包
+    编码器状态在整个会话内保留，不足一包的尾部留到下一块；lowdelay 模式减少算法延迟
+
+    :param sample_rate: 输入采样率（Opus 支持 8/12/16/24/48kHz）
+    :param bitrate: 目标码率（bit/s）
+    """
+
+    def __init__(self, sample_rate=24000, bitrate=24000, frame_ms=OPUS_FRAME_MS):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_len = sample_rate * frame_ms // 1000
+        self.codec = av.CodecContext.create("libopus", "w")
+        self.codec.sample_rate = sample_rate
+        self.codec.layout = "mono"
+        self.codec.format = "s16"
+        self.codec.bit_rate = bitrate
+        self.codec.options = {"application": "lowdelay", "frame_duration": str(frame_ms)}
+        self.codec.open()
+        self.pending = b""
+        self.pts = 0
+        self.stats = {"input_bytes": 0, "output_bytes": 0, "packets": 0}
+
+    def _encode_frames(self, pcm):
+        packets = []
+        for start in range(0, len(pcm), self.frame_len * 2):
+            samples = np.frombuffer(pcm[start:start + self.frame_len * 2], dtype=np.int16)
+            frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+            frame.sample_rate = self.sample_rate
+            frame.pts = self.pts
+            self.pts += self.frame_len
+            packets.extend(bytes(packet) for packet in self.codec.encode(frame))
+        self.stats["packets"] += len(packets)
+        self.stats["output_bytes"] += sum(len(p) for p in packets)
+        return packets
+
+    def encode(self, pcm):
+        """输入一块 PCM，返回编码出的完整 Opus 包列表（可能为空）"""
+        self.stats["input_bytes"] += len(pcm)
+        data = self.pending + pcm
+        usable = len(data) // (self.frame_len * 2) * (self.frame_len * 2)
+        self.pending = data[usable:]
+        return self._encode_frames(data[:usable])
+
+    def flush(self):
+        """一段回复结束：尾部不足一包的 PCM 补静音后编码（编码器状态保留，后续回复继续使用）"""
+        if not self.pending:
+            return []
+        pcm = self.pending + b"\0" * (self.frame_len * 2 - len(self.pending))
+        self.pending = b""
+        return self._encode_frames(pcm)
@@ -0,0 +1,95 @@
+"""
+音视频同步缓冲
+摄像头帧按固定间隔采样、缩小后存入预分配的环形数组（内存占用固定），
+VAD 语音段结束时，按时间戳在 [start_time, end_time] 内挑选信息量最大的 K 帧，
+与该段音频一起组成一个多模态对话轮次交给推理阶段
+"""
+
+import threading
+from dataclasses import dataclass, field
+import cv2
+import numpy as np
+
+
+@dataclass
+class MultimodalTurn:
+    """一个对话轮次：语音段音频 + 同时间段的关键帧"""
+    audio: np.ndarray                            # 16kHz float32 音频
+    start_time: float                            # time.time() 时间轴
+    end_time: float
+    frames: list = field(default_factory=list)   # [(timestamp, BGR 帧)]，按时间排序
+
+
+class AVSegmentBuffer:
+    """
+    :param seconds: 保留的视频时长（应不短于最长语音段）
+    :param sample_interval: 采样间隔（秒），两次采样之间的帧直接丢弃
+    :param frame_size: 存储尺寸 (width, height)
+    :param fallback_max_age: 范围内无帧时，退回使用的最近一帧最多早于 start_time 多少秒
+    """
+
+    def __init__(self, seconds=30, sample_interval=0.5, frame_size=(448, 336), fallback_max_age=1.0):
+        self.capacity = max(1, int(seconds / sample_interval))
+        self.sample_interval = sample_interval
+        self.fallback_max_age = fallback_max_age
+        self.frame_size = frame_size
+        width, height = frame_size
+        self.frames = np.zeros((self.capacity, height, width, 3), dtype=np.uint8)
+        self.timestamps = np.full(self.capacity, -np.inf)
+        self.scores = np.zeros(self.capacity, dtype=np.float32)
+        self.write_pos = 0
+        self.last_sample_time = -np.inf
+        self.prev_thumb = None
+        self.lock = threading.Lock()
+
+    def add_frame(self, frame, timestamp):
+        """写入一帧（按采样间隔节流），返回是否被采样"""
+        if timestamp - self.last_sample_time < self.sample_interval:
+            return False
+        self.last_sample_time = timestamp
+
+        small = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+        # 信息量 = 与上一采样帧的差异（新内容）+ 清晰度（拉普拉斯方差，抑制运动模糊帧）
+        novelty = 0.0 if self.prev_thumb is None else float(np.abs(thumb - self.prev_thumb).mean()) / 255.0
+        sharpness = float(np.log1p(cv2.Laplacian(gray, cv2.CV_32F).var())) / 10.0
+        self.prev_thumb = thumb
+
+        with self.lock:
+            pos = self.write_pos
+            self.frames[pos] = small
+            self.timestamps[pos] = timestamp
+            self.scores[pos] = 4.0 * novelty + sharpness
+            self.write_pos = (pos + 1) % self.capacity
+        return True
+
+    def select(self, start_time, end_time, k):
+        """
+        挑选 [start_time, end_time] 内最具信息量的 k 帧：
+        时间范围按时间戳均分为 k 段，每段取得分最高的一帧，保证时间覆盖（没有帧的段跳过，返回可能少于 k 帧）
+
+        :return: [(timestamp, 帧拷贝)]，按时间排序；范围内无帧时退回到 start_time 前 fallback_max_age 秒内
+                 最近的一帧，仍没有（如摄像头还没出帧）时返回 []
+        """
+        if k <= 0:
+            return []
+        with self.lock:
+            in_range = np.flatnonzero((self.timestamps >= start_time) & (self.timestamps <= end_time))
+            if len(in_range) == 0:
+                # 空槽位的时间戳为 -inf，同样满足 <= end_time，必须排除，否则会返回全黑的空帧
+                before = np.flatnonzero(np.isfinite(self.timestamps) & (self.timestamps <= end_time)
+                                        & (self.timestamps >= start_time - self.fallback_max_age))
+                if len(before) == 0:
+                    return []
+                in_range = before[[int(np.argmax(self.timestamps[before]))]]
+
+            in_range = in_range[np.argsort(self.timestamps[in_range])]
+            # 按时间戳分段（不是按帧数），采样中断造成的空档不会让一段挤占其它段的时间
+            bins = np.digitize(self.timestamps[in_range], np.linspace(start_time, end_time, k + 1)[1:-1])
+            chosen = []
+            for b in np.unique(bins):
+                bin_indices = in_range[bins == b]
+                chosen.append(bin_indices[int(np.argmax(self.scores[bin_indices]))])
+            return [(float(self.timestamps[i]), self.frames[i].copy()) for i in chosen]
@@ -0,0 +1,178 @@
+"""
+会话事件广播基准
+模拟一个会话持续产出 text delta 事件，1~100 个订阅者（每个一个线程，相当于一个 SSE 连接）同时消费，对比：
+- queue:     每个订阅者一个 queue.Queue，消费端各自 json.dumps 并拼 SSE 帧（原来单队列的做法扩展到多订阅者）
+- broadcast: event_broadcast.EventBroadcaster，发布时序列化一次，订阅者共享同一份 SSE 帧
+
+统计全部订阅者收完所有事件的耗时、投递吞吐（事件×订阅者/秒）、每次发布耗时、投递延迟，
+以及慢消费者场景（一个订阅者每个事件 sleep）下的驱逐情况
+
+用法:
+    python bench_broadcast.py [--subscribers 1 10 50 100] [--events 2000] [--json report.json]
+"""
+
+import argparse
+import json
+import queue
+import statistics
+import threading
+import time
+from event_broadcast import EventBroadcaster
+
+
+def make_event(i):
+    return {"type": "delta", "text": f"第 {i} 段回复文本，模拟 response.audio_transcript.delta。", "seq": i}
+
+
+def run_queue(subscribers, events):
+    queues = [queue.Queue() for _ in range(subscribers)]
+    latencies = []
+    lock = threading.Lock()
+
+    def consume(q):
+        local = []
+        for _ in range(events):
+            published_at, event = q.get()
+            frame = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+            local.append(time.perf_counter() - published_at)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=consume, args=(q,)) for q in queues]
+    for t in threads:
+        t.start()
+    publish_cost = 0.0
+    t0 = time.perf_counter()
+    for i in range(events):
+        event = make_event(i)
+        p0 = time.perf_counter()
+        for q in queues:
+            q.put((p0, event))
+        publish_cost += time.perf_counter() - p0
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, publish_cost, latencies, 0
+
+
+def run_broadcast(subscribers, events, max_buffer):
+    broadcaster = EventBroadcaster(max_buffer=max_buffer)
+    subs = [broadcaster.subscribe() for _ in range(subscribers)]
+    latencies = []
+    lock = threading.Lock()
+
+    def consume(subscriber):
+        local = []
+        for _ in range(events):
+            message = subscriber.get()
+            frame = message.sse
+            local.append(time.perf_counter() - message.published_at)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=consume, args=(s,)) for s in subs]
+    for t in threads:
+        t.start()
+    publish_cost = 0.0
+    t0 = time.perf_counter()
+    for i in range(events):
+        p0 = time.perf_counter()
+        broadcaster.publish(make_event(i))
+        publish_cost += time.perf_counter() - p0
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, publish_cost, latencies, broadcaster.stats["evicted"]
+
+
+def run_slow_consumer(subscribers, events, max_buffer, delay_s):
+    """一个订阅者每个事件 sleep delay_s，其余正常消费；返回慢订阅者是否被驱逐、其余是否收全"""
+    broadcaster = EventBroadcaster(max_buffer=max_buffer)
+    subs = [broadcaster.subscribe() for _ in range(subscribers)]
+    received = [0] * subscribers
+    evicted = [False] * subscribers
+
+    def consume(index, subscriber):
+        while True:
+            try:
+                message = subscriber.get(timeout=5)
+            except EOFError:
+                return
+            if message is None:
+                return
+            if message.event["type"] == "evicted":
+                evicted[index] = True
+                continue
+            received[index] += 1
+            if index == 0:
+                time.sleep(delay_s)
+
+    threads = [threading.Thread(target=consume, args=(i, s)) for i, s in enumerate(subs)]
+    for t in threads:
+        t.start()
+    t0 = time.perf_counter()
+    for i in range(events):
+        broadcaster.publish(make_event(i))
+        time.sleep(0.0005)  # 约 2000 事件/秒的产出速率
+    broadcaster.close()
+    for t in threads:
+        t.join()
+    return {
+        "slow_evicted": evicted[0],
+        "slow_received": received[0],
+        "others_complete": all(r == events for r in received[1:]),
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def summarize(mode, subscribers, events, result):
+    elapsed, publish_cost, latencies, evicted = result
+    latencies.sort()
+    return {
+        "mode": mode,
+        "subscribers": subscribers,
+        "events": events,
+        "seconds": round(elapsed, 3),
+        "deliveries_per_s": round(subscribers * events / elapsed),
+        "publish_us": round(publish_cost / events * 1e6, 1),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "latency_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "evicted": evicted,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话事件广播基准")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1, 2, 5, 10, 20, 50, 100])
+    parser.add_argument("--events", type=int, default=2000, help="每组发布的事件数")
+    parser.add_argument("--max-buffer", type=int, default=None,
+                        help="吞吐测试中每个订阅者的缓冲区上限（默认为事件数，测试中不驱逐）")
+    parser.add_argument("--slow-delay-ms", type=float, default=5.0, help="慢消费者每个事件的处理耗时")
+    parser.add_argument("--json", default=None, help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    max_buffer = args.max_buffer or args.events + 1
+    print(f"事件数: {args.events} | 事件大小: {len(json.dumps(make_event(0), ensure_ascii=False).encode())} bytes")
+    print(f"{'模式':<10}{'订阅者':>6}{'耗时 s':>9}{'投递/秒':>11}{'发布 us':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    rows = []
+    for subscribers in args.subscribers:
+        for mode in ("queue", "broadcast"):
+            if mode == "queue":
+                result = run_queue(subscribers, args.events)
+            else:
+                result = run_broadcast(subscribers, args.events, max_buffer)
+            row = summarize(mode, subscribers, args.events, result)
+            rows.append(row)
+            print(f"{mode:<10}{subscribers:>6}{row['seconds']:>9.3f}{row['deliveries_per_s']:>11}"
+                  f"{row['publish_us']:>9.1f}{row['latency_p50_ms']:>9.2f}{row['latency_p99_ms']:>9.2f}")
+
+    slow = run_slow_consumer(10, args.events, 256, args.slow_delay_ms / 1000)
+    print(f"\n慢消费者（10 个订阅者之一每事件 {args.slow_delay_ms}ms，缓冲区 256）: "
+          f"{'已驱逐' if slow['slow_evicted'] else '未驱逐'}（驱逐前收到 {slow['slow_received']} 个），"
+          f"其余订阅者{'全部收全' if slow['others_complete'] else '有丢失'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "slow_consumer": slow}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+视频帧流水线基准测试
+覆盖 video_frame_utils 中的两条路径：
+- server:  process_video_frame（Base64 → 解码 → 缩放 → JPEG → Base64），即 /video、/ws/video、/api/analyze-video 的处理
+- capture: encode_frame（缩放 → JPEG → Base64），即 vad_dash.py 摄像头采集后的编码
+
+测试矩阵：输入格式（JPEG / PNG / webm 片段）× 分辨率（480p ~ 4K）× 画面内容（静态 / 高速运动 / 噪声）
+记录每个阶段的耗时中位数、输出大小以及 tracemalloc 统计的内存分配
+
+回归检测：
+    python bench_frame_pipeline.py --save-baseline bench_baseline.json      # 记录基线
+    python bench_frame_pipeline.py --check-baseline bench_baseline.json     # 任一阶段比基线慢超过阈值时返回 1
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from video_frame_utils import MAX_HEIGHT, encode_frame, process_video_frame
+
+RESOLUTIONS = {
+    "480p": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+FORMATS = ["jpeg", "png", "webm"]
+CONTENTS = ["static", "motion", "noise"]
+CLIP_FRAMES = 10
+CLIP_FPS = 10
+
+
+def make_frame(content, width, height, index=0, rng=None):
+    """生成测试画面：static 为平滑渐变 + 图形文字，motion 为运动模糊的移动物体，noise 为均匀噪声"""
+    if content == "noise":
+        rng = rng or np.random.default_rng(index)
+        return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[..., 0] = x
+    frame[..., 1] = y
+    frame[..., 2] = 128
+    scale = height / 480
+    shift = int(index * width / 8) if content == "motion" else 0
+    for k in range(6):
+        cx = (int(width * (k + 1) / 7) + shift) % width
+        cy = int(height * (0.3 + 0.1 * (k % 3)))
+        cv2.circle(frame, (cx, cy), int(30 * scale), (255 - 40 * k, 40 * k, 200), -1)
+    cv2.putText(frame, f"Bench {index}", (int(20 * scale), int(60 * scale)),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.5 * scale, (255, 255, 255), max(1, int(3 * scale)))
+    if content == "motion":
+        size = max(3, int(25 * scale))
+        kernel = np.full((1, size), 1.0 / size, dtype=np.float32)
+        frame = cv2.filter2D(frame, -1, kernel)
+    return frame
+
+
+def make_input(fmt, content, width, height):
+    """生成一个输入样本，返回原始字节"""
+    if fmt in ("jpeg", "png"):
+        ext = ".jpg" if fmt == "jpeg" else ".png"
+        ok, encoded = cv2.imencode(ext, make_frame(content, width, height))
+        return encoded.tobytes()
+
+    # webm 片段：前端 MediaRecorder 上传的形式
+    fd, path = tempfile.mkstemp(suffix=".webm")
+    os.close(fd)
+    try:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"VP80"), CLIP_FPS, (width, height))
+        if not writer.isOpened():
+            return None
+        rng = np.random.default_rng(0)
+        for i in range(CLIP_FRAMES):
+            writer.write(make_frame(content, width, height, i, rng))
+        writer.release()
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def measure(func, repeat, warmup=2):
+    """运行 func(timings) 多次，返回 (各阶段中位数 ms, 总耗时中位数 ms, 最后一次结果)"""
+    for _ in range(warmup):
+        func({})
+    runs, totals, result = [], [], None
+    for _ in range(repeat):
+        timings = {}
+        t0 = time.perf_counter()
+        result = func(timings)
+        totals.append((time.perf_counter() - t0) * 1000)
+        runs.append(timings)
+    stages = {name: statistics.median(r.get(name, 0.0) for r in runs) for name in runs[0]}
+    return stages, statistics.median(totals), result
+
+
+def measure_allocations(func):
+    """单次运行的 tracemalloc 峰值与净增量（字节）"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    result = func(None)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"peak_bytes": peak - before, "retained_bytes": current - before}
+
+
+def run_case(path, fmt, res, content, repeat, max_height=MAX_HEIGHT):
+    width, height = RESOLUTIONS[res]
+    if path == "capture":
+        frame = make_frame(content, width, height)
+        input_bytes = frame.nbytes
+        func = lambda timings: encode_frame(frame, timings, max_height)
+    else:
+        data = make_input(fmt, content, width, height)
+        if data is None:
+            return None
+        input_bytes = len(data)
+        data_b64 = base64.b64encode(data).decode("ascii")
+        func = lambda timings: process_video_frame(data_b64, timings, max_height)
+
+    stages, total, result = measure(func, repeat)
+    if result is None:
+        return None
+    img_b64 = result[0] if path == "capture" else result
+    return {
+        "path": path, "format": fmt, "resolution": res, "content": content,
+        "stages_ms": stages,
+        "total_ms": total,
+        "input_bytes": input_bytes,
+        "output_b64_bytes": len(img_b64),
+        "output_jpeg_bytes": len(img_b64) * 3 // 4,
+        "allocations": measure_allocations(func),
+    }
+
+
+def case_key(case):
+    return f"{case['path']}/{case['format']}/{case['resolution']}/{case['content']}"
+
+
+def check_regressions(cases, baseline, threshold, min_delta_ms):
+    """返回比基线慢超过阈值的阶段列表"""
+    regressions = []
+    for case in cases:
+        base = baseline.get(case_key(case))
+        if not base:
+            continue
+        for name, ms in list(case["stages_ms"].items()) + [("total", case["total_ms"])]:
+            base_ms = base["total_ms"] if name == "total" else base["stages_ms"].get(name)
+            if base_ms is None:
+                continue
+            if ms > base_ms * (1 + threshold) and ms - base_ms > min_delta_ms:
+                regressions.append((case_key(case), name, base_ms, ms))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视频帧流水线基准测试")
+    parser.add_argument("--paths", nargs="+", choices=["server", "capture"], default=["server", "capture"])
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument("--contents", nargs="+", choices=CONTENTS, default=CONTENTS)
+    parser.add_argument("--max-height", type=int, default=MAX_HEIGHT, help="输出目标高度（会话分辨率）")
+    parser.add_argument("--repeat", type=int, default=10, help="每个用例的计时次数（取中位数）")
+    parser.add_argument("--json", default=None, help="结果 JSON 输出路径")
+    parser.add_argument("--save-baseline", default=None, help="将本次结果保存为基线")
+    parser.add_argument("--check-baseline", default=None, help="与基线对比，超过阈值时退出码为 1")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许比基线慢的比例")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="低于该绝对差值的变慢视为噪声")
+    args = parser.parse_args()
+
+    cases = []
+    header = f"{'用例':<34}{'总计ms':>9}  {'各阶段 ms':<58}{'输入KB':>9}{'输出KB':>8}{'峰值分配KB':>12}"
+    print(header)
+    print("-" * len(header))
+    for path in args.paths:
+        formats = ["raw"] if path == "capture" else args.formats
+        for fmt in formats:
+            for res in args.resolutions:
+                for content in args.contents:
+                    case = run_case(path, fmt, res, content, args.repeat, args.max_height)
+                    if case is None:
+                        print(f"{path}/{fmt}/{res}/{content:<10} 跳过（当前 OpenCV 不支持该格式）")
+                        continue
+                    cases.append(case)
+                    stages = " ".join(f"{k}={v:.2f}" for k, v in case["stages_ms"].items())
+                    print(f"{case_key(case):<34}{case['total_ms']:>9.2f}  {stages:<58}"
+                          f"{case['input_bytes'] / 1024:>9.0f}{case['output_jpeg_bytes'] / 1024:>8.0f}"
+                          f"{case['allocations']['peak_bytes'] / 1024:>12.0f}")
+
+    result = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "max_height": args.max_height,
+        "cases": {case_key(c): c for c in cases},
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {args.save_baseline}")
+
+    if args.check_baseline:
+        with open(args.check_baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+        regressions = check_regressions(cases, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n❌ {len(regressions)} 个阶段比基线慢超过 {args.threshold:.0%}:")
+            for key, name, base_ms, ms in regressions:
+                print(f"   {key} [{name}] {base_ms:.2f}ms → {ms:.2f}ms (+{(ms / base_ms - 1):.0%})")
+            sys.exit(1)
+        print(f"\n✅ 与基线相比没有超过 {args.threshold:.0%} 的变慢")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+流式 VAD 基准测试
+使用录制好的 16kHz 单声道 PCM wav（默认读取 ./output 和声纹注册目录中的录音），
+按麦克风的 1024 样本块送入 StreamingVAD，统计分帧精度、检测到的语音段、
+单帧耗时、实时倍率以及流式处理过程中的内存分配
+
+用法:
+    python bench_streaming_vad.py [wav 文件 ...] [--frame-ms 30] [--repeat 5]
+"""
+
+import argparse
+import glob
+import time
+import tracemalloc
+import wave
+import numpy as np
+from streaming_vad import StreamingVAD
+
+CHUNK = 1024
+DEFAULT_FIXTURES = ["./output/*.wav", "./SpeakerVerification_DIR/enroll_wav/*.wav"]
+
+
+def load_pcm(path):
+    """读取 16-bit 单声道 wav，返回 (int16 数组, 采样率)"""
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+            raise ValueError("需要 16-bit 单声道 PCM")
+        return np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16), wf.getframerate()
+
+
+def run_once(pcm, sample_rate, frame_ms):
+    segments = []
+    vad = StreamingVAD(
+        sample_rate=sample_rate,
+        frame_ms=frame_ms,
+        on_speech_end=lambda seg, start, end: segments.append((start, end, len(seg))),
+    )
+    vad.t0 = 0.0  # 时间轴从文件开头算起
+    chunks = [pcm[i:i + CHUNK].tobytes() for i in range(0, len(pcm), CHUNK)]
+
+    # 预热后再统计分配，只看流式处理过程中的新增内存
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    t0 = time.perf_counter()
+    for chunk in chunks:
+        vad.process(chunk)
+    vad.flush()
+    elapsed = time.perf_counter() - t0
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    growth = sum(stat.size_diff for stat in snapshot_after.compare_to(snapshot_before, 'filename')
+                 if stat.traceback[0].filename.endswith('streaming_vad.py'))
+    frames = vad._written // vad.frame_len
+    return {
+        "elapsed": elapsed,
+        "frames": frames,
+        "expected_frames": len(pcm) // vad.frame_len,
+        "segments": segments,
+        "peak_bytes": peak,
+        "growth_bytes": growth,
+    }
+
+
+def bench_file(path, frame_ms, repeat):
+    pcm, sample_rate = load_pcm(path)
+    duration = len(pcm) / sample_rate
+    runs = [run_once(pcm, sample_rate, frame_ms) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r["elapsed"])
+
+    frame_exact = best["frames"] == best["expected_frames"]
+    print(f"\n📄 {path}")
+    print(f"   时长: {duration:.2f}s, 采样率: {sample_rate}Hz, 帧长: {frame_ms}ms")
+    print(f"   分帧: {best['frames']}/{best['expected_frames']} {'✅' if frame_exact else '❌'}")
+    print(f"   语音段: {len(best['segments'])}")
+    for start, end, length in best["segments"]:
+        print(f"     - {start:.2f}s ~ {end:.2f}s ({length / sample_rate:.2f}s)")
+    print(f"   耗时: {best['elapsed'] * 1000:.1f}ms, "
+          f"单帧: {best['elapsed'] / max(best['frames'], 1) * 1e6:.1f}µs, "
+          f"实时倍率: {duration / max(best['elapsed'], 1e-9):.0f}x")
+    print(f"   内存: 峰值 {best['peak_bytes'] / 1024:.1f}KB, "
+          f"streaming_vad 新增 {best['growth_bytes'] / 1024:.1f}KB（不含语音段输出）")
+    return frame_exact
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StreamingVAD 基准测试")
+    parser.add_argument("files", nargs="*", help="16kHz 单声道 wav 文件")
+    parser.add_argument("--frame-ms", type=int, default=30, choices=(10, 20, 30))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    files = args.files or sorted(f for pattern in DEFAULT_FIXTURES for f in glob.glob(pattern))
+    if not files:
+        print("❌ 没有找到录音文件，请先运行语音助手录制，或在命令行指定 wav 文件")
+        return 1
+
+    print("=" * 60)
+    print("StreamingVAD 基准测试")
+    print("=" * 60)
+    ok = all([bench_file(path, args.frame_ms, args.repeat) for path in files])
+    print("\n" + "=" * 60)
+    print("✅ 全部文件分帧精确" if ok else "❌ 存在分帧误差")
+    print("=" * 60)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
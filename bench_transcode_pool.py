@@ -0,0 +1,109 @@
+"""
+视频帧转码进程池吞吐基准
+模拟多个会话并发提交帧（每个会话一个线程，帧内容与 /ws/video 上传的 Base64 JPEG 相同），
+对比「请求线程内处理」(workers=0) 与不同工作进程数下的吞吐（帧/秒）和单帧延迟
+
+用法:
+    python bench_transcode_pool.py [--sessions 8] [--resolution 1080p] [--workers 0 1 2 4] [--seconds 5]
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import threading
+import time
+import cv2
+from bench_frame_pipeline import RESOLUTIONS, make_frame
+from frame_transcode_pool import TranscodePool
+
+
+def make_frame_b64(resolution, content):
+    width, height = RESOLUTIONS[resolution]
+    ok, encoded = cv2.imencode(".jpg", make_frame(content, width, height), [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+    return base64.b64encode(encoded.tobytes()).decode("ascii")
+
+
+def run(workers, sessions, frame_b64, seconds, max_inflight):
+    """每个会话线程循环提交帧（在途上限内流水提交），返回吞吐与延迟统计"""
+    pool = TranscodePool(workers=workers, max_inflight=max_inflight)
+    try:
+        for _ in range(max(1, workers) * 2):  # 预热：启动工作进程、加载 OpenCV
+            pool.transcode(frame_b64)
+
+        latencies = []
+        failures = [0]
+        lock = threading.Lock()
+        stop_at = time.perf_counter() + seconds
+
+        def session_loop(session_id):
+            pending = []
+            while time.perf_counter() < stop_at or pending:
+                if time.perf_counter() < stop_at:
+                    t0 = time.perf_counter()
+                    future = pool.submit(frame_b64, session_id)
+                    if future is not None:
+                        pending.append((t0, future))
+                        continue
+                t0, future = pending.pop(0)
+                ok = future.result() is not None
+                with lock:
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    failures[0] += 0 if ok else 1
+
+        threads = [threading.Thread(target=session_loop, args=(f"s{i}",)) for i in range(sessions)]
+        t_start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t_start
+        latencies.sort()
+        return {
+            "workers": workers,
+            "frames": len(latencies),
+            "failures": failures[0],
+            "fps": len(latencies) / elapsed,
+            "latency_p50_ms": statistics.median(latencies) if latencies else 0.0,
+            "latency_p95_ms": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
+    finally:
+        pool.close()
+
+
+def main():
+    cpu = os.cpu_count() or 1
+    default_workers = sorted({0, 1, 2, 4, cpu} & set(range(cpu + 1)) | {0, 1})
+    parser = argparse.ArgumentParser(description="视频帧转码进程池吞吐基准")
+    parser.add_argument("--sessions", type=int, default=8, help="并发会话数（提交线程数）")
+    parser.add_argument("--resolution", choices=list(RESOLUTIONS), default="1080p")
+    parser.add_argument("--content", choices=["static", "motion", "noise"], default="motion")
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers, help="要测试的工作进程数，0 为线程内处理")
+    parser.add_argument("--max-inflight", type=int, default=2, help="每个会话在途帧上限")
+    parser.add_argument("--seconds", type=float, default=5.0, help="每组测试时长")
+    parser.add_argument("--json", default=None, help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    frame_b64 = make_frame_b64(args.resolution, args.content)
+    print(f"CPU 核数: {cpu} | 会话数: {args.sessions} | 输入: {args.resolution}/{args.content} "
+          f"{len(frame_b64) / 1024:.0f}KB Base64 | 每会话在途上限: {args.max_inflight}")
+    print(f"{'工作进程':>8}{'帧数':>8}{'帧/秒':>10}{'加速比':>8}{'p50 ms':>10}{'p95 ms':>10}{'失败':>6}")
+
+    results = []
+    for workers in args.workers:
+        r = run(workers, args.sessions, frame_b64, args.seconds, args.max_inflight)
+        results.append(r)
+        speedup = r["fps"] / results[0]["fps"] if results[0]["fps"] else 0.0
+        label = f"{workers}" if workers else "0(线程)"
+        print(f"{label:>8}{r['frames']:>8}{r['fps']:>10.1f}{speedup:>7.2f}x"
+              f"{r['latency_p50_ms']:>10.1f}{r['latency_p95_ms']:>10.1f}{r['failures']:>6}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"cpu_count": cpu, "sessions": args.sessions, "resolution": args.resolution,
+                       "content": args.content, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+会话事件广播（qwen_video_server.py 的 /api/session/<id>/response 与 /ws/session/<id>/events）
+原来每个会话只有一个 queue.Queue，多个消费者（如查看端和日志看板）会互相抢走事件，每个事件还在各自的生成器里重复 json.dumps。这里：
+- publish() 时把事件序列化一次，得到 JSON 文本和 SSE 帧，所有订阅者共享同一份
+- 每个订阅者有自己的有界缓冲区，publish 只做追加，不会被慢消费者阻塞
+- 缓冲区满（消费者落后超过 max_buffer 个事件）的订阅者被驱逐：清空缓冲区并收到 evicted 事件后结束，
+  客户端可重新订阅
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+DEFAULT_MAX_BUFFER = 256  # 每个订阅者最多积压的事件数
+
+
+class Message:
+    """序列化一次的事件：event 为原始 dict，text 为 JSON 文本（WebSocket），sse 为 SSE 帧（bytes）"""
+
+    __slots__ = ("event", "text", "sse", "published_at")
+
+    def __init__(self, event):
+        self.event = event
+        self.text = json.dumps(event, ensure_ascii=False)
+        self.sse = f"data: {self.text}\n\n".encode("utf-8")
+        self.published_at = time.perf_counter()
+
+
+PING = Message({"type": "ping"})
+EVICTED = Message({"type": "evicted", "message": "消费过慢，订阅已断开，请重新订阅"})
+
+
+class Subscriber:
+    """单个订阅者：有界缓冲区 + 等待新事件的条件变量"""
+
+    def __init__(self, broadcaster, name, max_buffer):
+        self.broadcaster = broadcaster
+        self.name = name
+        self.max_buffer = max_buffer
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.evicted = False
+        self.delivered = 0
+
+    def _push(self, message):
+        """由 publish 调用：追加事件，缓冲区已满时驱逐，返回是否仍在订阅"""
+        with self.cond:
+            if self.closed:
+                return False
+            if len(self.buffer) >= self.max_buffer:
+                self.buffer.clear()
+                self.buffer.append(EVICTED)
+                self.evicted = True
+                self.closed = True
+            else:
+                self.buffer.append(message)
+            self.cond.notify()
+            return not self.closed
+
+    def get(self, timeout=None):
+        """取下一个事件，超时返回 None；订阅已结束且缓冲区为空时抛出 EOFError"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.buffer or self.closed, timeout):
+                return None
+            if not self.buffer:
+                raise EOFError(self.name)
+            self.delivered += 1
+            return self.buffer.popleft()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.broadcaster.unsubscribe(self)
+
+
+class EventBroadcaster:
+    """
+    单会话的发布 / 订阅广播器
+
+    :param max_buffer: 每个订阅者的缓冲区上限，超出即驱逐该订阅者
+    """
+
+    def __init__(self, max_buffer=DEFAULT_MAX_BUFFER):
+        self.max_buffer = max_buffer
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.closed = False
+        self.stats = {"published": 0, "evicted": 0, "subscribed": 0}
+
+    def subscribe(self, name=None):
+        """新增订阅者（只收到订阅之后发布的事件）；广播器已关闭时返回已结束的订阅者"""
+        with self.lock:
+            self.stats["subscribed"] += 1
+            subscriber = Subscriber(self, name or f"sub{self.stats['subscribed']}", self.max_buffer)
+            if self.closed:
+                subscriber.closed = True
+            else:
+                self.subscribers.append(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, event):
+        """序列化一次并分发给所有订阅者，返回 Message"""
+        message = Message(event)
+        with self.lock:
+            subscribers = list(self.subscribers)
+            self.stats["published"] += 1
+        evicted = [s for s in subscribers if not s._push(message)]
+        if evicted:
+            with self.lock:
+                for subscriber in evicted:
+                    if subscriber in self.subscribers:
+                        self.subscribers.remove(subscriber)
+                        if subscriber.evicted:
+                            self.stats["evicted"] += 1
+        return message
+
+    def close(self):
+        """结束所有订阅（订阅者取完缓冲区剩余事件后结束）"""
+        with self.lock:
+            self.closed = True
+            subscribers, self.subscribers = self.subscribers, []
+        for subscriber in subscribers:
+            with subscriber.cond:
+                subscriber.closed = True
+                subscriber.cond.notify()
+
+    def status(self):
+        with self.lock:
+            return {"subscribers": len(self.subscribers), **self.stats}
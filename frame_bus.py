@@ -0,0 +1,174 @@
+"""
+共享内存帧总线
+摄像头采集进程把帧写入 multiprocessing.shared_memory 中固定数量的预分配帧槽（环形），
+每帧带序号和时间戳；显示、上传、录制、本地模型等消费者可在其他进程中按名称挂载，
+零拷贝读取最新帧，内存占用固定，不会因消费者跟不上而无限增长
+
+布局: [控制区][槽位元数据 × slots][帧数据 × slots]
+"""
+
+import threading
+import time
+import weakref
+import numpy as np
+from multiprocessing import shared_memory
+
+_CTRL = np.dtype([('head', '<i8'), ('slots', '<i8'),
+                  ('height', '<i8'), ('width', '<i8'), ('channels', '<i8')])
+_SLOT = np.dtype([('seq', '<i8'), ('timestamp', '<f8')])
+_ALIGN = 64
+_WRITING = -1  # 槽位正在写入
+
+
+def _align(n):
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _attach_shm(name):
+    """挂载已有共享内存，不让本进程的 resource_tracker 在退出时删除它"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 没有 track 参数，手动取消登记
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class FrameBus:
+    """固定槽位数的共享内存帧环（单写多读，uint8 帧）"""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.closed = False
+        self._lock = threading.Lock()  # 本进程内 publish / read 与 close 互斥
+        self._views = []  # read() 交出的零拷贝视图的弱引用，关闭时仍存活则不能解除映射
+        self.ctrl = np.ndarray((), dtype=_CTRL, buffer=shm.buf)
+        self.slots = int(self.ctrl['slots'])
+        self.shape = (int(self.ctrl['height']), int(self.ctrl['width']), int(self.ctrl['channels']))
+        meta_offset = _align(_CTRL.itemsize)
+        self.meta = np.ndarray((self.slots,), dtype=_SLOT, buffer=shm.buf, offset=meta_offset)
+        frames_offset = _align(meta_offset + _SLOT.itemsize * self.slots)
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8,
+                                 buffer=shm.buf, offset=frames_offset)
+
+    @classmethod
+    def create(cls, name, shape, slots=8):
+        """
+        创建帧总线（写入方调用）
+
+        :param shape: 帧形状 (height, width, channels)
+        :param slots: 帧槽数量，决定读取方最多可落后的帧数
+        """
+        height, width, channels = shape
+        meta_offset = _align(_CTRL.itemsize)
+        frames_offset = _align(meta_offset + _SLOT.itemsize * slots)
+        size = frames_offset + slots * height * width * channels
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 上次异常退出残留的同名共享内存
+            stale = _attach_shm(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        ctrl = np.ndarray((), dtype=_CTRL, buffer=shm.buf)
+        ctrl['head'] = 0
+        ctrl['slots'] = slots
+        ctrl['height'], ctrl['width'], ctrl['channels'] = height, width, channels
+        meta = np.ndarray((slots,), dtype=_SLOT, buffer=shm.buf, offset=meta_offset)
+        meta['seq'] = 0
+        meta['timestamp'] = 0.0
+        del ctrl, meta
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """按名称挂载已有帧总线（读取方调用，可在其他进程）"""
+        return cls(_attach_shm(name), owner=False)
+
+    @property
+    def head(self):
+        """最新一帧的序号，0 表示还没有帧（已关闭时也返回 0）"""
+        ctrl = self.ctrl
+        return 0 if ctrl is None else int(ctrl['head'])
+
+    def publish(self, frame, timestamp=None):
+        """写入一帧，返回其序号；帧形状必须与总线一致，总线已关闭时返回 None"""
+        if frame.shape != self.shape:
+            raise ValueError(f"帧形状 {frame.shape} 与总线 {self.shape} 不一致")
+        with self._lock:
+            if self.closed:
+                return None
+            seq = self.head + 1
+            slot = seq % self.slots
+            self.meta[slot]['seq'] = _WRITING
+            self.frames[slot][...] = frame
+            self.meta[slot]['timestamp'] = time.time() if timestamp is None else timestamp
+            self.meta[slot]['seq'] = seq
+            self.ctrl['head'] = seq
+            return seq
+
+    def read(self, seq):
+        """
+        零拷贝读取指定序号的帧
+
+        :return: (seq, timestamp, 只读帧视图)；该帧已被覆盖、尚未写入或总线已关闭时返回 None
+        视图在 close() 之前必须释放（关闭后访问已解除映射的内存会导致进程崩溃）
+        """
+        if seq <= 0:
+            return None
+        with self._lock:
+            if self.closed:
+                return None
+            slot = seq % self.slots
+            timestamp = float(self.meta[slot]['timestamp'])
+            if int(self.meta[slot]['seq']) != seq:
+                return None
+            view = self.frames[slot].view()
+            view.flags.writeable = False
+            if len(self._views) >= self.slots * 4:
+                self._views = [ref for ref in self._views if ref() is not None]
+            self._views.append(weakref.ref(view))
+            return seq, timestamp, view
+
+    def latest(self):
+        """零拷贝读取最新帧，没有帧时返回 None"""
+        return self.read(self.head)
+
+    def is_valid(self, seq):
+        """读取方用完视图后调用：确认该帧在读取期间没有被覆盖"""
+        with self._lock:
+            return not self.closed and int(self.meta[seq % self.slots]['seq']) == seq
+
+    def wait_next(self, last_seq, timeout=None, poll_interval=0.002):
+        """等待比 last_seq 更新的帧（跨进程无法共享条件变量，短间隔检查序号）"""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.head == last_seq:
+            if self.closed:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            time.sleep(poll_interval)
+        return self.latest()
+
+    def close(self):
+        """
+        关闭总线：之后 publish / read 直接返回 None
+        调用前应停止写入 / 读取线程并释放 read() 返回的视图；仍有视图存活时只注销名称、保留映射，避免访问时崩溃
+        """
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            # 释放对共享内存的 numpy 视图后才能关闭
+            self.ctrl = self.meta = self.frames = None
+        alive = sum(1 for ref in self._views if ref() is not None)
+        if alive:
+            print(f"[FrameBus] 关闭时仍有 {alive} 个帧视图未释放，保留映射直到进程退出")
+        else:
+            self.shm.close()
+        if self.owner:
+            self.shm.unlink()
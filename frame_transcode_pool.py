@@ -0,0 +1,285 @@
+"""
+视频帧转码进程池
+process_video_frame 的 Base64 解码 → imdecode → 缩放 → imencode → Base64 编码原本在 Flask 请求线程中执行，
+多个会话并发时 Python 部分在 GIL 上串行。这里把整条流水线交给工作进程：
+- 输入 / 输出通过预分配的共享内存槽位传递（每个槽位 = 输入区 + 输出区），帧数据不经过 pickle
+- 槽位数固定，全部占用时提交方最多等待 TRANSCODE_SLOT_TIMEOUT_S，超时抛出 TranscodeBusy（全局背压，内存占用固定）；
+  等待结果最多 TRANSCODE_RESULT_TIMEOUT_S，同样抛出 TranscodeBusy，调用方返回 503 而不是一直占着请求线程
+- 每个会话限制同时在途的帧数，超出时 submit 返回 None，由调用方丢帧或返回 429
+- TRANSCODE_WORKERS=0 时在调用线程中直接处理（与原来行为一致）
+
+环境变量:
+    TRANSCODE_WORKERS       工作进程数（默认 CPU 核数 - 1，保留一个核给 Flask / WebSocket 线程）
+    TRANSCODE_SLOT_MB       每个槽位输入区 / 输出区大小（MB），超出的帧改走 pickle 传递
+    TRANSCODE_MAX_INFLIGHT  每个会话最多同时在途的帧数
+    TRANSCODE_SLOT_TIMEOUT_S    等待空闲槽位的最长时间（秒）
+    TRANSCODE_RESULT_TIMEOUT_S  等待单帧转码结果的最长时间（秒）
+"""
+
+import atexit
+import base64
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import cv2
+from video_frame_utils import MAX_HEIGHT, process_video_file, process_video_frame
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_WORKERS = int(os.getenv('TRANSCODE_WORKERS', max(0, (os.cpu_count() or 1) - 1)))
+TRANSCODE_SLOT_MB = float(os.getenv('TRANSCODE_SLOT_MB', 8))
+TRANSCODE_MAX_INFLIGHT = int(os.getenv('TRANSCODE_MAX_INFLIGHT', 2))
+TRANSCODE_SLOT_TIMEOUT_S = float(os.getenv('TRANSCODE_SLOT_TIMEOUT_S', 2.0))
+TRANSCODE_RESULT_TIMEOUT_S = float(os.getenv('TRANSCODE_RESULT_TIMEOUT_S', 30.0))
+
+
+class TranscodeBusy(Exception):
+    """转码池繁忙：等待空闲槽位或转码结果超时"""
+
+
+# ---------------- 工作进程 ----------------
+
+_worker_shm = None
+_worker_slot_bytes = 0
+
+
+def _worker_init(shm_name, slot_bytes):
+    global _worker_shm, _worker_slot_bytes
+    # 工作进程与主进程共用同一个 resource_tracker，挂载时的重复登记无影响，由主进程负责 unlink
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_slot_bytes = slot_bytes
+    # 并行度由进程数提供，每个进程内 OpenCV 单线程，避免线程数 = 进程数 × 核数
+    cv2.setNumThreads(1)
+
+
+def _transcode_slot(slot, in_len, is_b64, max_height, payload=None, path=None):
+    """
+    在工作进程中处理一个槽位（path 不为空时输入为已落盘的上传文件，工作进程直接读取）
+
+    :return: (输出长度, 放不下输出区时的输出字节)，处理失败时输出长度为 -1
+    """
+    in_offset = slot * 2 * _worker_slot_bytes
+    out_offset = in_offset + _worker_slot_bytes
+    if path is not None:
+        result = process_video_file(path, max_height=max_height)
+    else:
+        data = payload if payload is not None else _worker_shm.buf[in_offset:in_offset + in_len]
+        try:
+            img_bytes = base64.b64decode(data) if is_b64 else data
+            result = process_video_frame(img_bytes, max_height=max_height)
+        finally:
+            del data
+    if result is None:
+        return -1, None
+    out = result.encode('ascii')
+    if len(out) > _worker_slot_bytes:
+        return len(out), out
+    _worker_shm.buf[out_offset:out_offset + len(out)] = out
+    return len(out), None
+
+
+# ---------------- 主进程 ----------------
+
+class TranscodePool:
+    """
+    帧转码池
+
+    :param workers: 工作进程数，0 表示在调用线程中处理
+    :param slot_bytes: 每个槽位输入区 / 输出区的字节数
+    :param slots: 共享内存槽位数（默认 workers × 2，保证工作进程处理时下一帧已在排队）
+    :param max_inflight: 每个会话最多同时在途的帧数
+    :param slot_timeout: 等待空闲槽位的默认最长时间（秒）
+    :param result_timeout: result() / transcode() 等待转码结果的最长时间（秒）
+    """
+
+    def __init__(self, workers=TRANSCODE_WORKERS, slot_bytes=int(TRANSCODE_SLOT_MB * 1024 * 1024),
+                 slots=None, max_inflight=TRANSCODE_MAX_INFLIGHT, slot_timeout=TRANSCODE_SLOT_TIMEOUT_S,
+                 result_timeout=TRANSCODE_RESULT_TIMEOUT_S):
+        self.workers = workers
+        self.slot_bytes = slot_bytes
+        self.max_inflight = max_inflight
+        self.slot_timeout = slot_timeout
+        self.result_timeout = result_timeout
+        self.lock = threading.Lock()
+        self.inflight = {}  # session_id -> 在途帧数
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0, "oversized": 0, "busy": 0,
+                      "restarts": 0}
+        self.shm = None
+        self.executor = None
+        if workers > 0:
+            self.slots = slots or workers * 2
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slots * 2 * slot_bytes)
+            self.free_slots = queue.Queue()
+            for i in range(self.slots):
+                self.free_slots.put(i)
+            self._start_executor()
+
+    def _start_executor(self):
+        # spawn：Flask 进程里已有多个线程，fork 可能继承被占用的锁；Windows 上也只能用 spawn
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_worker_init, initargs=(self.shm.name, self.slot_bytes))
+
+    def submit(self, frame_data, session_id=None, max_height=MAX_HEIGHT, path=None, slot_timeout=None):
+        """
+        提交一帧（Base64 字符串或原始字节），max_height 为会话目标分辨率的高度；
+        上传已落盘时传 path（frame_data 为 None），工作进程直接读取文件，调用方需保证文件在结果返回前存在
+
+        :param slot_timeout: 等待空闲槽位的最长时间（秒），默认 self.slot_timeout，0 表示不等待
+        :return: Future，结果为 process_video_frame 的输出（失败为 None）；
+                 该会话在途帧数已达上限时返回 None
+        :raises TranscodeBusy: 槽位全部占用且超时
+        """
+        if session_id is not None:
+            with self.lock:
+                count = self.inflight.get(session_id, 0)
+                if count >= self.max_inflight:
+                    self.stats["dropped"] += 1
+                    return None
+                self.inflight[session_id] = count + 1
+        with self.lock:
+            self.stats["submitted"] += 1
+
+        future = Future()
+        if session_id is not None:
+            future.add_done_callback(lambda f: self._release(session_id))
+        if self.executor is None:
+            if path is not None:
+                self._finish(future, process_video_file(path, max_height=max_height))
+            else:
+                self._finish(future, process_video_frame(frame_data, max_height=max_height))
+        else:
+            try:
+                self._submit_to_worker(frame_data, future, max_height, path,
+                                       self.slot_timeout if slot_timeout is None else slot_timeout)
+            except Exception as e:
+                # future 不会完成，完成回调也不会释放在途计数
+                if session_id is not None:
+                    self._release(session_id)
+                if isinstance(e, TranscodeBusy):
+                    with self.lock:
+                        self.stats["busy"] += 1
+                raise
+        return future
+
+    def result(self, future, timeout=None):
+        """等待 submit 返回的 Future，超过 timeout（默认 self.result_timeout）抛出 TranscodeBusy"""
+        try:
+            return future.result(self.result_timeout if timeout is None else timeout)
+        except FutureTimeout:
+            with self.lock:
+                self.stats["busy"] += 1
+            raise TranscodeBusy(f"视频帧转码超过 {self.result_timeout if timeout is None else timeout}s 未完成")
+
+    def transcode(self, frame_data, max_height=MAX_HEIGHT, path=None):
+        """同步转码一帧（不受会话在途上限限制），槽位或结果等待超时抛出 TranscodeBusy"""
+        return self.result(self.submit(frame_data, max_height=max_height, path=path))
+
+    def _submit_to_worker(self, frame_data, future, max_height, path=None, slot_timeout=TRANSCODE_SLOT_TIMEOUT_S):
+        is_b64 = isinstance(frame_data, str)
+        data = frame_data.encode('ascii') if is_b64 else (frame_data or b'')
+        try:
+            slot = self.free_slots.get(timeout=slot_timeout)  # 槽位用尽时最多等待 slot_timeout
+        except queue.Empty:
+            raise TranscodeBusy(f"转码槽位全部占用超过 {slot_timeout}s") from None
+        payload = None
+        if path is None and len(data) <= self.slot_bytes:
+            offset = slot * 2 * self.slot_bytes
+            self.shm.buf[offset:offset + len(data)] = data
+        elif path is None:
+            payload = bytes(data)
+            with self.lock:
+                self.stats["oversized"] += 1
+        try:
+            executor = self.executor
+            try:
+                inner = executor.submit(_transcode_slot, slot, len(data), is_b64, max_height, payload, path)
+            except BrokenProcessPool:
+                # 工作进程崩溃（如解码器段错误）后进程池不可用，重建后重试一次
+                executor = self._restart_executor(executor)
+                inner = executor.submit(_transcode_slot, slot, len(data), is_b64, max_height, payload, path)
+        except Exception:
+            self.free_slots.put(slot)
+            raise
+        inner.add_done_callback(lambda f: self._collect(f, slot, future))
+
+    def _restart_executor(self, broken):
+        """替换已损坏的进程池并返回当前进程池；多个线程同时发现损坏时只有第一个重建"""
+        with self.lock:
+            if self.executor is broken:
+                logger.error("转码进程池已损坏，正在重建")
+                broken.shutdown(wait=False)
+                self._start_executor()
+                self.stats["restarts"] += 1
+            return self.executor
+
+    def _collect(self, inner, slot, future):
+        """工作进程完成后取回输出区数据（在进程池的管理线程中执行）"""
+        result = None
+        try:
+            out_len, out_bytes = inner.result()
+            if out_bytes is not None:
+                result = out_bytes.decode('ascii')
+            elif out_len >= 0:
+                offset = slot * 2 * self.slot_bytes + self.slot_bytes
+                result = bytes(self.shm.buf[offset:offset + out_len]).decode('ascii')
+        except Exception as e:
+            logger.error(f"视频帧转码失败: {e}")
+        finally:
+            self.free_slots.put(slot)
+        self._finish(future, result)
+
+    def _finish(self, future, result):
+        with self.lock:
+            self.stats["completed" if result else "failed"] += 1
+        future.set_result(result)
+
+    def _release(self, session_id):
+        with self.lock:
+            count = self.inflight.get(session_id, 0) - 1
+            if count > 0:
+                self.inflight[session_id] = count
+            else:
+                self.inflight.pop(session_id, None)
+
+    def status(self):
+        """供 /health 使用的状态快照"""
+        with self.lock:
+            return {
+                "workers": self.workers,
+                "slots": self.slots if self.shm else 0,
+                "busy_slots": self.slots - self.free_slots.qsize() if self.shm else 0,
+                "sessions_inflight": sum(self.inflight.values()),
+                "max_inflight_per_session": self.max_inflight,
+                **self.stats,
+            }
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if self.shm:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_transcode_pool():
+    """按环境变量配置懒加载全局转码池（首次使用时才启动工作进程）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TranscodePool()
+            atexit.register(_pool.close)
+            if _pool.workers:
+                logger.info(f"视频帧转码进程池: {_pool.workers} 个工作进程, {_pool.slots} 个共享内存槽位, "
+                            f"每会话最多 {_pool.max_inflight} 帧在途")
+        return _pool
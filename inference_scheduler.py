@@ -0,0 +1,110 @@
+"""
+推理调度器
+所有语音段由单个工作线程按顺序处理，待处理队列有界（默认只保留最新一条），
+新的请求或插话（barge-in）会协作式取消正在进行的推理，让 CPU 始终服务最新的请求
+"""
+
+import queue
+import threading
+
+
+class CancelToken:
+    """协作式取消标记：推理各阶段主动检查，或阻塞等待取消"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """等待取消，返回是否已取消"""
+        return self._event.wait(timeout)
+
+
+class InferenceScheduler:
+    """
+    单工作线程推理调度器
+
+    :param handler: handler(item, cancel_token)，在工作线程中执行
+    :param max_pending: 待处理队列长度，队列满时丢弃最旧的请求
+    :param on_cancel: 取消正在进行的推理时调用（如停止播放）
+    """
+
+    def __init__(self, handler, max_pending=1, on_cancel=None):
+        self.handler = handler
+        self.on_cancel = on_cancel
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.current_token = None
+        self.running = False
+        self.worker = threading.Thread(target=self._worker_loop, name="inference", daemon=True)
+
+    def start(self):
+        self.running = True
+        self.worker.start()
+
+    def submit(self, item):
+        """提交新请求：取消正在进行的推理，队列满时丢弃最旧的待处理请求"""
+        self.cancel_current()
+        entry = (item, CancelToken())
+        while True:
+            try:
+                self.pending.put_nowait(entry)
+                return
+            except queue.Full:
+                self._drop_oldest()
+
+    def barge_in(self):
+        """用户插话：丢弃所有待处理请求并取消正在进行的推理"""
+        while self._drop_oldest():
+            pass
+        self.cancel_current()
+
+    def cancel_current(self):
+        with self.lock:
+            token = self.current_token
+        if token and not token.cancelled:
+            token.cancel()
+            print("检测到新的语音，已取消当前推理")
+            if self.on_cancel:
+                self.on_cancel()
+
+    def shutdown(self):
+        self.running = False
+        self.barge_in()
+        try:
+            self.pending.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _drop_oldest(self):
+        try:
+            entry = self.pending.get_nowait()
+        except queue.Empty:
+            return False
+        if entry is not None:
+            entry[1].cancel()
+        return True
+
+    def _worker_loop(self):
+        while self.running:
+            entry = self.pending.get()
+            if entry is None:
+                break
+            item, token = entry
+            if token.cancelled:
+                continue
+            with self.lock:
+                self.current_token = token
+            try:
+                self.handler(item, token)
+            except Exception as e:
+                print(f"推理失败: {e}")
+            finally:
+                with self.lock:
+                    self.current_token = None
@@ -0,0 +1,467 @@
+"""
+Qwen Video API 压测脚本
+按配置的并发数和帧率驱动视频服务的各个端点，输出机器可读的 JSON 结果（便于对比多次运行）：
+- session: /api/session/create → 按帧率发送 /video、按实时速率发送 /audio，同时消费 /response SSE → /close
+- analyze: 循环调用 /api/analyze-video
+- ws: 连接实时版服务的 /ws/video，按帧率发送视频帧和音频（语音段 + 静音），统计首个文本/音频回复延迟
+
+统计项：每个操作的吞吐、p50/p95/p99 延迟、错误率，以及服务进程的 CPU/RSS（psutil 采样）
+
+配合 mock_omni_server.py 使用可不消耗 DashScope 额度：
+    python mock_omni_server.py
+    QWEN_OMNI_REALTIME_URL=ws://127.0.0.1:8765/api-ws/v1/realtime python qwen_video_server.py
+
+用法:
+    python load_test_video_api.py --scenario session analyze --concurrency 8 --duration 30 --fps 2 -o run.json
+"""
+
+import argparse
+import base64
+import json
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+import cv2
+import numpy as np
+import psutil
+import requests
+import websocket
+
+AUDIO_SAMPLE_RATE = 16000
+
+
+def log(msg):
+    print(msg, file=sys.stderr, flush=True)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+class Recorder:
+    """线程安全的延迟/错误记录"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = defaultdict(list)
+
+    def ok(self, op, latency_s):
+        with self.lock:
+            self.latencies[op].append(latency_s * 1000)
+
+    def fail(self, op, reason):
+        with self.lock:
+            self.errors[op] += 1
+            if len(self.error_samples[op]) < 5:
+                self.error_samples[op].append(str(reason)[:200])
+
+    def timed(self, op, func, *args, **kwargs):
+        """执行请求并记录耗时；HTTP 非 2xx 或异常记为错误，返回响应或 None"""
+        t0 = time.perf_counter()
+        try:
+            resp = func(*args, **kwargs)
+        except Exception as e:
+            self.fail(op, e)
+            return None
+        if resp.status_code >= 400:
+            self.fail(op, f"HTTP {resp.status_code}: {resp.text[:100]}")
+            return None
+        self.ok(op, time.perf_counter() - t0)
+        return resp
+
+    def summary(self, elapsed):
+        result = {}
+        with self.lock:
+            for op in sorted(set(self.latencies) | set(self.errors)):
+                lat = self.latencies[op]
+                total = len(lat) + self.errors[op]
+                result[op] = {
+                    "count": total,
+                    "ok": len(lat),
+                    "errors": self.errors[op],
+                    "error_rate": self.errors[op] / total if total else 0.0,
+                    "throughput_per_s": len(lat) / elapsed if elapsed > 0 else 0.0,
+                    "latency_ms": {
+                        "mean": float(np.mean(lat)) if lat else None,
+                        "p50": percentile(lat, 50),
+                        "p95": percentile(lat, 95),
+                        "p99": percentile(lat, 99),
+                        "max": float(np.max(lat)) if lat else None,
+                    },
+                    "error_samples": self.error_samples[op],
+                }
+        return result
+
+
+class ProcessSampler:
+    """后台线程按固定间隔采样服务进程（含子进程）的 CPU 和 RSS"""
+
+    def __init__(self, pid, interval=0.5):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        # pid -> Process：跨采样复用同一对象，cpu_percent(None) 才能算出与上次采样之间的占用
+        self.tracked = {}
+        self.cpu = []
+        self.rss = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _processes(self):
+        """当前的服务进程及其子进程：新出现的进程先做一次 cpu_percent 基准，已退出的移除"""
+        try:
+            current = [self.process] + self.process.children(recursive=True)
+        except psutil.Error:
+            current = [self.process]
+        alive = {}
+        for p in current:
+            known = self.tracked.get(p.pid)
+            if known is None:
+                try:
+                    p.cpu_percent(None)  # 首次调用总是返回 0，只作为下次采样的基准
+                except psutil.Error:
+                    continue
+                known = p
+            alive[p.pid] = known
+        self.tracked = alive
+        return list(alive.values())
+
+    def _run(self):
+        self._processes()
+        while not self.stop_event.wait(self.interval):
+            cpu, rss = 0.0, 0
+            for p in self._processes():
+                try:
+                    cpu += p.cpu_percent(None)
+                    rss += p.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.cpu.append(cpu)
+            self.rss.append(rss)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        mb = [r / 1024 / 1024 for r in self.rss]
+        return {
+            "pid": self.process.pid,
+            "samples": len(self.cpu),
+            "cpu_percent": {"mean": float(np.mean(self.cpu)) if self.cpu else None,
+                            "p95": percentile(self.cpu, 95),
+                            "max": float(np.max(self.cpu)) if self.cpu else None},
+            "rss_mb": {"start": mb[0] if mb else None,
+                       "end": mb[-1] if mb else None,
+                       "max": float(np.max(mb)) if mb else None},
+        }
+
+
+def find_server_pid(url):
+    """查找监听 url 端口的进程（需要相应权限，找不到返回 None）"""
+    port = urlparse(url).port
+    try:
+        for conn in psutil.net_connections(kind='tcp'):
+            if conn.status == psutil.CONN_LISTEN and conn.laddr and conn.laddr.port == port and conn.pid:
+                return conn.pid
+    except psutil.Error:
+        pass
+    return None
+
+
+def make_frames(width, height, count=10, quality=80):
+    """生成一组运动画面的 JPEG（Base64），模拟摄像头连续帧"""
+    frames = []
+    for i in range(count):
+        img = np.zeros((height, width, 3), dtype=np.uint8)
+        img[:] = (40 + i * 10, 80, 120)
+        x = int((i / count) * (width - 100))
+        cv2.rectangle(img, (x, height // 3), (x + 100, height // 3 + 100), (255, 255, 255), -1)
+        cv2.putText(img, f'Load Test {i}', (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 255, 255), 3)
+        ok, encoded = cv2.imencode('.jpg', img, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        frames.append(base64.b64encode(encoded.tobytes()).decode('ascii'))
+    return frames
+
+
+def make_audio_chunk(chunk_ms, speech):
+    """生成一块 16kHz PCM：speech 为 True 时是带谐波的音调（触发服务端 VAD），否则为静音"""
+    n = AUDIO_SAMPLE_RATE * chunk_ms // 1000
+    if not speech:
+        return base64.b64encode(bytes(n * 2)).decode('ascii')
+    t = np.arange(n) / AUDIO_SAMPLE_RATE
+    pcm = (np.sin(2 * np.pi * 220 * t) + 0.5 * np.sin(2 * np.pi * 660 * t)) * 6000
+    return base64.b64encode(pcm.astype(np.int16).tobytes()).decode('ascii')
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.recorder = Recorder()
+        self.frames = make_frames(*args.frame_size)
+        self.speech_chunk = make_audio_chunk(args.audio_chunk_ms, True)
+        self.silence_chunk = make_audio_chunk(args.audio_chunk_ms, False)
+        self.deadline = 0.0
+
+    def audio_schedule(self):
+        """语音 speech_s 秒 + 静音 silence_s 秒循环，返回当前块是否为语音"""
+        cycle = self.args.speech_s + self.args.silence_s
+        chunks_per_cycle = int(cycle * 1000 / self.args.audio_chunk_ms)
+        speech_chunks = int(self.args.speech_s * 1000 / self.args.audio_chunk_ms)
+        i = 0
+        while True:
+            yield i % chunks_per_cycle < speech_chunks
+            i += 1
+
+    def paced_loop(self, tasks):
+        """
+        按各自周期驱动多个发送任务，直到 deadline
+        :param tasks: [(周期秒, 回调)]
+        """
+        now = time.perf_counter()
+        next_times = [now] * len(tasks)
+        while time.perf_counter() < self.deadline:
+            i = int(np.argmin(next_times))
+            delay = next_times[i] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            tasks[i][1]()
+            next_times[i] += tasks[i][0]
+
+    # ---------- session 场景 ----------
+    def consume_sse(self, http, session_id, stop_event, state):
+        """消费 /response SSE，记录首个事件到达时间和事件计数"""
+        url = f"{self.args.base_url}/api/session/{session_id}/response"
+        t0 = time.perf_counter()
+        try:
+            with http.get(url, stream=True, timeout=(5, 5)) as resp:
+                if resp.status_code >= 400:
+                    self.recorder.fail("session.sse_connect", f"HTTP {resp.status_code}")
+                    return
+                for line in resp.iter_lines():
+                    if stop_event.is_set():
+                        break
+                    if not line.startswith(b"data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    if state["events"] == 0:
+                        self.recorder.ok("session.sse_first_event", time.perf_counter() - t0)
+                    state["events"] += 1
+                    if event.get("type") == "delta":
+                        state["deltas"] += 1
+        except requests.exceptions.ReadTimeout:
+            pass  # 会话关闭后心跳停止
+        except Exception as e:
+            if not stop_event.is_set():
+                self.recorder.fail("session.sse", e)
+
+    def session_worker(self):
+        http = requests.Session()
+        base = self.args.base_url
+        while time.perf_counter() < self.deadline:
+            resp = self.recorder.timed("session.create", http.post, f"{base}/api/session/create",
+                                       json={}, timeout=30)
+            if resp is None:
+                time.sleep(1)
+                continue
+            session_id = resp.json()["session_id"]
+            stop_event = threading.Event()
+            state = {"events": 0, "deltas": 0}
+            sse = threading.Thread(target=self.consume_sse, args=(http, session_id, stop_event, state), daemon=True)
+            sse.start()
+
+            frame_index = [0]
+            schedule = self.audio_schedule()
+
+            def send_frame():
+                frame = self.frames[frame_index[0] % len(self.frames)]
+                frame_index[0] += 1
+                self.recorder.timed("session.video", http.post, f"{base}/api/session/{session_id}/video",
+                                    json={"frame": frame}, timeout=30)
+
+            def send_audio():
+                chunk = self.speech_chunk if next(schedule) else self.silence_chunk
+                self.recorder.timed("session.audio", http.post, f"{base}/api/session/{session_id}/audio",
+                                    json={"audio": chunk}, timeout=30)
+
+            self.paced_loop([(1.0 / self.args.fps, send_frame), (self.args.audio_chunk_ms / 1000, send_audio)])
+            stop_event.set()
+            self.recorder.timed("session.close", http.post, f"{base}/api/session/{session_id}/close", timeout=30)
+            sse.join(timeout=10)
+
+    # ---------- analyze 场景 ----------
+    def analyze_worker(self):
+        http = requests.Session()
+        i = 0
+        while time.perf_counter() < self.deadline:
+            resp = self.recorder.timed("analyze", http.post, f"{self.args.base_url}/api/analyze-video",
+                                       json={"frame": self.frames[i % len(self.frames)],
+                                             "question": "请描述这张图片"}, timeout=60)
+            if resp is not None and resp.json().get("analysis", "").startswith("未收到分析结果"):
+                self.recorder.fail("analyze.empty", "未收到分析结果")
+            i += 1
+
+    # ---------- ws 场景 ----------
+    def ws_worker(self):
+        while time.perf_counter() < self.deadline:
+            t0 = time.perf_counter()
+            try:
+                ws = websocket.create_connection(self.args.ws_url, timeout=30)
+                while True:
+                    msg = json.loads(ws.recv())
+                    if msg.get("type") == "ready":
+                        break
+                    if msg.get("type") == "error":
+                        raise RuntimeError(msg.get("message"))
+            except Exception as e:
+                self.recorder.fail("ws.connect", e)
+                time.sleep(1)
+                continue
+            self.recorder.ok("ws.connect", time.perf_counter() - t0)
+
+            send_lock = threading.Lock()
+            state = {"speech_end": None, "text_pending": False, "audio_pending": False, "closed": False}
+
+            def receiver():
+                while not state["closed"]:
+                    try:
+                        msg = json.loads(ws.recv())
+                    except Exception:
+                        break
+                    msg_type = msg.get("type")
+                    now = time.perf_counter()
+                    if msg_type == "text.delta" and state["text_pending"]:
+                        state["text_pending"] = False
+                        self.recorder.ok("ws.first_text", now - state["speech_end"])
+                    elif msg_type == "audio.delta" and state["audio_pending"]:
+                        state["audio_pending"] = False
+                        self.recorder.ok("ws.first_audio", now - state["speech_end"])
+                    elif msg_type == "response.done" and state["speech_end"]:
+                        self.recorder.ok("ws.response_done", now - state["speech_end"])
+                    elif msg_type == "error":
+                        self.recorder.fail("ws.server_error", msg.get("message"))
+
+            recv_thread = threading.Thread(target=receiver, daemon=True)
+            recv_thread.start()
+
+            frame_index = [0]
+            schedule = self.audio_schedule()
+            prev_speech = [False]
+
+            def send(payload, op):
+                t = time.perf_counter()
+                try:
+                    with send_lock:
+                        ws.send(json.dumps(payload))
+                    self.recorder.ok(op, time.perf_counter() - t)
+                except Exception as e:
+                    self.recorder.fail(op, e)
+
+            def send_frame():
+                frame = self.frames[frame_index[0] % len(self.frames)]
+                frame_index[0] += 1
+                send({"type": "video", "data": frame}, "ws.video")
+
+            def send_audio():
+                speech = next(schedule)
+                if prev_speech[0] and not speech:
+                    # 语音段结束：从此刻起计算首个回复延迟
+                    state["speech_end"] = time.perf_counter()
+                    state["text_pending"] = state["audio_pending"] = True
+                prev_speech[0] = speech
+                send({"type": "audio", "data": self.speech_chunk if speech else self.silence_chunk}, "ws.audio")
+
+            self.paced_loop([(1.0 / self.args.fps, send_frame), (self.args.audio_chunk_ms / 1000, send_audio)])
+            state["closed"] = True
+            try:
+                with send_lock:
+                    ws.send(json.dumps({"type": "close"}))
+                ws.close()
+            except Exception:
+                pass
+            recv_thread.join(timeout=5)
+
+    def run(self):
+        args = self.args
+        workers = {"session": self.session_worker, "analyze": self.analyze_worker, "ws": self.ws_worker}
+        samplers = {}
+        for name, pid, url in (("http", args.server_pid, args.base_url), ("ws", args.ws_server_pid, args.ws_url)):
+            if name == "ws" and "ws" not in args.scenario:
+                continue
+            if name == "http" and not ({"session", "analyze"} & set(args.scenario)):
+                continue
+            pid = pid or find_server_pid(url)
+            if pid:
+                samplers[name] = ProcessSampler(pid).start()
+            else:
+                log(f"[Warning] 未找到 {url} 的服务进程，跳过 CPU/RSS 采样（可用 --server-pid 指定）")
+
+        log(f"压测开始: 场景 {args.scenario} | 并发 {args.concurrency} | {args.duration}s | {args.fps} fps")
+        threads = []
+        start = time.perf_counter()
+        self.deadline = start + args.duration
+        for scenario in args.scenario:
+            for _ in range(args.concurrency):
+                t = threading.Thread(target=workers[scenario], daemon=True)
+                t.start()
+                threads.append(t)
+        for t in threads:
+            t.join(timeout=args.duration + 120)
+        elapsed = time.perf_counter() - start
+
+        return {
+            "config": {
+                "scenario": args.scenario,
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "fps": args.fps,
+                "audio_chunk_ms": args.audio_chunk_ms,
+                "frame_size": list(args.frame_size),
+                "base_url": args.base_url,
+                "ws_url": args.ws_url,
+            },
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "elapsed_s": elapsed,
+            "operations": self.recorder.summary(elapsed),
+            "server": {name: sampler.stop() for name, sampler in samplers.items()},
+        }
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qwen Video API 压测")
+    parser.add_argument("--base-url", default="http://localhost:5002", help="qwen_video_server.py 地址")
+    parser.add_argument("--ws-url", default="ws://localhost:5003/ws/video", help="qwen_video_server_realtime.py WebSocket 地址")
+    parser.add_argument("--scenario", nargs="+", choices=["session", "analyze", "ws"], default=["session"])
+    parser.add_argument("--concurrency", type=int, default=4, help="每个场景的并发数")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长（秒）")
+    parser.add_argument("--fps", type=float, default=2, help="每个会话的视频帧率")
+    parser.add_argument("--audio-chunk-ms", type=int, default=100, help="音频块时长（按实时速率发送）")
+    parser.add_argument("--speech-s", type=float, default=2, help="模拟语音段时长")
+    parser.add_argument("--silence-s", type=float, default=3, help="语音段之间的静音时长")
+    parser.add_argument("--frame-size", type=parse_size, default=(640, 480), help="测试帧尺寸，如 1280x720")
+    parser.add_argument("--server-pid", type=int, default=None, help="HTTP 服务进程 PID（默认按端口查找）")
+    parser.add_argument("--ws-server-pid", type=int, default=None, help="WebSocket 服务进程 PID（默认按端口查找）")
+    parser.add_argument("-o", "--output", default=None, help="结果 JSON 路径（默认输出到 stdout）")
+    args = parser.parse_args()
+
+    result = LoadTest(args).run()
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        log(f"结果已写入 {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
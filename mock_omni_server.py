@@ -0,0 +1,273 @@
+"""
+本地 Qwen-Omni Realtime 模拟服务
+实现与 qwen3-omni-flash-realtime 相同的 WebSocket 事件协议，用于离线联调和压测，不消耗 DashScope 额度：
+- 连接后下发 session.created，session.update 回复 session.updated
+- input_audio_buffer.append 上的能量 VAD（server_vad 模式）：
+  input_audio_buffer.speech_started / speech_stopped / committed、语音转录完成事件，随后自动生成回复
+- 回复流程: response.created → (首 token 延迟) → response.audio_transcript.delta + response.audio.delta
+  （按 token 速率流式下发，音频为 24kHz PCM 正弦波）→ response.done
+- 插话（说话开始）或 response.cancel 时中断当前回复，response.done 的 status 为 cancelled
+- 故障注入：握手拒绝、回复报 error、回复中途断开连接
+
+用法:
+    python mock_omni_server.py [--port 8765] [--first-token-ms 300] [--tokens-per-s 20] [--error-rate 0.1]
+
+服务端切换：设置环境变量 QWEN_OMNI_REALTIME_URL=ws://127.0.0.1:8765/api-ws/v1/realtime
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uuid
+from http import HTTPStatus
+import numpy as np
+import websockets
+
+INPUT_SAMPLE_RATE = 16000
+OUTPUT_SAMPLE_RATE = 24000
+DEFAULT_REPLY = "你好，我是本地模拟的千问全模态助手，画面和声音我都收到了，这是一段用于测试的回复。"
+
+
+def make_event(event_type, **fields):
+    return json.dumps({"event_id": "event_" + uuid.uuid4().hex, "type": event_type, **fields}, ensure_ascii=False)
+
+
+def tone_b64(duration_s, freq=440, phase=0):
+    """生成一段 24kHz 正弦波 PCM 的 Base64，phase 为起始样本序号（保证相邻分片相位连续）"""
+    n = int(OUTPUT_SAMPLE_RATE * duration_s)
+    t = (np.arange(n) + phase) / OUTPUT_SAMPLE_RATE
+    pcm = (np.sin(2 * np.pi * freq * t) * 4000).astype(np.int16)
+    return base64.b64encode(pcm.tobytes()).decode('ascii'), n
+
+
+class MockConfig:
+    """
+    :param first_token_ms: response.created 到首个 delta 的延迟
+    :param tokens_per_s: 文本 token 下发速率（每个 token 附带等时长的音频）
+    :param error_rate: 回复改为下发 error 事件的概率
+    :param disconnect_rate: 回复中途直接断开连接的概率
+    :param connect_fail_rate: 握手阶段返回 503 的概率
+    :param vad_threshold: 能量 VAD 的 RMS 阈值（int16）
+    :param silence_ms: 说话结束判定的静音时长
+    """
+
+    def __init__(self, first_token_ms=300, tokens_per_s=20, error_rate=0.0, disconnect_rate=0.0,
+                 connect_fail_rate=0.0, vad_threshold=500, silence_ms=600, reply=DEFAULT_REPLY):
+        self.first_token_ms = first_token_ms
+        self.tokens_per_s = tokens_per_s
+        self.error_rate = error_rate
+        self.disconnect_rate = disconnect_rate
+        self.connect_fail_rate = connect_fail_rate
+        self.vad_threshold = vad_threshold
+        self.silence_ms = silence_ms
+        self.reply = reply
+
+
+class MockSession:
+    """单个 WebSocket 连接的会话状态"""
+
+    def __init__(self, websocket, config, stats):
+        self.ws = websocket
+        self.config = config
+        self.stats = stats
+        self.session_id = "sess_" + uuid.uuid4().hex[:16]
+        self.session = {"id": self.session_id, "model": "qwen3-omni-flash-realtime",
+                        "turn_detection": {"type": "server_vad"}}
+        self.speaking = False
+        self.silence_samples = 0
+        self.audio_samples = 0   # 本轮（上次 commit 之后）的样本数
+        self.total_samples = 0   # 会话时间轴（audio_start_ms / audio_end_ms 以此为准）
+        self.image_count = 0
+        self.response_task = None
+        self.response_id = None
+
+    async def send(self, event_type, **fields):
+        await self.ws.send(make_event(event_type, **fields))
+
+    async def run(self):
+        await self.send("session.created", session=self.session)
+        try:
+            async for message in self.ws:
+                if isinstance(message, bytes):
+                    continue
+                await self.handle(json.loads(message))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            await self.cancel_response(notify=False)
+
+    async def handle(self, event):
+        event_type = event.get("type", "")
+        if event_type == "session.update":
+            self.session.update(event.get("session", {}))
+            await self.send("session.updated", session=self.session)
+        elif event_type == "input_audio_buffer.append":
+            await self.on_audio(base64.b64decode(event.get("audio", "")))
+        elif event_type == "input_image_buffer.append":
+            self.image_count += 1
+            self.stats["images"] += 1
+        elif event_type == "input_audio_buffer.commit":
+            await self.commit()
+        elif event_type == "input_audio_buffer.clear":
+            self.audio_samples = 0
+            await self.send("input_audio_buffer.cleared")
+        elif event_type == "response.create":
+            self.start_response()
+        elif event_type == "response.cancel":
+            await self.cancel_response()
+        elif event_type == "session.finish":
+            await self.cancel_response(notify=False)
+            await self.send("session.finished", session=self.session)
+            await self.ws.close()
+
+    async def on_audio(self, raw):
+        samples = np.frombuffer(raw[:len(raw) // 2 * 2], dtype=np.int16)
+        if len(samples) == 0:
+            return
+        self.audio_samples += len(samples)
+        self.total_samples += len(samples)
+        self.stats["audio_seconds"] += len(samples) / INPUT_SAMPLE_RATE
+        if not self.session.get("turn_detection"):
+            return  # 手动模式：由客户端 commit + response.create
+
+        rms = float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+        if rms >= self.config.vad_threshold:
+            self.silence_samples = 0
+            if not self.speaking:
+                self.speaking = True
+                await self.cancel_response()  # 插话打断
+                await self.send("input_audio_buffer.speech_started",
+                                audio_start_ms=int((self.total_samples - len(samples)) * 1000 / INPUT_SAMPLE_RATE))
+        elif self.speaking:
+            self.silence_samples += len(samples)
+            if self.silence_samples * 1000 / INPUT_SAMPLE_RATE >= self.config.silence_ms:
+                self.speaking = False
+                # 说话结束位置 = 静音开始处
+                speech_end = self.total_samples - self.silence_samples
+                await self.send("input_audio_buffer.speech_stopped",
+                                audio_end_ms=int(speech_end * 1000 / INPUT_SAMPLE_RATE))
+                await self.commit()
+                self.start_response()
+
+    async def commit(self):
+        item_id = "item_" + uuid.uuid4().hex[:16]
+        await self.send("input_audio_buffer.committed", item_id=item_id)
+        await self.send("conversation.item.input_audio_transcription.completed", item_id=item_id,
+                        transcript=f"（模拟转录）{self.audio_samples / INPUT_SAMPLE_RATE:.1f} 秒音频，{self.image_count} 帧画面")
+        self.audio_samples = 0
+        self.image_count = 0
+
+    def start_response(self):
+        if self.response_task and not self.response_task.done():
+            self.response_task.cancel()
+        self.response_task = asyncio.create_task(self.respond())
+
+    async def cancel_response(self, notify=True):
+        task = self.response_task
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            if notify:
+                await self.send("response.done", response={"id": self.response_id, "status": "cancelled"})
+            self.stats["cancelled"] += 1
+
+    async def respond(self):
+        config = self.config
+        response_id = self.response_id = "resp_" + uuid.uuid4().hex[:16]
+        self.stats["responses"] += 1
+        await self.send("response.created", response={"id": response_id, "status": "in_progress"})
+        await asyncio.sleep(config.first_token_ms / 1000)
+
+        if random.random() < config.error_rate:
+            self.stats["errors"] += 1
+            await self.send("error", error={"type": "server_error", "code": "MockInjectedError",
+                                            "message": "mock server injected failure"})
+            await self.send("response.done", response={"id": response_id, "status": "failed"})
+            return
+        disconnect_at = random.randrange(len(config.reply)) if random.random() < config.disconnect_rate else -1
+
+        interval = 1.0 / config.tokens_per_s
+        next_time = time.perf_counter()
+        phase = 0
+        for i, token in enumerate(config.reply):
+            if i == disconnect_at:
+                self.stats["disconnects"] += 1
+                await self.ws.close(code=1011, reason="mock server injected disconnect")
+                return
+            audio, n = tone_b64(interval, phase=phase)
+            phase += n
+            await self.send("response.audio_transcript.delta", response_id=response_id, delta=token)
+            await self.send("response.audio.delta", response_id=response_id, delta=audio)
+            next_time += interval
+            await asyncio.sleep(max(0.0, next_time - time.perf_counter()))
+
+        await self.send("response.audio_transcript.done", response_id=response_id, transcript=config.reply)
+        await self.send("response.audio.done", response_id=response_id)
+        await self.send("response.done", response={
+            "id": response_id, "status": "completed",
+            "usage": {"output_tokens": len(config.reply)},
+        })
+
+
+async def serve(host, port, config):
+    stats = {"connections": 0, "active": 0, "rejected": 0, "responses": 0, "cancelled": 0,
+             "errors": 0, "disconnects": 0, "images": 0, "audio_seconds": 0.0}
+
+    async def process_request(path, headers):
+        if random.random() < config.connect_fail_rate:
+            stats["rejected"] += 1
+            return HTTPStatus.SERVICE_UNAVAILABLE, [], b"mock server injected connect failure\n"
+        return None
+
+    async def handler(websocket, path=None):
+        stats["connections"] += 1
+        stats["active"] += 1
+        try:
+            await MockSession(websocket, config, stats).run()
+        finally:
+            stats["active"] -= 1
+
+    async with websockets.serve(handler, host, port, process_request=process_request, max_size=None):
+        print(f"🧪 Mock Qwen-Omni Realtime 服务: ws://{host}:{port}/api-ws/v1/realtime")
+        print(f"   首 token 延迟 {config.first_token_ms}ms | {config.tokens_per_s} token/s | "
+              f"error {config.error_rate:.0%} | 断线 {config.disconnect_rate:.0%} | 握手失败 {config.connect_fail_rate:.0%}")
+        while True:
+            await asyncio.sleep(10)
+            print("[Stats] " + " | ".join(f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                                          for k, v in stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Qwen-Omni Realtime 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token-ms", type=float, default=300, help="首 token 延迟（毫秒）")
+    parser.add_argument("--tokens-per-s", type=float, default=20, help="token 下发速率")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="回复下发 error 的概率")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="回复中途断开连接的概率")
+    parser.add_argument("--connect-fail-rate", type=float, default=0.0, help="握手返回 503 的概率")
+    parser.add_argument("--vad-threshold", type=float, default=500, help="能量 VAD 的 RMS 阈值")
+    parser.add_argument("--silence-ms", type=float, default=600, help="说话结束判定的静音时长")
+    parser.add_argument("--reply", default=DEFAULT_REPLY, help="固定回复文本（每个字符为一个 token）")
+    parser.add_argument("--seed", type=int, default=None, help="故障注入随机种子")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    config = MockConfig(first_token_ms=args.first_token_ms, tokens_per_s=args.tokens_per_s,
+                        error_rate=args.error_rate, disconnect_rate=args.disconnect_rate,
+                        connect_fail_rate=args.connect_fail_rate, vad_threshold=args.vad_threshold,
+                        silence_ms=args.silence_ms, reply=args.reply)
+    try:
+        asyncio.run(serve(args.host, args.port, config))
+    except KeyboardInterrupt:
+        print("Mock 服务已停止")
+
+
+if __name__ == "__main__":
+    main()
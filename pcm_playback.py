@@ -0,0 +1,115 @@
+"""
+低延迟 PCM 播放引擎
+常驻的 PyAudio 回调输出流：TTS 音频在内存中解码为 PCM 后入队播放，
+多段音频无缝衔接，stop() 清空队列后下一个回调周期（默认 128 帧 ≈ 5ms）即静音
+"""
+
+import io
+import threading
+from collections import deque
+import av
+import numpy as np
+import pyaudio
+
+
+def decode_audio(data, sample_rate=24000):
+    """
+    将内存中的压缩音频（MP3 等）解码为单声道 16-bit PCM
+
+    :param data: 音频文件字节
+    :param sample_rate: 目标采样率
+    :return: int16 数组
+    """
+    container = av.open(io.BytesIO(data))
+    resampler = av.AudioResampler(format='s16', layout='mono', rate=sample_rate)
+    chunks = []
+    try:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().reshape(-1))
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+    finally:
+        container.close()
+    if not chunks:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate(chunks).astype(np.int16, copy=False)
+
+
+class PCMPlaybackEngine:
+    """常驻 PCM 播放引擎（单声道 16-bit）"""
+
+    def __init__(self, sample_rate=24000, frames_per_buffer=128):
+        self.sample_rate = sample_rate
+        self.segments = deque()
+        self.offset = 0  # 当前段已播放的样本数
+        self.lock = threading.Lock()
+        self.idle_event = threading.Event()
+        self.idle_event.set()
+        self._out = np.zeros(frames_per_buffer, dtype=np.int16)
+
+        self.pya = pyaudio.PyAudio()
+        self.stream = self.pya.open(format=pyaudio.paInt16,
+                                    channels=1,
+                                    rate=sample_rate,
+                                    output=True,
+                                    frames_per_buffer=frames_per_buffer,
+                                    stream_callback=self._callback)
+        self.stream.start_stream()
+
+    def enqueue(self, pcm):
+        """追加一段 int16 PCM，与前一段无缝衔接"""
+        pcm = np.asarray(pcm, dtype=np.int16).reshape(-1)
+        if len(pcm) == 0:
+            return
+        with self.lock:
+            self.segments.append(pcm)
+            self.idle_event.clear()
+
+    def stop(self):
+        """清空所有待播放音频，下一个回调周期即静音"""
+        with self.lock:
+            self.segments.clear()
+            self.offset = 0
+            self.idle_event.set()
+
+    def is_busy(self):
+        return not self.idle_event.is_set()
+
+    def wait(self, cancel_token=None, poll_interval=0.02):
+        """
+        等待播放完成
+
+        :return: 正常播完返回 True，被取消返回 False
+        """
+        while not self.idle_event.wait(poll_interval):
+            if cancel_token and cancel_token.cancelled:
+                self.stop()
+                return False
+        return not (cancel_token and cancel_token.cancelled)
+
+    def close(self):
+        self.stop()
+        self.stream.stop_stream()
+        self.stream.close()
+        self.pya.terminate()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if len(self._out) < frame_count:
+            self._out = np.zeros(frame_count, dtype=np.int16)
+        out = self._out[:frame_count]
+        filled = 0
+        with self.lock:
+            while filled < frame_count and self.segments:
+                segment = self.segments[0]
+                take = min(frame_count - filled, len(segment) - self.offset)
+                out[filled:filled + take] = segment[self.offset:self.offset + take]
+                filled += take
+                self.offset += take
+                if self.offset >= len(segment):
+                    self.segments.popleft()
+                    self.offset = 0
+            if not self.segments:
+                self.idle_event.set()
+        out[filled:] = 0
+        return out.tobytes(), pyaudio.paContinue
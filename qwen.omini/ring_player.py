@@ -0,0 +1,115 @@
+# 回调模式环形缓冲区 PCM 播放器
+# 与 B64PCMPlayer 接口一致：add_data / cancel_playing / wait_for_complete / shutdown
+import base64
+import binascii
+import threading
+import numpy as np
+import pyaudio
+
+
+class PCMRingBuffer:
+    """预分配的 int16 环形缓冲区（单写单读，读写由同一把锁保护）"""
+
+    def __init__(self, capacity):
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.read_pos = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def write(self, samples):
+        """写入样本，空间不足时丢弃超出部分，返回实际写入的样本数"""
+        with self.lock:
+            n = min(len(samples), self.capacity - self.size)
+            start = (self.read_pos + self.size) % self.capacity
+            first = min(n, self.capacity - start)
+            self.buffer[start:start + first] = samples[:first]
+            self.buffer[:n - first] = samples[first:n]
+            self.size += n
+            return n
+
+    def read_into(self, out):
+        """读出最多 len(out) 个样本到 out，不足部分补零，返回实际读出的样本数"""
+        with self.lock:
+            n = min(len(out), self.size)
+            first = min(n, self.capacity - self.read_pos)
+            out[:first] = self.buffer[self.read_pos:self.read_pos + first]
+            out[first:n] = self.buffer[:n - first]
+            self.read_pos = (self.read_pos + n) % self.capacity
+            self.size -= n
+        out[n:] = 0
+        return n
+
+    def clear(self):
+        with self.lock:
+            self.read_pos = 0
+            self.size = 0
+
+    def __len__(self):
+        return self.size
+
+
+class RingBufferPCMPlayer:
+    """
+    回调模式播放器：
+    - response.audio.delta 到达时直接在事件线程中 Base64 解码写入环形缓冲区，无解码/播放线程
+    - PyAudio 回调每个周期从缓冲区取数据，不足补静音
+    - cancel_playing 清空缓冲区，最迟一个回调周期（默认 20ms）后静音
+    """
+
+    def __init__(self, pya: pyaudio.PyAudio, sample_rate=24000, period_ms=20, capacity_s=120):
+        self.pya = pya
+        self.sample_rate = sample_rate
+        self.period_frames = sample_rate * period_ms // 1000
+        self.ring = PCMRingBuffer(sample_rate * capacity_s)
+        self._out = np.zeros(self.period_frames, dtype=np.int16)
+        self._decode_buf = bytearray()  # 奇数字节的残留（跨 delta 的半个样本）
+        self.complete_event: threading.Event = None
+        self.player_stream = pya.open(format=pyaudio.paInt16,
+                                      channels=1,
+                                      rate=sample_rate,
+                                      output=True,
+                                      frames_per_buffer=self.period_frames,
+                                      stream_callback=self._callback)
+        self.player_stream.start_stream()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if len(self._out) < frame_count:
+            self._out = np.zeros(frame_count, dtype=np.int16)
+        out = self._out[:frame_count]
+        n = self.ring.read_into(out)
+        if n == 0 and self.complete_event:
+            self.complete_event.set()
+        return out.tobytes(), pyaudio.paContinue
+
+    def add_data(self, data):
+        """Base64 PCM 数据，在调用线程中直接解码写入环形缓冲区"""
+        try:
+            raw = base64.b64decode(data)
+        except (binascii.Error, ValueError) as e:
+            print(f'[Error] 音频解码失败: {e}')
+            return
+        if self._decode_buf:
+            raw = bytes(self._decode_buf) + raw
+            self._decode_buf.clear()
+        if len(raw) % 2:
+            self._decode_buf.extend(raw[-1:])
+            raw = raw[:-1]
+        samples = np.frombuffer(raw, dtype=np.int16)
+        written = self.ring.write(samples)
+        if written < len(samples):
+            print(f'[Warning] 播放缓冲区已满，丢弃 {len(samples) - written} 个样本')
+
+    def cancel_playing(self):
+        self._decode_buf.clear()
+        self.ring.clear()
+
+    def wait_for_complete(self):
+        self.complete_event = threading.Event()
+        self.complete_event.wait()
+        self.complete_event = None
+
+    def shutdown(self):
+        self.cancel_playing()
+        self.player_stream.stop_stream()
+        self.player_stream.close()
@@ -0,0 +1,108 @@
+"""
+RingBufferPCMPlayer 延迟测试
+使用假的输出设备（按真实回调周期驱动回调的线程）代替声卡，验证：
+1. 连续多段 delta 播放无缝衔接（回调输出中间无静音空洞）
+2. cancel_playing（插话打断）后最迟一个回调周期输出静音
+"""
+import base64
+import threading
+import time
+import numpy as np
+from ring_player import RingBufferPCMPlayer
+
+SAMPLE_RATE = 24000
+PERIOD_MS = 20
+
+
+class FakeOutputStream:
+    """假输出流：后台线程按 frames_per_buffer 对应的实时周期调用回调，并记录输出"""
+
+    def __init__(self, rate, frames_per_buffer, stream_callback, **kwargs):
+        self.period = frames_per_buffer / rate
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = stream_callback
+        self.outputs = []  # (回调时间, 是否全静音, 非零样本数)
+        self.running = False
+        self.thread = None
+
+    def start_stream(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        next_time = time.perf_counter()
+        while self.running:
+            data, _ = self.callback(None, self.frames_per_buffer, None, 0)
+            samples = np.frombuffer(data, dtype=np.int16)
+            self.outputs.append((time.perf_counter(), not samples.any(), int(np.count_nonzero(samples))))
+            next_time += self.period
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+
+    def stop_stream(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+
+    def close(self):
+        pass
+
+
+class FakePyAudio:
+    def __init__(self):
+        self.stream = None
+
+    def open(self, **kwargs):
+        self.stream = FakeOutputStream(**kwargs)
+        return self.stream
+
+
+def make_delta(duration_s, freq=440):
+    """生成一段正弦波 PCM 的 Base64（模拟 response.audio.delta）"""
+    t = np.arange(int(SAMPLE_RATE * duration_s)) / SAMPLE_RATE
+    pcm = (np.sin(2 * np.pi * freq * t) * 8000).astype(np.int16)
+    pcm[pcm == 0] = 1  # 避免过零点被误判为静音
+    return base64.b64encode(pcm.tobytes()).decode('ascii')
+
+
+def test_gapless_playback():
+    pya = FakePyAudio()
+    player = RingBufferPCMPlayer(pya, sample_rate=SAMPLE_RATE, period_ms=PERIOD_MS)
+    stream = pya.stream
+    for _ in range(5):
+        player.add_data(make_delta(0.1))  # 5 段 100ms 的 delta
+    time.sleep(0.7)
+    player.shutdown()
+
+    playing = [silent for _, silent, _ in stream.outputs]
+    first = playing.index(False)
+    last = len(playing) - 1 - playing[::-1].index(False)
+    gaps = sum(playing[first:last + 1])
+    print(f"无缝播放: 有声周期 {last - first + 1}, 中间静音周期 {gaps}")
+    assert gaps == 0
+
+
+def test_cancel_latency():
+    pya = FakePyAudio()
+    player = RingBufferPCMPlayer(pya, sample_rate=SAMPLE_RATE, period_ms=PERIOD_MS)
+    stream = pya.stream
+    player.add_data(make_delta(2.0))
+    time.sleep(0.2)
+
+    cancel_time = time.perf_counter()
+    player.cancel_playing()
+    time.sleep(0.1)
+    player.shutdown()
+
+    silent_after = [t for t, silent, _ in stream.outputs if t >= cancel_time and silent]
+    latency_ms = (silent_after[0] - cancel_time) * 1000
+    print(f"打断延迟: {latency_ms:.1f}ms（回调周期 {PERIOD_MS}ms）")
+    # 允许 5ms 的线程调度抖动
+    assert latency_ms <= PERIOD_MS + 5
+
+
+if __name__ == '__main__':
+    test_gapless_playback()
+    print("✅ 无缝播放测试通过")
+    test_cancel_latency()
+    print("✅ 打断延迟测试通过")
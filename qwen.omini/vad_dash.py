@@ -12,18 +12,44 @@ import cv2
 import numpy as np
 from dashscope.audio.qwen_omni import *
 import dashscope
+from ring_player import RingBufferPCMPlayer
+# 共享内存帧总线位于仓库根目录（与 SenseVoice 助手共用）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_bus import FrameBus
+from video_frame_utils import encode_frame, resolution_height  # 缩放 + JPEG 编码 + Base64，与视频服务共用
+from session_replay import SessionRecorder, SessionReplay, TurnLatencyTracker
 # 如果没有设置环境变量，请用您的 API Key 将下行替换为dashscope.api_key = "sk-xxx"
 dashscope.api_key = os.getenv('DASHSCOPE_API_KEY') or "sk-c5c3e296dfc74fb9bef2fa4481b7cd78"
+# Realtime 服务地址，未设置时连接 DashScope；离线联调/压测可指向 mock_omni_server.py
+# 例如 QWEN_OMNI_REALTIME_URL=ws://127.0.0.1:8765/api-ws/v1/realtime
+OMNI_REALTIME_URL = os.getenv('QWEN_OMNI_REALTIME_URL') or None
 voice = 'Cherry'
 conversation = None
 video_cap = None
+mic_stream = None
+b64_player = None
+frame_bus = None
 
 # ========== 性能配置 ==========
 FRAME_INTERVAL_MS = 500  # 发送帧率: 2fps (500ms间隔)
-VIDEO_RESOLUTION = '480p'  # 固定使用480p，流畅优先
+VIDEO_RESOLUTION = '480p'  # 发送帧的目标分辨率，流畅优先
 DISPLAY_FPS = 120  # 显示帧率: 可调整 (30/60/120)
+MIC_CHUNK_BYTES = 800  # 每次读取的麦克风数据: 800字节 = 25ms (16000Hz * 2bytes * 0.025s)
+ENCODE_STRESS_MS = 0  # 调试用: 给编码阶段额外增加的耗时，用于验证麦克风节拍不受编码影响
+CADENCE_REPORT_S = 10  # 麦克风节拍统计输出间隔（秒）
+FRAME_BUS_NAME = 'qwen_omni_camera'  # 共享内存帧总线名称，其他进程可用 FrameBus.attach(FRAME_BUS_NAME) 读取摄像头画面
+FRAME_BUS_SLOTS = 8  # 帧槽数量（固定内存: 8 × 640×480×3 ≈ 7.4MB）
+USE_RING_PLAYER = True  # True: 回调模式环形缓冲播放器（打断延迟≤20ms）; False: 旧版双线程 B64PCMPlayer
+SESSION_RECORD_PATH = os.getenv('SESSION_RECORD_PATH')  # 录制本次会话（麦克风 PCM + 摄像头 JPEG），用于复现现场延迟问题
+SESSION_REPLAY_PATH = os.getenv('SESSION_REPLAY_PATH')  # 用录制文件代替麦克风和摄像头（见 session_replay.py）
+SESSION_REPLAY_SPEED = float(os.getenv('SESSION_REPLAY_SPEED', '1'))  # 回放倍速
+LATENCY_REPORT_PATH = os.getenv('LATENCY_REPORT_PATH')  # 退出时写出逐轮延迟报告（JSON）
 # =============================
 
+session_recorder = SessionRecorder(SESSION_RECORD_PATH, sample_rate=16000) if SESSION_RECORD_PATH else None
+session_replay = SessionReplay(SESSION_REPLAY_PATH, speed=SESSION_REPLAY_SPEED) if SESSION_REPLAY_PATH else None
+latency_tracker = TurnLatencyTracker(16000)  # 麦克风 → 首个文本 / 音频回复，逐轮统计
+
 class B64PCMPlayer:
     def __init__(self, pya: pyaudio.PyAudio, sample_rate=24000, chunk_size_ms=100):
         self.pya = pya
@@ -134,34 +160,7 @@ def capture_and_encode_frame():
     ret, frame = video_cap.read()
     if not ret:
         return None
-    
-    # 调整分辨率确保在合理范围内（最大1080P，建议720P）
-    height, width = frame.shape[:2]
-    if height > 720:
-        scale = 720.0 / height
-        new_width = int(width * scale)
-        new_height = 720
-        frame = cv2.resize(frame, (new_width, new_height))
-    
-    # 编码为JPEG
-    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 70]  # 调整质量控制大小
-    success, encoded_img = cv2.imencode('.jpg', frame, encode_param)
-    
-    if not success:
-        return None
-    
-    # 检查大小是否超过500KB
-    img_size = len(encoded_img.tobytes())
-    if img_size > 500 * 1024:  # 500KB
-        # 降低质量重新编码
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 50]
-        success, encoded_img = cv2.imencode('.jpg', frame, encode_param)
-        if not success:
-            return None
-    
-    # Base64编码
-    img_b64 = base64.b64encode(encoded_img.tobytes()).decode('ascii')
-    return (img_b64, frame)  # 返回编码数据和原始帧
+    return encode_frame(frame, max_height=resolution_height(VIDEO_RESOLUTION))
 
 def cleanup_video():
     """清理视频资源"""
@@ -172,20 +171,175 @@ def cleanup_video():
     cv2.destroyAllWindows()
 
 
+# ========== 流水线：采集 / 编码 / 网络 分阶段线程 ==========
+class LatestValue:
+    """单槽最新值缓冲：写入覆盖旧值，读取方只拿最新值，不排队、不积压"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.value = None
+        self.seq = 0
+
+    def put(self, value):
+        with self.cond:
+            self.value = value
+            self.seq += 1
+            self.cond.notify_all()
+
+    def get(self, last_seq=0, timeout=None):
+        """等待比 last_seq 更新的值，返回 (seq, value)；超时返回当前值"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq != last_seq, timeout)
+            return self.seq, self.value
+
+
+class CadenceMonitor:
+    """统计麦克风读取节拍（相邻两次读取完成的间隔）"""
+
+    def __init__(self, name, report_interval_s):
+        self.name = name
+        self.report_interval_s = report_interval_s
+        self.intervals = []
+        self.last_time = None
+        self.last_report = time.perf_counter()
+
+    def tick(self, extra=''):
+        now = time.perf_counter()
+        if self.last_time is not None:
+            self.intervals.append((now - self.last_time) * 1000)
+        self.last_time = now
+        if now - self.last_report >= self.report_interval_s and self.intervals:
+            values = np.array(self.intervals)
+            print('\n[Metric] {} cadence: n={}, mean={:.1f}ms, p95={:.1f}ms, max={:.1f}ms {}'.format(
+                self.name, len(values), values.mean(), np.percentile(values, 95), values.max(), extra))
+            self.intervals = []
+            self.last_report = now
+
+
+stop_event = threading.Event()
+worker_threads = []  # 采集 / 编码 / 网络线程，退出时先 join 再关闭帧总线
+audio_send_queue = queue.Queue(maxsize=200)  # 麦克风 -> 网络，FIFO（音频不可丢帧），最多缓存 5 秒
+latest_jpeg = LatestValue()  # 编码 -> 网络：Base64 JPEG
+# 摄像头 -> 显示 / 编码 / 其他进程：共享内存帧总线 frame_bus（启动后创建）
+
+
+def mic_capture_loop():
+    """采集阶段：只负责读麦克风，保持 25ms 节拍"""
+    monitor = CadenceMonitor('mic', CADENCE_REPORT_S)
+    while not stop_event.is_set():
+        audio_data = mic_stream.read(MIC_CHUNK_BYTES // 2, exception_on_overflow=False)
+        latency_tracker.mark_audio(MIC_CHUNK_BYTES // 2)
+        if session_recorder:
+            session_recorder.write_audio(audio_data)
+        try:
+            audio_send_queue.put_nowait(audio_data)
+        except queue.Full:
+            # 网络阻塞时丢弃最旧的音频，保证采集不被拖慢
+            with contextlib.suppress(queue.Empty):
+                audio_send_queue.get_nowait()
+            audio_send_queue.put_nowait(audio_data)
+        monitor.tick('send_queue={}'.format(audio_send_queue.qsize()))
+
+
+def camera_capture_loop():
+    """采集阶段：一次摄像头读取写入帧总线，同时供显示、上传和其他进程使用"""
+    height, width = frame_bus.shape[:2]
+    while not stop_event.is_set():
+        ret, frame = video_cap.read()
+        if ret:
+            if frame.shape[:2] != (height, width):
+                frame = cv2.resize(frame, (width, height))
+            frame_time = time.time()
+            frame_bus.publish(frame, frame_time)
+            if session_recorder:
+                session_recorder.write_frame(frame, frame_time)
+        else:
+            time.sleep(0.01)
+
+
+def encode_loop():
+    """编码阶段：按发送帧率取最新帧做缩放 + JPEG + Base64"""
+    last_seq = 0
+    next_time = time.perf_counter()
+    while not stop_event.is_set():
+        next_time += FRAME_INTERVAL_MS / 1000
+        item = frame_bus.wait_next(last_seq, timeout=FRAME_INTERVAL_MS / 1000)
+        if item is not None:
+            seq, _, frame = item
+            if ENCODE_STRESS_MS:
+                time.sleep(ENCODE_STRESS_MS / 1000)
+            result = encode_frame(frame, max_height=resolution_height(VIDEO_RESOLUTION))
+            # 编码期间该帧槽被覆盖则丢弃，下个周期重新取最新帧
+            if result and frame_bus.is_valid(seq):
+                latest_jpeg.put(result[0])
+                last_seq = seq
+        time.sleep(max(0.0, next_time - time.perf_counter()))
+
+
+def network_loop():
+    """网络阶段：按顺序发送音频，并在有新编码帧时发送视频帧"""
+    last_jpeg_seq = 0
+    while not stop_event.is_set():
+        try:
+            audio_data = audio_send_queue.get(timeout=MIC_CHUNK_BYTES / 32000)
+            audio_b64 = base64.b64encode(audio_data).decode('ascii')
+            conversation.append_audio(audio_b64)
+        except queue.Empty:
+            pass
+        except Exception as e:
+            print(f"\nError sending audio: {e}")
+
+        if latest_jpeg.seq != last_jpeg_seq:
+            last_jpeg_seq, frame_b64 = latest_jpeg.get(last_jpeg_seq, timeout=0)
+            try:
+                conversation.append_video(frame_b64)
+                print("#", end="", flush=True)  # 显示视频帧发送进度
+            except Exception as e:
+                print(f"\nError sending video frame: {e}")
+
+
+def shutdown_all():
+    """退出清理：先停止并等待工作线程（不再持有帧总线视图），再关闭连接、设备和帧总线"""
+    stop_event.set()
+    for thread in worker_threads:
+        if thread is not threading.current_thread():
+            thread.join(timeout=2)
+            if thread.is_alive():
+                print(f'\n线程 {thread.name} 未在 2 秒内退出')
+    conversation.close()
+    b64_player.shutdown()
+    cleanup_video()
+    if frame_bus:
+        frame_bus.close()
+    if session_recorder:
+        session_recorder.close()
+        print(f'会话已录制到 {SESSION_RECORD_PATH}')
+    if LATENCY_REPORT_PATH:
+        latency_tracker.save(LATENCY_REPORT_PATH, replay=SESSION_REPLAY_PATH)
+        print(f'延迟报告已写入 {LATENCY_REPORT_PATH}')
+
+
 class MyCallback(OmniRealtimeCallback):
     def on_open(self) -> None:
         global pya
         global mic_stream
         global b64_player
+        global video_cap
         print('🔌 连接已建立，正在初始化麦克风和摄像头...')
         
         # 初始化音频
         pya = pyaudio.PyAudio()
+        b64_player = RingBufferPCMPlayer(pya) if USE_RING_PLAYER else B64PCMPlayer(pya)
+        if session_replay:
+            # 回放模式：录制文件代替麦克风和摄像头
+            mic_stream = session_replay.mic_stream()
+            video_cap = session_replay.video_capture()
+            print(f'⏯️  回放录制文件: {SESSION_REPLAY_PATH}（{session_replay.duration:.1f}s，{SESSION_REPLAY_SPEED}x）')
+            return
         mic_stream = pya.open(format=pyaudio.paInt16,
                             channels=1,
                             rate=16000,
                             input=True)
-        b64_player = B64PCMPlayer(pya)
         print('🎤 麦克风已初始化')
         
         # 直接初始化视频捕获（默认摄像头，480p）
@@ -215,15 +369,24 @@ class MyCallback(OmniRealtimeCallback):
                 print('question: {}'.format(response['transcript']))
             if 'response.audio_transcript.delta' == type:
                 text = response['delta']
+                latency_tracker.first_text()
                 print("got llm response delta: {}".format(text))
             if 'response.audio.delta' == type:
                 recv_audio_b64 = response['delta']
+                latency_tracker.first_audio()
                 b64_player.add_data(recv_audio_b64)
             if 'input_audio_buffer.speech_started' == type:
                 print('======VAD Speech Start======')
                 b64_player.cancel_playing()
+            if 'input_audio_buffer.speech_stopped' == type:
+                # audio_end_ms 为服务端收到的音频时间轴，换算回该样本的采集时刻
+                latency_tracker.speech_end(audio_end_ms=response.get('audio_end_ms'))
+            if session_recorder and type in ('input_audio_buffer.speech_started',
+                                             'input_audio_buffer.speech_stopped', 'response.done'):
+                session_recorder.write_event(type)
             if 'response.done' == type:
                 print('======RESPONSE DONE======')
+                latency_tracker.response_done()
                 print('[Metric] response: {}, first text delay: {}, first audio delay: {}'.format(
                                 conversation.get_last_response_id(),
                                 conversation.get_last_first_text_delay(),
@@ -239,6 +402,7 @@ if __name__  == '__main__':
     conversation = OmniRealtimeConversation(
         model='qwen3-omni-flash-realtime',
         callback=callback,
+        url=OMNI_REALTIME_URL,
         )
     conversation.connect()
     conversation.update_session(
@@ -253,12 +417,9 @@ if __name__  == '__main__':
         instructions="你是一个麻鸭领域的专业专家V-mallard。你对麻鸭的生物特征、生活习性、繁殖规律、饲养管理、疾病防治、营养需求、品种分类等方面都有深入的专业知识。你能够为养殖户、研究人员和爱好者提供准确、实用的麻鸭相关咨询和建议。请用专业而友好的语调回答问题，并尽可能提供详细和有价值的信息。" # 设定模型的角色
     )
     def signal_handler(sig, frame):
+        # 只通知主循环退出：主线程还持有帧总线视图，由主循环释放后再统一清理
         print('Ctrl+C pressed, stop recognition ...')
-        conversation.close()
-        b64_player.shutdown()
-        cleanup_video()
-        print('omni realtime stopped.')
-        sys.exit(0)
+        stop_event.set()
     signal.signal(signal.SIGINT, signal_handler)
     print("\n" + "="*60)
     print("🎤 Qwen-Omni 实时视频对话系统已启动")
@@ -269,50 +430,41 @@ if __name__  == '__main__':
     print("🗣️  现在可以开始说话，AI 会实时响应...")
     print("⏹️  退出方式: Ctrl+C 或在视频窗口按 'q' 键")
     print("="*60 + "\n")
-    
-    last_photo_time = time.time()*1000
-    last_display_time = time.time()
-    frame_count = 0
+
+    # 等待 on_open 完成麦克风和摄像头初始化
+    while not (mic_stream and video_cap) and not stop_event.is_set():
+        time.sleep(0.05)
+    if stop_event.is_set():
+        shutdown_all()
+        sys.exit(0)
+
+    frame_bus = FrameBus.create(FRAME_BUS_NAME, (480, 640, 3), slots=FRAME_BUS_SLOTS)
+    print(f'🧩 帧总线已创建: {FRAME_BUS_NAME}（其他进程可零拷贝读取摄像头画面）')
+
+    # 采集 / 编码 / 网络 各自独立线程，通过帧总线、单槽最新值缓冲和音频 FIFO 连接
+    for target in (mic_capture_loop, camera_capture_loop, encode_loop, network_loop):
+        thread = threading.Thread(target=target, name=target.__name__, daemon=True)
+        thread.start()
+        worker_threads.append(thread)
+
+    # 主线程只负责显示和键盘事件（OpenCV 窗口必须在主线程操作）
     display_interval = 1.0 / DISPLAY_FPS  # 每帧间隔时间 (基于配置的FPS)
-    
-    while True:
-        if mic_stream and video_cap:
-            # 先发送音频数据（使用更小的缓冲区以提高循环频率）
-            # 800字节 = 25ms音频数据 (16000Hz * 2bytes * 0.025s)
-            audio_data = mic_stream.read(800, exception_on_overflow=False)
-            audio_b64 = base64.b64encode(audio_data).decode('ascii')
-            conversation.append_audio(audio_b64)
-            
-            #  按照60fps频率读取并显示视频帧
-            current_display_time = time.time()
-            if current_display_time - last_display_time >= display_interval:
-                ret, frame = video_cap.read()
-                if ret:
-                    display_video_frame(frame)
-                    frame_count += 1
-                last_display_time = current_display_time
-            
-            #  按照固定间隔（2fps）发送视频帧到AI
-            current_time = time.time() * 1000
-            if current_time - last_photo_time >= FRAME_INTERVAL_MS:
-                result = capture_and_encode_frame()
-                if result:
-                    try:
-                        frame_b64, _ = result
-                        # 使用append_video方法发送视频帧
-                        conversation.append_video(frame_b64)
-                        last_photo_time = current_time
-                        print("#", end="", flush=True)  # 显示视频帧发送进度
-                    except Exception as e:
-                        print(f"\nError sending video frame: {e}")
-            
-            #  处理键盘事件（必须每次循环都执行，保持窗口流畅）
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('q'):
-                print("\n按下 'q' 键，正在退出...")
-                conversation.close()
-                b64_player.shutdown()
-                cleanup_video()
-                sys.exit(0)
-        else:
-            break
\ No newline at end of file
+    last_seq = 0
+    item = frame = None
+    while not stop_event.is_set():
+        item = frame_bus.wait_next(last_seq, timeout=display_interval)
+        if item is not None:
+            last_seq, _, frame = item
+            display_video_frame(frame)
+
+        #  处理键盘事件（必须每次循环都执行，保持窗口流畅）
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord('q'):
+            print("\n按下 'q' 键，正在退出...")
+            break
+
+    # 释放帧总线的零拷贝视图后再关闭总线
+    item = frame = None
+    shutdown_all()
+    print('omni realtime stopped.')
+    sys.exit(0)
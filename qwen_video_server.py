@@ -7,16 +7,26 @@ Qwen-Omni 视频服务 API
 
 from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
+from flask_sock import Sock
 import os
 import base64
+import json
 import logging
+import math
 import threading
-import queue
 import time
-import cv2
-import numpy as np
+import uuid
 from dashscope.audio.qwen_omni import *
 import dashscope
+from frame_transcode_pool import TranscodeBusy, get_transcode_pool
+from video_frame_utils import RESOLUTION_HEIGHTS
+from video_jobs import JobManager, FINAL_STATUSES, format_ts
+from video_keyframes import KEYFRAME_MODES, extract_keyframes_from_file
+from upload_spool import UPLOAD_MAX_FRAME_BYTES, install_upload_limits, upload_path
+from response_cache import ResponseCache, phash
+from audio_gate import AudioGate, trim_silence
+from audio_transcode import StreamingAudioDecoder, decode_to_pcm16k, detect_container, stream_start_format
+from event_broadcast import EventBroadcaster, PING
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -24,9 +34,14 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
+sock = Sock(app)
+install_upload_limits(app, endpoint_limits={'send_video': UPLOAD_MAX_FRAME_BYTES})  # 上传流式落盘 + 大小上限
 
 # Dashscope API 配置
 dashscope.api_key = os.getenv('DASHSCOPE_API_KEY') or "sk-c5c3e296dfc74fb9bef2fa4481b7cd78"
+# Realtime 服务地址，未设置时连接 DashScope；离线联调/压测可指向 mock_omni_server.py
+# 例如 QWEN_OMNI_REALTIME_URL=ws://127.0.0.1:8765/api-ws/v1/realtime
+OMNI_REALTIME_URL = os.getenv('QWEN_OMNI_REALTIME_URL') or None
 
 # 全局配置
 OUTPUT_DIR = "./qwen_output"
@@ -34,7 +49,34 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # 视频配置
 FRAME_INTERVAL_MS = 500  # 发送帧率: 2fps (500ms间隔)
-VIDEO_RESOLUTION = '480p'  # 固定使用480p
+VIDEO_RESOLUTION = '480p'  # 默认目标分辨率，创建会话时可用 resolution 参数指定（360p/480p/720p/1080p）
+KEYFRAME_MAX_FRAMES = 8  # 片段模式（analyze-video 的 mode=scene/uniform）最多发送的关键帧数
+ANALYSIS_TIMEOUT_S = 30  # analyze-video 等待回答的时间
+
+# analyze-video 响应缓存（画面感知哈希 + 问题），看板轮询画面不变的摄像头时直接返回上次回答
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE', '1') != '0'  # RESPONSE_CACHE=0 关闭
+RESPONSE_CACHE_TTL_S = float(os.getenv('RESPONSE_CACHE_TTL_S', 30))  # 回答有效期
+RESPONSE_CACHE_MAX_ENTRIES = 256  # 条目上限，超出按 LRU 淘汰
+RESPONSE_CACHE_MAX_DISTANCE = 4  # 感知哈希汉明距离容差（64 位）：噪声 / 亮度微调通常 ≤2，画面中出现新物体常 ≥5
+
+# 上传音频的本地 VAD（上游服务端 VAD 已关闭）：会话音频只转发语音段，analyze-video 裁掉首尾静音
+AUDIO_VAD_ENABLED = os.getenv('AUDIO_VAD', '1') != '0'  # AUDIO_VAD=0 关闭，音频原样转发
+AUDIO_VAD_MODE = 2  # WebRTC VAD 灵敏度 0~3，越大越严格
+AUDIO_VAD_HANGOVER_MS = 600  # 静音持续多久判定语音结束
+AUDIO_AUTO_COMMIT = os.getenv('AUDIO_AUTO_COMMIT', '1') != '0'  # 语音结束时自动提交输入并生成回复（创建会话时可用 auto_commit 覆盖）
+
+SESSION_EVENT_BUFFER = 256  # 每个事件订阅者最多积压的事件数，超出即断开该订阅者（慢消费者）
+
+# 后台任务配置（/api/jobs）
+JOB_DIR = os.path.join(OUTPUT_DIR, "jobs")  # 任务状态持久化目录，重启后恢复未完成任务
+JOB_WORKERS = 2  # 同时执行的任务数
+JOB_SEGMENT_WORKERS = 4  # 同时分析的片段数（上游会话数上限）
+JOB_SEGMENT_SECONDS = 30  # 默认片段时长
+JOB_SEGMENT_FRAMES = 4  # 每个片段的关键帧数
+JOB_SEGMENT_TIMEOUT_S = 60  # 单个片段等待回答的时间
+JOB_MAX_QUEUED = 16  # 未完成任务数上限
+
+response_cache = ResponseCache(RESPONSE_CACHE_TTL_S, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_DISTANCE)
 
 # 会话管理
 sessions = {}  # 存储活动会话
@@ -44,11 +86,19 @@ session_lock = threading.Lock()
 class VideoAnalysisSession:
     """视频分析会话类"""
 
-    def __init__(self, session_id, instructions="你是一个智能视频分析助手"):
+    def __init__(self, session_id, instructions="你是一个智能视频分析助手", resolution=VIDEO_RESOLUTION,
+                 auto_commit=AUDIO_AUTO_COMMIT):
         self.session_id = session_id
         self.instructions = instructions
+        self.resolution = resolution
+        self.max_height = RESOLUTION_HEIGHTS[resolution]  # 上传帧缩放到的目标高度
+        self.auto_commit = auto_commit
+        self.audio_gate = None  # 本地 VAD 门控，首次通过 /audio 上传音频时创建
+        self.audio_decoder = None  # 压缩音频（webm/ogg 等）的流式解码器，上传带容器头的音频时创建
+        self.audio_format = None  # 最近一段录音的容器格式：会话在上传压缩音频，之后不带头的片段不能当作 PCM
+        self.audio_lock = threading.Lock()  # 保证分片音频按顺序解码
         self.conversation = None
-        self.response_queue = queue.Queue()
+        self.events = EventBroadcaster(SESSION_EVENT_BUFFER)  # 回复事件广播给所有订阅者（SSE / WebSocket / analyze_frames）
         self.is_active = False
         self.last_response = ""
         self.last_transcript = ""
@@ -67,6 +117,7 @@ class VideoAnalysisSession:
             self.conversation = OmniRealtimeConversation(
                 model='qwen3-omni-flash-realtime',
                 callback=callback,
+                url=OMNI_REALTIME_URL,
             )
 
             # 建立连接
@@ -120,14 +171,14 @@ class VideoAnalysisSession:
                     elif event_type == 'response.audio_transcript.delta':
                         delta = response.get('delta', '')
                         session.last_response += delta
-                        session.response_queue.put({
+                        session.events.publish({
                             'type': 'delta',
                             'text': delta
                         })
 
                     elif event_type == 'response.done':
                         logger.info("响应完成")
-                        session.response_queue.put({
+                        session.events.publish({
                             'type': 'done',
                             'text': session.last_response
                         })
@@ -160,15 +211,65 @@ class VideoAnalysisSession:
                 return False
         return False
 
-    def get_response(self, timeout=1.0):
-        """获取响应"""
-        try:
-            return self.response_queue.get(timeout=timeout)
-        except queue.Empty:
-            return None
+    def get_audio_gate(self):
+        """
+        /audio 上传音频的 VAD 门控：只转发语音段，语音结束时按 auto_commit 提交；未启用本地 VAD 时返回 None
+        按需创建，调用方须持有 self.audio_lock（同一会话的并发上传只会创建一个门控）
+        """
+        if self.audio_gate is None and AUDIO_VAD_ENABLED:
+            self.audio_gate = AudioGate(self.send_audio, self.commit if self.auto_commit else None,
+                                        AUDIO_VAD_MODE, hangover_ms=AUDIO_VAD_HANGOVER_MS)
+        return self.audio_gate
+
+    def decode_audio(self, data, end=False):
+        """
+        上传的音频片段 → 16kHz 单声道 PCM（调用方持有 self.audio_lock）
+
+        带容器头的片段（Ogg 为带 BOS 标志的页）开始一段新的录音（结束旧的解码器），后续不带头的片段交给同一个解码器继续解码；
+        没有解码器时视为原始 PCM 原样返回；但会话已在上传压缩音频（解码器因出错或 end=True 被重置）时，
+        不带头的片段（如 WebM 的 Cluster、Ogg 续页）无法解码，拒绝而不是当作 PCM 转发噪声。
+        end=True 时解码剩余数据并结束这段录音
+        """
+        pcm = b""
+        container_format = stream_start_format(data)
+        if container_format is None and self.audio_decoder is None and (self.audio_format or detect_container(data)):
+            raise ValueError("音频片段不是录音的开头（缺少容器头），请从第一个片段开始上传")
+        if container_format:
+            if self.audio_decoder:
+                try:
+                    pcm += self.audio_decoder.close()
+                except Exception as e:
+                    logger.warning(f"上一段录音的解码器结束失败: {e}")
+            self.audio_decoder = StreamingAudioDecoder(container_format)
+            self.audio_format = container_format
+        if self.audio_decoder is None:
+            return data
+        pcm += self.audio_decoder.feed(data)
+        if end:
+            pcm += self.audio_decoder.close()
+            self.audio_decoder = None
+        return pcm
+
+    def commit(self):
+        """提交已发送的音频 / 视频并请求生成回复（上游未开启服务端 VAD，需要手动提交）"""
+        if self.conversation and self.is_active:
+            try:
+                self.conversation.commit()
+                self.conversation.create_response()
+                logger.info(f"会话 {self.session_id} 语音结束，已提交输入")
+                return True
+            except Exception as e:
+                logger.error(f"提交输入失败: {e}")
+        return False
 
     def close(self):
         """关闭会话"""
+        self.events.close()
+        if self.audio_decoder:
+            try:
+                self.audio_decoder.close(timeout=0)
+            except Exception:
+                pass
         if self.conversation:
             try:
                 self.conversation.close()
@@ -178,85 +279,88 @@ class VideoAnalysisSession:
                 logger.error(f"关闭会话失败: {e}")
 
 
-def process_video_frame(frame_data):
-    """
-    处理视频帧数据
-    frame_data: Base64 编码的图像数据、原始图像字节或视频文件
-    返回: 调整大小并压缩的 Base64 编码 JPEG
+def analyze_frames(frames, instructions, audio_b64=None, timeout=ANALYSIS_TIMEOUT_S):
     """
-    try:
-        # 如果是 Base64 字符串，先解码
-        if isinstance(frame_data, str):
-            img_bytes = base64.b64decode(frame_data)
-        else:
-            img_bytes = frame_data
-
-        logger.info(f"处理视频帧，数据大小: {len(img_bytes)} bytes")
+    在临时会话上分析一组视频帧（按顺序发送后手动提交），等待完整回答
 
-        # 先尝试作为图像解码
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        # 如果无法作为图像解码，尝试作为视频处理
-        if frame is None:
-            logger.info("尝试作为视频文件处理...")
-            # 保存临时文件
-            temp_video_path = os.path.join(OUTPUT_DIR, f"temp_video_{os.getpid()}.webm")
-            with open(temp_video_path, 'wb') as f:
-                f.write(img_bytes)
+    :param frames: Base64 JPEG 列表
+    :return: (回答文本, 语音转录)，超时回答为空字符串；会话启动失败返回 None
+    """
+    temp_session_id = f"temp_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
+    session = VideoAnalysisSession(temp_session_id, instructions)
+    if not session.start():
+        return None
 
-            # 使用 OpenCV 读取视频的第一帧
-            cap = cv2.VideoCapture(temp_video_path)
-            ret, frame = cap.read()
-            cap.release()
+    with session_lock:
+        sessions[temp_session_id] = session
+    subscriber = session.events.subscribe("analyze")
+    try:
+        # 发送视频帧
+        logger.info(f"发送 {len(frames)} 帧视频到 Qwen-Omni...")
+        for frame_b64 in frames:
+            session.send_video_frame(frame_b64)
 
-            # 清理临时文件
-            try:
-                os.remove(temp_video_path)
-            except:
-                pass
+        # 如果有音频，发送音频（注意：我们禁用了音频转录）
+        if audio_b64:
+            logger.info("发送音频数据...")
+            session.send_audio(audio_b64)
 
-            if not ret or frame is None:
-                logger.error("无法从视频中提取帧")
-                return None
+        # 手动提交输入（触发 AI 响应）
+        # 因为我们禁用了 VAD，所以需要手动 commit
+        logger.info("手动提交输入，触发 AI 响应...")
+        try:
+            if hasattr(session.conversation, 'commit_input'):
+                session.conversation.commit_input()
+            else:
+                # 如果没有 commit_input 方法，尝试发送一个空的用户消息来触发响应
+                session.conversation.create_response()
+        except Exception as e:
+            logger.warning(f"提交输入时出错: {e}")
 
-            logger.info(f"成功从视频提取帧，尺寸: {frame.shape}")
+        # 等待响应
+        logger.info("等待 AI 响应...")
+        start_time = time.time()
+        full_response = ""
 
-        if frame is None:
-            logger.error("帧为空")
-            return None
+        while time.time() - start_time < timeout:
+            message = subscriber.get(timeout=1.0)
+            if message:
+                response = message.event
+                logger.info(f"收到响应: {response['type']}")
+                if response['type'] == 'delta':
+                    full_response += response['text']
+                elif response['type'] == 'done':
+                    full_response = response['text']
+                    logger.info(f"响应完成，总长度: {len(full_response)}")
+                    break
 
-        # 调整分辨率（最大720p）
-        height, width = frame.shape[:2]
-        if height > 720:
-            scale = 720.0 / height
-            new_width = int(width * scale)
-            new_height = 720
-            frame = cv2.resize(frame, (new_width, new_height))
+        if not full_response:
+            logger.warning(f"超时未收到响应（等待了 {time.time() - start_time:.1f} 秒）")
+        return full_response, session.last_transcript
 
-        # 编码为 JPEG
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 70]
-        success, encoded_img = cv2.imencode('.jpg', frame, encode_param)
+    finally:
+        # 清理临时会话
+        with session_lock:
+            session.close()
+            sessions.pop(temp_session_id, None)
 
-        if not success:
-            return None
 
-        # 检查大小是否超过 500KB
-        img_size = len(encoded_img.tobytes())
-        if img_size > 500 * 1024:  # 500KB
-            # 降低质量重新编码
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 50]
-            success, encoded_img = cv2.imencode('.jpg', frame, encode_param)
-            if not success:
-                return None
+def analyze_job_segment(keyframes, job, segment):
+    """后台任务的片段分析函数（见 video_jobs.JobManager）"""
+    span = f"{format_ts(segment['start'])}-{format_ts(segment['end']) if segment['end'] is not None else '结尾'}"
+    instructions = (f"用户问题: {job['question']}\n"
+                    f"这是视频 {span} 的片段，关键帧按时间顺序给出，时间点（秒）: "
+                    + ", ".join(f"{t:.1f}" for t, _ in keyframes))
+    result = analyze_frames([frame_b64 for _, frame_b64 in keyframes], instructions, timeout=JOB_SEGMENT_TIMEOUT_S)
+    if result is None:
+        raise RuntimeError("会话创建失败")
+    if not result[0]:
+        raise TimeoutError(f"{JOB_SEGMENT_TIMEOUT_S} 秒内未收到回答")
+    return result[0]
 
-        # Base64 编码
-        img_b64 = base64.b64encode(encoded_img.tobytes()).decode('ascii')
-        return img_b64
 
-    except Exception as e:
-        logger.error(f"视频帧处理错误: {e}")
-        return None
+job_manager = JobManager(JOB_DIR, analyze_job_segment, workers=JOB_WORKERS,
+                         segment_workers=JOB_SEGMENT_WORKERS, max_queued=JOB_MAX_QUEUED)
 
 
 @app.route('/health', methods=['GET'])
@@ -270,7 +374,10 @@ def health_check():
             "audio_input": "Supported",
             "text_output": "Supported"
         },
-        "active_sessions": len(sessions)
+        "active_sessions": len(sessions),
+        "event_subscribers": sum(len(session.events.subscribers) for session in list(sessions.values())),
+        "transcode": get_transcode_pool().status(),
+        "response_cache": response_cache.metrics() if RESPONSE_CACHE_ENABLED else None
     })
 
 
@@ -280,12 +387,16 @@ def create_session():
     try:
         data = request.get_json() or {}
         instructions = data.get('instructions', '你是一个智能视频分析助手，可以理解视频内容并回答相关问题。')
+        resolution = data.get('resolution', VIDEO_RESOLUTION)
+        if resolution not in RESOLUTION_HEIGHTS:
+            return jsonify({"error": f"不支持的分辨率: {resolution}，可选 {list(RESOLUTION_HEIGHTS)}"}), 400
+        auto_commit = bool(data.get('auto_commit', AUDIO_AUTO_COMMIT))
 
         # 生成会话 ID
-        session_id = f"session_{int(time.time() * 1000)}"
+        session_id = f"session_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
 
         # 创建会话
-        session = VideoAnalysisSession(session_id, instructions)
+        session = VideoAnalysisSession(session_id, instructions, resolution, auto_commit)
 
         if session.start():
             with session_lock:
@@ -293,6 +404,8 @@ def create_session():
 
             return jsonify({
                 "session_id": session_id,
+                "resolution": resolution,
+                "auto_commit": auto_commit if AUDIO_VAD_ENABLED else False,
                 "status": "created",
                 "message": "会话创建成功"
             })
@@ -337,21 +450,25 @@ def send_video(session_id):
         if not session:
             return jsonify({"error": "会话不存在"}), 404
 
-        # 获取视频帧数据
+        # 获取视频帧数据并处理（转码池，限制每个会话的在途帧数）
+        transcode_pool = get_transcode_pool()
         if 'video' in request.files:
-            video_file = request.files['video']
-            frame_data = video_file.read()
+            # 上传已落盘，转码时直接读取文件，不读入内存
+            with upload_path(request.files['video']) as path:
+                future = transcode_pool.submit(None, session_id, session.max_height, path=path)
+                processed_frame = transcode_pool.result(future) if future is not None else None
         elif request.is_json:
             data = request.get_json()
             frame_b64 = data.get('frame')
             if not frame_b64:
                 return jsonify({"error": "没有提供视频帧"}), 400
-            frame_data = frame_b64
+            future = transcode_pool.submit(frame_b64, session_id, session.max_height)
+            processed_frame = transcode_pool.result(future) if future is not None else None
         else:
             return jsonify({"error": "无效的请求格式"}), 400
 
-        # 处理视频帧
-        processed_frame = process_video_frame(frame_data)
+        if future is None:
+            return jsonify({"error": "该会话待处理的视频帧过多，请降低发送帧率"}), 429
         if not processed_frame:
             return jsonify({"error": "视频帧处理失败"}), 500
 
@@ -366,6 +483,9 @@ def send_video(session_id):
                 "error": "发送视频帧失败"
             }), 500
 
+    except TranscodeBusy as e:
+        logger.warning(f"视频帧转码繁忙: {e}")
+        return jsonify({"error": f"服务繁忙，请稍后重试（{e}）"}), 503
     except Exception as e:
         logger.error(f"发送视频错误: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
@@ -373,7 +493,12 @@ def send_video(session_id):
 
 @app.route('/api/session/<session_id>/audio', methods=['POST'])
 def send_audio(session_id):
-    """发送音频到会话"""
+    """
+    发送音频到会话：16kHz 单声道 16-bit PCM，或 webm/ogg 等压缩音频（MediaRecorder 分片依次上传，服务端流式解码）
+
+    启用本地 VAD 时只转发语音段，静音块被丢弃（status 为 dropped）；语音结束时按会话的 auto_commit 自动提交。
+    end=1 表示本轮音频结束，立即结束当前语音段
+    """
     try:
         session = sessions.get(session_id)
         if not session:
@@ -383,25 +508,50 @@ def send_audio(session_id):
         if 'audio' in request.files:
             audio_file = request.files['audio']
             audio_data = audio_file.read()
-            audio_b64 = base64.b64encode(audio_data).decode('ascii')
+            end = request.form.get('end', '0').lower() in ('1', 'true')
         elif request.is_json:
             data = request.get_json()
-            audio_b64 = data.get('audio')
-            if not audio_b64:
+            if not data.get('audio'):
                 return jsonify({"error": "没有提供音频"}), 400
+            audio_data = base64.b64decode(data['audio'])
+            end = str(data.get('end', '0')).lower() in ('1', 'true')
         else:
             return jsonify({"error": "无效的请求格式"}), 400
 
-        # 发送到 Qwen-Omni
-        if session.send_audio(audio_b64):
-            return jsonify({
-                "status": "sent",
-                "message": "音频已发送"
-            })
-        else:
-            return jsonify({
-                "error": "发送音频失败"
-            }), 500
+        if not session.is_active:
+            return jsonify({"error": "发送音频失败"}), 500
+
+        with session.audio_lock:
+            try:
+                pcm = session.decode_audio(audio_data, end)
+            except Exception as e:  # 损坏的数据、容器中没有音频流等
+                session.audio_decoder = None
+                return jsonify({"error": f"音频解码失败: {e}"}), 400
+
+            gate = session.get_audio_gate()
+            if gate is None:
+                # 未启用本地 VAD：原样转发
+                if pcm and not session.send_audio(base64.b64encode(pcm).decode('ascii')):
+                    return jsonify({"error": "发送音频失败"}), 500
+                return jsonify({
+                    "status": "sent",
+                    "message": "音频已发送",
+                    "pcm_bytes": len(pcm)
+                })
+
+            result = gate.feed(pcm)
+            if end:
+                # 录音结束：合并 flush 转发的尾部语音和结束的语音段
+                tail = gate.flush()
+                result["forwarded_bytes"] += tail["forwarded_bytes"]
+                result["segments_ended"] += tail["segments_ended"]
+                result["speech"] = False
+        return jsonify({
+            "status": "sent" if result["forwarded_bytes"] else "dropped",
+            "message": "音频已发送" if result["forwarded_bytes"] else "静音，未发送",
+            "pcm_bytes": len(pcm),
+            **result
+        })
 
     except Exception as e:
         logger.error(f"发送音频错误: {e}", exc_info=True)
@@ -410,21 +560,24 @@ def send_audio(session_id):
 
 @app.route('/api/session/<session_id>/response', methods=['GET'])
 def get_response(session_id):
-    """获取会话响应（流式）"""
+    """获取会话响应（SSE 流式），可同时有多个订阅者，每个订阅者都收到全部事件"""
     try:
         session = sessions.get(session_id)
         if not session:
             return jsonify({"error": "会话不存在"}), 404
+        subscriber = session.events.subscribe("sse")
 
         def generate():
-            """生成流式响应"""
-            while session.is_active:
-                response = session.get_response(timeout=0.5)
-                if response:
-                    yield f"data: {jsonify(response).get_data(as_text=True)}\n\n"
-                else:
-                    # 发送心跳
-                    yield f"data: {jsonify({'type': 'ping'}).get_data(as_text=True)}\n\n"
+            """生成流式响应（事件已在发布时序列化为 SSE 帧）"""
+            try:
+                while session.is_active:
+                    message = subscriber.get(timeout=0.5)
+                    # 超时发送心跳
+                    yield (message or PING).sse
+            except EOFError:
+                pass
+            finally:
+                subscriber.close()
 
         return Response(generate(), mimetype='text/event-stream')
 
@@ -433,13 +586,39 @@ def get_response(session_id):
         return jsonify({"error": str(e)}), 500
 
 
+@sock.route('/ws/session/<session_id>/events')
+def session_events_ws(ws, session_id):
+    """通过 WebSocket 订阅会话响应事件（与 SSE 订阅者共享同一份序列化结果）"""
+    session = sessions.get(session_id)
+    if not session:
+        ws.send(json.dumps({"type": "error", "message": "会话不存在"}))
+        return
+    subscriber = session.events.subscribe("ws")
+    try:
+        while session.is_active:
+            message = subscriber.get(timeout=5.0)
+            ws.send((message or PING).text)
+    except EOFError:
+        pass
+    except Exception as e:
+        logger.info(f"会话 {session_id} 的 WebSocket 订阅结束: {e}")
+    finally:
+        subscriber.close()
+
+
 @app.route('/api/analyze-video', methods=['POST'])
 def analyze_video():
     """
     一次性视频分析 API（简化版）
     上传视频帧 + 可选音频，返回分析结果
+
+    mode（FormData 字段）:
+        frame    只取第一帧（默认）
+        scene    解码整个片段，按场景切换选取关键帧
+        uniform  解码整个片段，均匀选取关键帧
+    max_frames: 片段模式的关键帧预算（不超过 KEYFRAME_MAX_FRAMES）
+    no_cache: 为 1 时跳过响应缓存，强制重新分析（带音频的请求不使用缓存）
     """
-    temp_session_id = None
     try:
         logger.info(f"收到视频分析请求")
         logger.info(f"Content-Type: {request.content_type}")
@@ -448,102 +627,204 @@ def analyze_video():
         logger.info(f"Files keys: {list(request.files.keys())}")
 
         # 获取参数
+        keyframes = []  # 片段模式: [(时间戳秒, Base64 JPEG)]
+        mode = 'frame'
         if request.is_json:
             data = request.get_json()
             frame_b64 = data.get('frame')
             audio_b64 = data.get('audio')
             question = data.get('question', '请描述这个视频中的内容')
+            no_cache = str(data.get('no_cache', '0')).lower() in ('1', 'true')
             logger.info("使用 JSON 格式")
         else:
             frame_b64 = None
             audio_b64 = None
             question = request.form.get('question', '请描述这个视频中的内容')
-            logger.info(f"使用 FormData 格式，question: {question}")
+            mode = request.form.get('mode', 'frame')
+            no_cache = request.form.get('no_cache', '0').lower() in ('1', 'true')
+            logger.info(f"使用 FormData 格式，question: {question}, mode: {mode}")
+            if mode != 'frame' and mode not in KEYFRAME_MODES:
+                return jsonify({"error": f"不支持的 mode: {mode}，可选 {['frame', *KEYFRAME_MODES]}"}), 400
+            try:
+                max_frames = max(1, min(int(request.form.get('max_frames', KEYFRAME_MAX_FRAMES)), KEYFRAME_MAX_FRAMES))
+            except ValueError:
+                return jsonify({"error": f"max_frames 必须是整数: {request.form.get('max_frames')}"}), 400
 
             if 'video' in request.files:
                 video_file = request.files['video']
-                logger.info(f"收到视频文件: {video_file.filename}, 大小: {video_file.content_length}")
-                frame_data = video_file.read()
-                logger.info(f"读取视频数据: {len(frame_data)} bytes")
-                frame_b64 = process_video_frame(frame_data)
-                logger.info(f"处理后的 Base64 长度: {len(frame_b64) if frame_b64 else 0}")
+                logger.info(f"收到视频文件: {video_file.filename}")
+                # 上传已流式落盘，解码器直接打开文件路径
+                with upload_path(video_file) as path:
+                    logger.info(f"视频数据: {os.path.getsize(path)} bytes")
+                    if mode == 'frame':
+                        frame_b64 = get_transcode_pool().transcode(None, RESOLUTION_HEIGHTS[VIDEO_RESOLUTION], path=path)
+                        logger.info(f"处理后的 Base64 长度: {len(frame_b64) if frame_b64 else 0}")
+                    else:
+                        keyframes = extract_keyframes_from_file(path, max_frames, mode, RESOLUTION_HEIGHTS[VIDEO_RESOLUTION])
+                        frame_b64 = keyframes[0][1] if keyframes else None
 
             if 'audio' in request.files:
                 audio_file = request.files['audio']
                 logger.info(f"收到音频文件: {audio_file.filename}")
-                audio_data = audio_file.read()
-                audio_b64 = base64.b64encode(audio_data).decode('ascii')
+                audio_b64 = base64.b64encode(audio_file.read()).decode('ascii')
 
         if not frame_b64:
             logger.error("没有提供视频帧或视频处理失败")
             return jsonify({"error": "没有提供视频帧或视频处理失败"}), 400
 
-        # 创建临时会话
-        temp_session_id = f"temp_{int(time.time() * 1000)}"
-        session = VideoAnalysisSession(temp_session_id, f"用户问题: {question}")
+        instructions = f"用户问题: {question}"
+        if len(keyframes) > 1:
+            instructions += "\n视频关键帧按时间顺序给出，时间点（秒）: " + ", ".join(f"{t:.1f}" for t, _ in keyframes)
+        frames = [keyframe_b64 for _, keyframe_b64 in keyframes] or [frame_b64]
 
-        if not session.start():
+        if audio_b64:
+            # 压缩音频（webm/ogg 等）解码为上游要求的 16kHz 单声道 PCM
+            audio_data = base64.b64decode(audio_b64)
+            container_format = detect_container(audio_data)
+            if container_format:
+                try:
+                    pcm = decode_to_pcm16k(audio_data, container_format)
+                except Exception as e:  # 损坏的数据、容器中没有音频流等
+                    return jsonify({"error": f"音频解码失败: {e}"}), 400
+                logger.info(f"音频解码（{container_format}）: {len(audio_data)} → {len(pcm)} bytes PCM")
+                audio_b64 = base64.b64encode(pcm).decode('ascii') if pcm else None
+
+        # 裁掉音频首尾静音，整段没有语音时不发送音频（此时可以使用响应缓存）
+        if audio_b64 and AUDIO_VAD_ENABLED:
+            audio_data = base64.b64decode(audio_b64)
+            trimmed = trim_silence(audio_data, AUDIO_VAD_MODE, hangover_ms=AUDIO_VAD_HANGOVER_MS)
+            logger.info(f"音频静音裁剪: {len(audio_data)} → {len(trimmed)} bytes")
+            audio_b64 = base64.b64encode(trimmed).decode('ascii') if trimmed else None
+
+        # 响应缓存：按处理后帧的感知哈希查找，指令（含关键帧时间点）必须相同；音频内容无法比较，带音频或有纯色帧时不缓存
+        hashes = None
+        if RESPONSE_CACHE_ENABLED and not audio_b64:
+            hashes = [phash(frame) for frame in frames]
+            if None in hashes:
+                hashes = None
+        if hashes and not no_cache:
+            hit = response_cache.lookup(hashes, question, instructions)
+            if hit:
+                logger.info(f"响应缓存命中: 距离 {hit['distance']}, 缓存时间 {hit['age_s']}s")
+                return jsonify({
+                    "analysis": hit["response"]["analysis"],
+                    "transcript": hit["response"]["transcript"],
+                    "keyframes": [t for t, _ in keyframes],
+                    "cached": True,
+                    "cache": {"distance": hit["distance"], "age_s": hit["age_s"], **response_cache.metrics()}
+                })
+
+        t0 = time.perf_counter()
+        result = analyze_frames(frames, instructions, audio_b64)
+        if result is None:
             return jsonify({"error": "会话创建失败"}), 500
+        full_response, transcript = result
+        if hashes and full_response:
+            response_cache.store(hashes, question, {"analysis": full_response, "transcript": transcript},
+                                 instructions, latency_ms=(time.perf_counter() - t0) * 1000)
 
-        with session_lock:
-            sessions[temp_session_id] = session
+        return jsonify({
+            "analysis": full_response or "未收到分析结果，请检查视频和问题",
+            "transcript": transcript,
+            "keyframes": [t for t, _ in keyframes],
+            "cached": False,
+            "cache": response_cache.metrics() if hashes else None
+        })
 
-        # 发送视频帧
-        logger.info("发送视频帧到 Qwen-Omni...")
-        session.send_video_frame(frame_b64)
+    except TranscodeBusy as e:
+        logger.warning(f"视频帧转码繁忙: {e}")
+        return jsonify({"error": f"服务繁忙，请稍后重试（{e}）"}), 503
+    except Exception as e:
+        logger.error(f"视频分析错误: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
 
-        # 如果有音频，发送音频（注意：我们禁用了音频转录）
-        if audio_b64:
-            logger.info("发送音频数据...")
-            session.send_audio(audio_b64)
 
-        # 手动提交输入（触发 AI 响应）
-        # 因为我们禁用了 VAD，所以需要手动 commit
-        logger.info("手动提交输入，触发 AI 响应...")
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    提交长视频分析任务（FormData: video, question, mode=scene|uniform, segment_seconds, max_frames）
+    立即返回 job_id，之后通过 GET /api/jobs/<id> 轮询或 GET /api/jobs/<id>/events 订阅进度
+    """
+    try:
+        if 'video' not in request.files:
+            return jsonify({"error": "没有提供视频文件"}), 400
+        video_file = request.files['video']
+        question = request.form.get('question', '请描述这个视频中的内容')
+        mode = request.form.get('mode', 'scene')
+        if mode not in KEYFRAME_MODES:
+            return jsonify({"error": f"不支持的 mode: {mode}，可选 {list(KEYFRAME_MODES)}"}), 400
         try:
-            if hasattr(session.conversation, 'commit_input'):
-                session.conversation.commit_input()
-            else:
-                # 如果没有 commit_input 方法，尝试发送一个空的用户消息来触发响应
-                session.conversation.create_response()
-        except Exception as e:
-            logger.warning(f"提交输入时出错: {e}")
+            segment_seconds = float(request.form.get('segment_seconds', JOB_SEGMENT_SECONDS))
+            max_frames = max(1, min(int(request.form.get('max_frames', JOB_SEGMENT_FRAMES)), KEYFRAME_MAX_FRAMES))
+        except ValueError:
+            return jsonify({"error": "segment_seconds 必须是数字，max_frames 必须是整数"}), 400
+        if not math.isfinite(segment_seconds):
+            return jsonify({"error": f"无效的 segment_seconds: {segment_seconds}"}), 400
+        segment_seconds = max(5.0, segment_seconds)
+        suffix = os.path.splitext(video_file.filename or '')[1].lower() or '.webm'
+
+        job = job_manager.submit(video_file.stream, question, mode, max_frames, segment_seconds,
+                                 RESOLUTION_HEIGHTS[VIDEO_RESOLUTION], suffix)
+        if job is None:
+            return jsonify({"error": "未完成的任务过多，请稍后再试"}), 429
+        return jsonify({"job_id": job["job_id"], "status": job["status"]}), 202
 
-        # 等待响应（最多 30 秒）
-        logger.info("等待 AI 响应...")
-        timeout = 30
-        start_time = time.time()
-        full_response = ""
+    except Exception as e:
+        logger.error(f"提交任务错误: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
 
-        while time.time() - start_time < timeout:
-            response = session.get_response(timeout=1.0)
-            if response:
-                logger.info(f"收到响应: {response['type']}")
-                if response['type'] == 'delta':
-                    full_response += response['text']
-                elif response['type'] == 'done':
-                    full_response = response['text']
-                    logger.info(f"响应完成，总长度: {len(full_response)}")
-                    break
 
-        if not full_response:
-            logger.warning(f"超时未收到响应（等待了 {time.time() - start_time:.1f} 秒）")
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """列出全部任务（摘要）"""
+    return jsonify({"jobs": job_manager.list()})
 
-        return jsonify({
-            "analysis": full_response or "未收到分析结果，请检查视频和问题",
-            "transcript": session.last_transcript
-        })
 
-    except Exception as e:
-        logger.error(f"视频分析错误: {e}", exc_info=True)
-        return jsonify({"error": str(e)}), 500
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态、各片段进度和结果"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify(job)
 
-    finally:
-        # 清理临时会话
-        if temp_session_id and temp_session_id in sessions:
-            with session_lock:
-                sessions[temp_session_id].close()
-                del sessions[temp_session_id]
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """订阅任务进度（SSE），每次状态变化推送完整状态，任务结束后关闭"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "任务不存在"}), 404
+
+    def generate():
+        current = job
+        yield f"data: {json.dumps(current, ensure_ascii=False)}\n\n"
+        while current and current["status"] not in FINAL_STATUSES:
+            latest = job_manager.wait(job_id, current["version"])
+            if latest and latest["version"] > current["version"]:
+                yield f"data: {json.dumps(latest, ensure_ascii=False)}\n\n"
+            else:
+                # 发送心跳
+                yield f"data: {json.dumps({'type': 'ping'})}\n\n"
+            current = latest
+
+    return Response(generate(), mimetype='text/event-stream')
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消任务（正在分析的片段完成后停止）"""
+    if not job_manager.cancel(job_id):
+        return jsonify({"error": "任务不存在或已结束"}), 404
+    return jsonify({"job_id": job_id, "status": "cancelling"})
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """删除已结束任务的记录"""
+    if not job_manager.delete(job_id):
+        return jsonify({"error": "任务不存在或尚未结束"}), 404
+    return jsonify({"job_id": job_id, "status": "deleted"})
 
 
 if __name__ == '__main__':
@@ -554,6 +835,8 @@ if __name__ == '__main__':
     logger.info("✅ 服务启动成功！")
     logger.info("📍 地址: http://0.0.0.0:5002")
     logger.info("📹 视频分析: Qwen3-Omni-Flash-Realtime")
+    if OMNI_REALTIME_URL:
+        logger.info(f"🧪 Realtime 服务: {OMNI_REALTIME_URL}（本地模拟）")
     logger.info("🎤 音频输入: PCM 16kHz")
     logger.info("💬 文本输出: 流式响应")
     logger.info("")
@@ -564,8 +847,11 @@ if __name__ == '__main__':
     logger.info("   GET  /api/session/<id>/response - 获取响应（流式）")
     logger.info("   POST /api/session/<id>/close - 关闭会话")
     logger.info("   POST /api/analyze-video - 一次性分析")
+    logger.info("   POST /api/jobs - 提交长视频分析任务")
+    logger.info("   GET  /api/jobs/<id>[/events] - 任务状态（轮询 / SSE）")
     logger.info("")
     logger.info("💡 提示: 设置 DASHSCOPE_API_KEY 环境变量使用您的 API Key")
     logger.info("=" * 60)
 
+    job_manager.resume()
     app.run(host='0.0.0.0', port=5002, debug=False, threaded=True)
@@ -8,14 +8,18 @@ from flask_cors import CORS
 from flask_sock import Sock
 import os
 import base64
+import json
 import logging
 import threading
 import queue
 import time
-import cv2
-import numpy as np
+import uuid
+from functools import partial
 from dashscope.audio.qwen_omni import *
 import dashscope
+from frame_transcode_pool import TranscodeBusy, get_transcode_pool
+from video_frame_utils import RESOLUTION_HEIGHTS
+from audio_transcode import OpusStreamEncoder
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -27,13 +31,23 @@ sock = Sock(app)
 
 # Dashscope API 配置
 dashscope.api_key = os.getenv('DASHSCOPE_API_KEY') or "sk-c5c3e296dfc74fb9bef2fa4481b7cd78"
+# Realtime 服务地址，未设置时连接 DashScope；离线联调/压测可指向 mock_omni_server.py
+# 例如 QWEN_OMNI_REALTIME_URL=ws://127.0.0.1:8765/api-ws/v1/realtime
+OMNI_REALTIME_URL = os.getenv('QWEN_OMNI_REALTIME_URL') or None
 
 OUTPUT_DIR = "./qwen_output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # 性能配置（参考 vad_dash.py）
 FRAME_INTERVAL_MS = 500  # 发送帧率: 2fps
-VIDEO_RESOLUTION = '480p'
+VIDEO_RESOLUTION = '480p'  # 默认目标分辨率，连接时可用 ?resolution=720p 指定
+
+# 下行回复音频编码，连接时可用 ?audio_codec=opus 指定
+# pcm: 原样转发上游的 24kHz PCM（384kbit/s + Base64）；opus: 每个会话独立编码为 Opus 包，适合弱网移动端
+AUDIO_CODECS = ('pcm', 'opus')
+OUTPUT_SAMPLE_RATE = 24000  # 上游 output_audio_format 的采样率
+OPUS_BITRATE = 24000  # Opus 目标码率（bit/s）
+OPUS_FRAME_MS = 20  # Opus 每包时长
 
 # 会话管理
 sessions = {}
@@ -43,13 +57,26 @@ session_lock = threading.Lock()
 class RealtimeVideoSession:
     """实时视频分析会话 - 参考 vad_dash.py"""
 
-    def __init__(self, session_id, websocket, instructions="你是一个智能视频分析助手"):
+    def __init__(self, session_id, websocket, instructions="你是一个智能视频分析助手", resolution=VIDEO_RESOLUTION,
+                 audio_codec='pcm'):
         self.session_id = session_id
         self.websocket = websocket
         self.instructions = instructions
+        self.resolution = resolution
+        self.max_height = RESOLUTION_HEIGHTS[resolution]  # 上传帧缩放到的目标高度
+        self.audio_codec = audio_codec
+        # 下行 Opus 编码器（只在上游回调线程中使用），会话内保留编码状态
+        self.opus_encoder = OpusStreamEncoder(OUTPUT_SAMPLE_RATE, OPUS_BITRATE, OPUS_FRAME_MS) \
+            if audio_codec == 'opus' else None
         self.conversation = None
         self.is_active = False
         self.last_frame_time = 0
+        # 转码完成的帧交给会话自己的发送线程（append_video 是阻塞的网络 I/O，不能在转码池的结果线程中执行）
+        self.frame_cond = threading.Condition()
+        self.pending_frame = None  # (序号, 帧)：最新的待发送帧，发送线程来不及发送时旧帧被覆盖
+        self.last_frame_seq = 0  # 已发送帧的序号，转码完成顺序可能与接收顺序不同
+        self.closed = False
+        self.video_thread = None
         self.response_queue = queue.Queue()
 
     def start(self):
@@ -64,6 +91,7 @@ class RealtimeVideoSession:
             self.conversation = OmniRealtimeConversation(
                 model='qwen3-omni-flash-realtime',
                 callback=callback,
+                url=OMNI_REALTIME_URL,
             )
 
             # 建立连接
@@ -83,6 +111,9 @@ class RealtimeVideoSession:
             )
 
             self.is_active = True
+            self.video_thread = threading.Thread(target=self._video_sender, daemon=True,
+                                                 name=f"video-sender-{self.session_id}")
+            self.video_thread.start()
             logger.info(f"实时会话 {self.session_id} 启动成功")
             return True
 
@@ -130,10 +161,13 @@ class RealtimeVideoSession:
 
                     elif event_type == 'response.audio.delta':
                         audio_b64 = response.get('delta', '')
-                        session._send_to_client({
-                            'type': 'audio.delta',
-                            'audio': audio_b64
-                        })
+                        if session.opus_encoder:
+                            session._send_opus(session.opus_encoder.encode(base64.b64decode(audio_b64)))
+                        else:
+                            session._send_to_client({
+                                'type': 'audio.delta',
+                                'audio': audio_b64
+                            })
 
                     elif event_type == 'input_audio_buffer.speech_started':
                         logger.info("检测到语音开始")
@@ -141,8 +175,17 @@ class RealtimeVideoSession:
                             'type': 'speech.started'
                         })
 
+                    elif event_type == 'input_audio_buffer.speech_stopped':
+                        # audio_end_ms 供客户端换算说话结束时刻（session_replay.py 统计逐轮延迟）
+                        session._send_to_client({
+                            'type': 'speech.stopped',
+                            'audio_end_ms': response.get('audio_end_ms')
+                        })
+
                     elif event_type == 'response.done':
                         logger.info("响应完成")
+                        if session.opus_encoder:
+                            session._send_opus(session.opus_encoder.flush())
                         session._send_to_client({
                             'type': 'response.done'
                         })
@@ -155,11 +198,19 @@ class RealtimeVideoSession:
     def _send_to_client(self, data):
         """发送数据到客户端"""
         try:
-            import json
             self.websocket.send(json.dumps(data))
         except Exception as e:
             logger.error(f"发送到客户端失败: {e}")
 
+    def _send_opus(self, packets):
+        """把 Opus 包发给客户端（每包 OPUS_FRAME_MS 毫秒，可直接交给 WebCodecs AudioDecoder）"""
+        if packets:
+            self._send_to_client({
+                'type': 'audio.delta',
+                'codec': 'opus',
+                'packets': [base64.b64encode(packet).decode('ascii') for packet in packets]
+            })
+
     def append_video(self, frame_b64):
         """发送视频帧 - 参考 vad_dash.py"""
         if not self.is_active or not self.conversation:
@@ -178,6 +229,33 @@ class RealtimeVideoSession:
             logger.error(f"发送视频帧失败: {e}")
             return False
 
+    def frame_due(self):
+        """是否到了发送下一帧的时间（提前判断，跳过的帧不必转码）"""
+        return time.time() * 1000 - self.last_frame_time >= FRAME_INTERVAL_MS
+
+    def on_frame_transcoded(self, seq, future):
+        """转码完成回调（在转码池线程中执行）：只把结果交给发送线程，丢弃比已发送 / 待发送帧更旧的结果"""
+        processed = future.result()
+        if not processed:
+            return
+        with self.frame_cond:
+            if seq <= self.last_frame_seq or (self.pending_frame and seq <= self.pending_frame[0]):
+                return
+            self.pending_frame = (seq, processed)
+            self.frame_cond.notify()
+
+    def _video_sender(self):
+        """会话的视频发送线程：把最新的转码结果发往上游，上游慢时只影响本会话"""
+        while True:
+            with self.frame_cond:
+                self.frame_cond.wait_for(lambda: self.pending_frame is not None or self.closed)
+                if self.closed:
+                    return
+                seq, processed = self.pending_frame
+                self.pending_frame = None
+                self.last_frame_seq = seq
+            self.append_video(processed)
+
     def append_audio(self, audio_b64):
         """发送音频数据 - 参考 vad_dash.py"""
         if not self.is_active or not self.conversation:
@@ -192,6 +270,15 @@ class RealtimeVideoSession:
 
     def close(self):
         """关闭会话"""
+        with self.frame_cond:
+            self.closed = True
+            self.frame_cond.notify()
+        if self.video_thread:
+            self.video_thread.join(timeout=1.0)  # 正在发送的帧发完后退出，上游卡住时不无限等待
+        if self.opus_encoder and self.opus_encoder.stats["input_bytes"]:
+            stats = self.opus_encoder.stats
+            logger.info(f"会话 {self.session_id} 下行音频: PCM {stats['input_bytes'] / 1024:.1f}KB → "
+                        f"Opus {stats['output_bytes'] / 1024:.1f}KB（{stats['packets']} 包）")
         if self.conversation:
             try:
                 self.conversation.close()
@@ -201,57 +288,6 @@ class RealtimeVideoSession:
                 logger.error(f"关闭会话失败: {e}")
 
 
-def process_video_frame(frame_data):
-    """处理视频帧 - 参考 vad_dash.py"""
-    try:
-        if isinstance(frame_data, str):
-            img_bytes = base64.b64decode(frame_data)
-        else:
-            img_bytes = frame_data
-
-        # 尝试作为图像解码
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if frame is None:
-            # 尝试作为视频文件
-            temp_path = os.path.join(OUTPUT_DIR, f"temp_{os.getpid()}.webm")
-            with open(temp_path, 'wb') as f:
-                f.write(img_bytes)
-
-            cap = cv2.VideoCapture(temp_path)
-            ret, frame = cap.read()
-            cap.release()
-            os.remove(temp_path)
-
-            if not ret:
-                return None
-
-        # 调整分辨率到 720p（参考 vad_dash.py）
-        height, width = frame.shape[:2]
-        if height > 720:
-            scale = 720.0 / height
-            frame = cv2.resize(frame, (int(width * scale), 720))
-
-        # 编码为 JPEG
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 70]
-        success, encoded = cv2.imencode('.jpg', frame, encode_param)
-
-        if not success:
-            return None
-
-        # 检查大小（最大 500KB）
-        if len(encoded.tobytes()) > 500 * 1024:
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 50]
-            success, encoded = cv2.imencode('.jpg', frame, encode_param)
-
-        return base64.b64encode(encoded.tobytes()).decode('ascii')
-
-    except Exception as e:
-        logger.error(f"视频帧处理错误: {e}")
-        return None
-
-
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查"""
@@ -259,7 +295,8 @@ def health_check():
         "status": "ok",
         "service": "Qwen-Omni Video Service (Realtime)",
         "active_sessions": len(sessions),
-        "mode": "realtime_stream"
+        "mode": "realtime_stream",
+        "transcode": get_transcode_pool().status()
     })
 
 
@@ -269,13 +306,28 @@ def websocket_video(ws):
     WebSocket 实时视频分析
     客户端发送: {type: 'video', data: base64} 或 {type: 'audio', data: base64}
     服务端返回: {type: 'text.delta', text: '...'} 或 {type: 'audio.delta', audio: '...'}
+
+    连接参数:
+        resolution   上传帧的目标分辨率（360p/480p/720p/1080p）
+        audio_codec  下行回复音频编码：pcm（默认，24kHz 16-bit PCM）或 opus
+                     （audio.delta 改为 {type: 'audio.delta', codec: 'opus', packets: [base64, ...]}，
+                     24kHz 单声道、每包 OPUS_FRAME_MS 毫秒）
     """
-    session_id = f"ws_{int(time.time() * 1000)}"
+    session_id = f"ws_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
     logger.info(f"新的 WebSocket 连接: {session_id}")
 
+    resolution = request.args.get('resolution', VIDEO_RESOLUTION)
+    if resolution not in RESOLUTION_HEIGHTS:
+        ws.send(json.dumps({'type': 'error', 'message': f'不支持的分辨率: {resolution}，可选 {list(RESOLUTION_HEIGHTS)}'}))
+        return
+    audio_codec = request.args.get('audio_codec', 'pcm')
+    if audio_codec not in AUDIO_CODECS:
+        ws.send(json.dumps({'type': 'error', 'message': f'不支持的音频编码: {audio_codec}，可选 {list(AUDIO_CODECS)}'}))
+        return
+
     try:
         # 创建会话
-        session = RealtimeVideoSession(session_id, ws)
+        session = RealtimeVideoSession(session_id, ws, resolution=resolution, audio_codec=audio_codec)
 
         if not session.start():
             ws.send(json.dumps({'type': 'error', 'message': '会话启动失败'}))
@@ -288,28 +340,37 @@ def websocket_video(ws):
         ws.send(json.dumps({
             'type': 'ready',
             'session_id': session_id,
+            'resolution': resolution,
+            'audio_codec': audio_codec,
+            'audio_sample_rate': OUTPUT_SAMPLE_RATE,
+            'opus_frame_ms': OPUS_FRAME_MS if audio_codec == 'opus' else None,
             'message': '实时视频分析会话已建立'
         }))
 
         # 接收客户端消息
+        transcode_pool = get_transcode_pool()
+        frame_seq = 0
         while True:
             message = ws.receive()
             if message is None:
                 break
 
             try:
-                import json
                 data = json.loads(message)
                 msg_type = data.get('type')
 
                 if msg_type == 'video':
                     # 接收视频帧
                     frame_b64 = data.get('data')
-                    if frame_b64:
-                        # 处理视频帧
-                        processed = process_video_frame(frame_b64)
-                        if processed:
-                            session.append_video(processed)
+                    if frame_b64 and session.frame_due():
+                        # 异步转码，接收循环不等待（音频不被视频帧处理阻塞）；在途帧数已满或没有空闲槽位时丢弃该帧
+                        frame_seq += 1
+                        try:
+                            future = transcode_pool.submit(frame_b64, session_id, session.max_height, slot_timeout=0)
+                        except TranscodeBusy:
+                            future = None
+                        if future is not None:
+                            future.add_done_callback(partial(session.on_frame_transcoded, frame_seq))
 
                 elif msg_type == 'audio':
                     # 接收音频数据
@@ -344,6 +405,8 @@ if __name__ == '__main__':
     logger.info("✅ 服务启动成功！")
     logger.info("📍 地址: http://0.0.0.0:5003")
     logger.info("📹 视频分析: Qwen3-Omni-Flash-Realtime")
+    if OMNI_REALTIME_URL:
+        logger.info(f"🧪 Realtime 服务: {OMNI_REALTIME_URL}（本地模拟）")
     logger.info("🔄 模式: 实时流式处理（WebSocket）")
     logger.info("🎤 VAD: 启用（自动检测语音）")
     logger.info("")
@@ -0,0 +1,144 @@
+"""
+本地 Qwen2-VL 多模态推理
+- 每轮视觉 token 预算：按帧数和单帧像素上限共同约束（Qwen2-VL 每 28×28 像素对应 1 个视觉 token）
+- 视觉编码缓存：与上一轮相比画面未变化的帧直接复用视觉编码器输出，跳过 ViT 计算
+- 每轮统计 prefill 耗时与 token 用量
+"""
+
+import time
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from transformers import Qwen2VLForConditionalGeneration, AutoProcessor, StoppingCriteria, StoppingCriteriaList
+from qwen_vl_utils import process_vision_info
+
+PIXELS_PER_TOKEN = 28 * 28
+MIN_TOKENS_PER_FRAME = 64  # 单帧最少视觉 token（约 224×224），低于此画面细节过少
+
+
+class FirstTokenTimer(StoppingCriteria):
+    """首次被调用即首个 token 生成完毕，用于统计 prefill 耗时"""
+
+    def __init__(self):
+        self.first_token_time = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+
+
+class LocalQwenVL:
+    """
+    :param model_dir: Qwen2-VL 模型目录
+    :param max_vision_tokens: 每轮视觉 token 预算
+    :param max_frames: 每轮最多帧数
+    :param cache_diff_threshold: 画面变化阈值（16×16 灰度缩略图平均绝对差），低于此值视为未变化
+    """
+
+    def __init__(self, model_dir, max_vision_tokens=512, max_frames=4, cache_diff_threshold=3.0):
+        self.model = Qwen2VLForConditionalGeneration.from_pretrained(
+            model_dir,
+            torch_dtype="auto",
+            device_map="auto",
+        )
+        self.processor = AutoProcessor.from_pretrained(model_dir)
+        self.max_vision_tokens = max_vision_tokens
+        self.max_frames = max_frames
+        self.cache_diff_threshold = cache_diff_threshold
+        self.vision_cache = []  # 上一轮: [(缩略图, grid_thw, 视觉编码输出)]
+
+    def plan_frames(self, frames):
+        """按预算确定本轮帧数和单帧像素上限，帧数超出时均匀抽取"""
+        max_by_budget = max(1, self.max_vision_tokens // MIN_TOKENS_PER_FRAME)
+        k = min(len(frames), self.max_frames, max_by_budget)
+        if k < len(frames):
+            frames = [frames[i] for i in np.linspace(0, len(frames) - 1, k).round().astype(int)]
+        max_pixels = (self.max_vision_tokens // k) * PIXELS_PER_TOKEN
+        return frames, max_pixels
+
+    def _encode_images(self, frames, pixel_values, image_grid_thw):
+        """逐帧获取视觉编码，画面未变化的帧复用上一轮结果，返回 (拼接后的编码, 命中数)"""
+        visual = self.model.visual
+        new_cache, embeds, hits, offset = [], [], 0, 0
+        for frame, grid in zip(frames, image_grid_thw):
+            n_patches = int(grid.prod())
+            thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (16, 16),
+                               interpolation=cv2.INTER_AREA).astype(np.float32)
+            grid_key = tuple(int(x) for x in grid)
+            cached = None
+            for old_thumb, old_grid, old_embeds in self.vision_cache:
+                if old_grid == grid_key and np.abs(old_thumb - thumb).mean() < self.cache_diff_threshold:
+                    cached = old_embeds
+                    break
+            if cached is None:
+                patches = pixel_values[offset:offset + n_patches].type(visual.get_dtype())
+                cached = visual(patches, grid_thw=grid.unsqueeze(0))
+            else:
+                hits += 1
+            offset += n_patches
+            embeds.append(cached)
+            new_cache.append((thumb, grid_key, cached))
+        self.vision_cache = new_cache
+        return torch.cat(embeds, dim=0), hits
+
+    @torch.no_grad()
+    def chat(self, frames, prompt, system_prompt, max_new_tokens=256, stopping_criteria=None):
+        """
+        :param frames: BGR 帧列表（按时间排序）
+        :return: (回答文本, 统计信息 dict)
+        """
+        t_start = time.perf_counter()
+        frames, max_pixels = self.plan_frames(frames)
+        content = [{"type": "image",
+                    "image": Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)),
+                    "max_pixels": max_pixels,
+                    "min_pixels": MIN_TOKENS_PER_FRAME * PIXELS_PER_TOKEN}
+                   for frame in frames]
+        content.append({"type": "text", "text": prompt})
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content},
+        ]
+        text = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        image_inputs, _ = process_vision_info(messages)
+        inputs = self.processor(text=[text], images=image_inputs, padding=True, return_tensors="pt")
+        inputs = inputs.to(self.model.device)
+
+        # 视觉编码（带缓存）后直接拼入文本 embedding，generate 时不再重复编码图像
+        t_vision = time.perf_counter()
+        image_embeds, hits = self._encode_images(frames, inputs.pixel_values, inputs.image_grid_thw)
+        input_ids = inputs.input_ids
+        inputs_embeds = self.model.model.embed_tokens(input_ids)
+        image_mask = (input_ids == self.model.config.image_token_id).unsqueeze(-1).expand_as(inputs_embeds)
+        inputs_embeds = inputs_embeds.masked_scatter(image_mask, image_embeds.to(inputs_embeds.dtype))
+
+        vision_ms = (time.perf_counter() - t_vision) * 1000
+
+        first_token = FirstTokenTimer()
+        criteria = StoppingCriteriaList([first_token] + list(stopping_criteria or []))
+        t_prefill = time.perf_counter()
+        generated_ids = self.model.generate(
+            input_ids=input_ids,
+            inputs_embeds=inputs_embeds,
+            attention_mask=inputs.attention_mask,
+            image_grid_thw=inputs.image_grid_thw,
+            max_new_tokens=max_new_tokens,
+            stopping_criteria=criteria,
+        )
+        new_ids = generated_ids[:, input_ids.shape[1]:]
+        output_text = self.processor.batch_decode(new_ids, skip_special_tokens=True)[0]
+
+        stats = {
+            "frames": len(frames),
+            "cached_frames": hits,
+            "vision_tokens": int(image_embeds.shape[0]),
+            "vision_budget": self.max_vision_tokens,
+            "prompt_tokens": int(input_ids.shape[1]),
+            "new_tokens": int(new_ids.shape[1]),
+            "vision_ms": vision_ms,
+            "prefill_ms": ((first_token.first_token_time or time.perf_counter()) - t_prefill) * 1000,
+            "total_ms": (time.perf_counter() - t_start) * 1000,
+        }
+        return output_text, stats
@@ -0,0 +1,143 @@
+"""
+/api/analyze-video 的感知哈希响应缓存
+看板会用同一个问题反复轮询画面几乎不变的摄像头，每次都要新建会话并等待完整的模型延迟。这里按
+(处理后帧的感知哈希, 规范化的问题, 指令) 缓存回答：
+- 感知哈希（pHash）：32×32 灰度图的 DCT 低频 8×8 系数（去掉直流分量）与中位数比较得到 63 位，
+  压缩噪声、亮度微调不会改变哈希；近乎纯色的画面没有可比较的结构（黑屏和白屏的哈希相同），不参与缓存
+- 同一问题 / 指令下，哈希的汉明距离不超过 max_distance 即视为同一画面（片段模式逐帧比较）
+- 条目超过 ttl 秒失效，超过 max_entries 时按 LRU 淘汰
+"""
+
+import base64
+import re
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+_PUNCTUATION = re.compile(r"[。．.？?！!，,、；;：:\"'“”‘’]+")
+_WHITESPACE = re.compile(r"\s+")
+FLAT_STD = 2.0  # 灰度标准差低于该值视为纯色画面
+
+
+def phash(frame_b64):
+    """Base64 JPEG → 63 位感知哈希（int），无法解码或近乎纯色时返回 None"""
+    try:
+        data = np.frombuffer(base64.b64decode(frame_b64), np.uint8)
+    except ValueError:
+        return None
+    # 只需要 32×32，缩小解码省去大部分解码耗时
+    gray = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    if small.std() < FLAT_STD:
+        return None
+    # 去掉直流分量（整体亮度）：只比较画面结构，纯亮度差异不会只差一位
+    ac = cv2.dct(small)[:8, :8].flatten()[1:]
+    bits = ac > np.median(ac)
+    return int(np.packbits(np.append(bits, False)).view(">u8")[0])
+
+
+def normalize_question(text):
+    """去掉标点、合并连续空白、统一小写，让「这是什么？」和「这是什么」命中同一条缓存（「a cat」与「acat」不同）"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub("", (text or "").lower())).strip()
+
+
+class ResponseCache:
+    """
+    线程安全的感知哈希响应缓存
+
+    :param ttl: 条目有效期（秒）
+    :param max_entries: 最大条目数，超出按 LRU 淘汰
+    :param max_distance: 视为同一画面的最大汉明距离（63 位中）
+    """
+
+    def __init__(self, ttl=30.0, max_entries=256, max_distance=4):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # entry_id -> 条目，按最近使用排序
+        self.next_id = 0
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "stores": 0,
+                      "hit_ms_total": 0.0, "saved_ms_total": 0.0}
+
+    def _match(self, entry, hashes, question, instructions):
+        if entry["question"] != question or entry["instructions"] != instructions:
+            return None
+        if len(entry["hashes"]) != len(hashes):
+            return None
+        distance = max(bin(a ^ b).count("1") for a, b in zip(entry["hashes"], hashes))
+        return distance if distance <= self.max_distance else None
+
+    def lookup(self, hashes, question, instructions=""):
+        """
+        查找缓存
+
+        :param hashes: 各帧的感知哈希列表
+        :param instructions: 问题之外影响回答的指令（如分析模式），必须完全相同才会命中
+        :return: 命中时返回 {"response", "distance", "age_s"}，否则 None
+        """
+        t0 = time.perf_counter()
+        question = normalize_question(question)
+        now = time.time()
+        with self.lock:
+            best_id, best_distance = None, None
+            for entry_id, entry in list(self.entries.items()):
+                if now - entry["created_at"] > self.ttl:
+                    del self.entries[entry_id]
+                    self.stats["expired"] += 1
+                    continue
+                distance = self._match(entry, hashes, question, instructions)
+                if distance is not None and (best_distance is None or distance < best_distance):
+                    best_id, best_distance = entry_id, distance
+            if best_id is None:
+                self.stats["misses"] += 1
+                return None
+            entry = self.entries[best_id]
+            self.entries.move_to_end(best_id)
+            entry["hits"] += 1
+            self.stats["hits"] += 1
+            self.stats["hit_ms_total"] += (time.perf_counter() - t0) * 1000
+            self.stats["saved_ms_total"] += entry["latency_ms"]
+            return {"response": entry["response"], "distance": best_distance,
+                    "age_s": round(now - entry["created_at"], 2)}
+
+    def store(self, hashes, question, response, instructions="", latency_ms=0.0):
+        """写入一条回答，latency_ms 为本次真实分析耗时（用于统计命中节省的时间）"""
+        with self.lock:
+            self.entries[self.next_id] = {
+                "hashes": list(hashes),
+                "question": normalize_question(question),
+                "instructions": instructions,
+                "response": response,
+                "created_at": time.time(),
+                "latency_ms": latency_ms,
+                "hits": 0,
+            }
+            self.next_id += 1
+            self.stats["stores"] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def metrics(self):
+        """供 /health 和响应使用的命中统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            size = len(self.entries)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "entries": size,
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+            "expired": stats["expired"],
+            "evictions": stats["evictions"],
+            "avg_hit_ms": round(stats["hit_ms_total"] / stats["hits"], 3) if stats["hits"] else 0.0,
+            "saved_s_total": round(stats["saved_ms_total"] / 1000, 1),
+            "ttl_s": self.ttl,
+            "max_distance": self.max_distance,
+        }
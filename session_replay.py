@@ -0,0 +1,451 @@
+"""
+会话录制与回放
+录制麦克风 PCM 块和摄像头 JPEG 帧（带时间戳）到紧凑的二进制文件，回放时以实时或加速速度
+替代麦克风 / 摄像头设备喂给 vad_dash.py、SenseVoice 助手或视频服务，用于复现现场的延迟问题，
+并按轮次统计「麦克风 → 首个文本」「麦克风 → 首个音频」延迟
+
+文件格式 (.omrec):
+    头部:  b"OMREC1\\0\\0" | uint32 元数据长度 | 元数据 JSON（采样率、创建时间等）
+    记录:  uint8 类型 | float64 相对录制开始的秒数 | uint32 负载长度 | 负载
+    类型:  1 = PCM int16 音频块，2 = JPEG 帧，3 = 事件标记（JSON）
+
+用法:
+    python session_replay.py info session.omrec
+    python session_replay.py make session.omrec --wav speech.wav [--video clip.mp4]
+    python session_replay.py ws session.omrec [--url ws://localhost:5003/ws/video] [--speed 2] [-o report.json]
+
+设备替换（环境变量）:
+    SESSION_RECORD_PATH=xxx.omrec   录制本次会话
+    SESSION_REPLAY_PATH=xxx.omrec   用录制文件代替麦克风和摄像头
+    SESSION_REPLAY_SPEED=2          回放倍速
+    LATENCY_REPORT_PATH=xxx.json    退出时写出逐轮延迟报告
+"""
+
+import argparse
+import base64
+import bisect
+import json
+import struct
+import threading
+import time
+import cv2
+import numpy as np
+
+MAGIC = b"OMREC1\0\0"
+RECORD_HEADER = struct.Struct("<BdI")
+RECORD_AUDIO = 1
+RECORD_FRAME = 2
+RECORD_EVENT = 3
+
+
+class SessionRecorder:
+    """
+    线程安全的会话录制器（麦克风线程和摄像头线程可同时写入）
+
+    :param frame_interval: 帧最小间隔（秒），摄像头 30fps 时按此节流，保持文件紧凑
+    """
+
+    def __init__(self, path, sample_rate=16000, frame_interval=0.1, jpeg_quality=80, **meta):
+        self.file = open(path, "wb", buffering=1024 * 1024)
+        self.lock = threading.Lock()
+        self.frame_interval = frame_interval
+        self.jpeg_quality = jpeg_quality
+        self.last_frame_t = -np.inf
+        self.t0 = time.time()
+        header = json.dumps({"sample_rate": sample_rate, "created_at": self.t0, **meta}).encode("utf-8")
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def _write(self, record_type, payload, timestamp=None):
+        t = (timestamp if timestamp is not None else time.time()) - self.t0
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(RECORD_HEADER.pack(record_type, t, len(payload)))
+            self.file.write(payload)
+
+    def write_audio(self, pcm_bytes, timestamp=None):
+        self._write(RECORD_AUDIO, bytes(pcm_bytes), timestamp)
+
+    def write_frame(self, frame, timestamp=None):
+        """写入 BGR 帧（按 frame_interval 节流），返回是否写入"""
+        timestamp = timestamp if timestamp is not None else time.time()
+        if timestamp - self.last_frame_t < self.frame_interval:
+            return False
+        self.last_frame_t = timestamp
+        ok, encoded = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if ok:
+            self._write(RECORD_FRAME, encoded.tobytes(), timestamp)
+        return ok
+
+    def write_jpeg(self, jpeg_bytes, timestamp=None):
+        self._write(RECORD_FRAME, bytes(jpeg_bytes), timestamp)
+
+    def write_event(self, name, timestamp=None, **data):
+        self._write(RECORD_EVENT, json.dumps({"name": name, **data}, ensure_ascii=False).encode("utf-8"), timestamp)
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+def read_session(path):
+    """读取录制文件，返回 (元数据, [(类型, 秒数, 负载)])"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} 不是会话录制文件")
+    offset = len(MAGIC)
+    (meta_len,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    meta = json.loads(data[offset:offset + meta_len])
+    offset += meta_len
+    records = []
+    view = memoryview(data)
+    while offset + RECORD_HEADER.size <= len(data):
+        record_type, t, length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(data):
+            break  # 录制中断导致的不完整记录
+        records.append((record_type, t, view[offset:offset + length]))
+        offset += length
+    return meta, records
+
+
+class SessionReplay:
+    """
+    回放一个录制文件：mic_stream() / video_capture() 分别代替 PyAudio 输入流和 cv2.VideoCapture，
+    两者共用同一时钟（首次读取时开始），按录制时间轴 / speed 节拍输出
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.meta, records = read_session(path)
+        self.sample_rate = self.meta.get("sample_rate", 16000)
+        self.speed = speed
+        self.audio = b"".join(bytes(p) for kind, _, p in records if kind == RECORD_AUDIO)
+        self.frames = [(t, p) for kind, t, p in records if kind == RECORD_FRAME]
+        self.events = [(t, json.loads(bytes(p))) for kind, t, p in records if kind == RECORD_EVENT]
+        self.duration = max(len(self.audio) / 2 / self.sample_rate,
+                            self.frames[-1][0] if self.frames else 0.0)
+        self.start_time = None
+        self.lock = threading.Lock()
+
+    def clock_start(self):
+        with self.lock:
+            if self.start_time is None:
+                self.start_time = time.time()
+            return self.start_time
+
+    def wall_time(self, t):
+        """录制时间轴 -> 回放时的 time.time()"""
+        return self.clock_start() + t / self.speed
+
+    def finished(self):
+        return self.start_time is not None and time.time() >= self.wall_time(self.duration)
+
+    def mic_stream(self):
+        return ReplayMicStream(self)
+
+    def video_capture(self):
+        return ReplayVideoCapture(self)
+
+
+class ReplayMicStream:
+    """与 PyAudio 输入流 read 接口一致：按回放节拍阻塞返回 PCM，录音结束后返回静音"""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.pos = 0  # 已读取的样本数
+        self.ended = False
+
+    def read(self, num_frames, exception_on_overflow=False):
+        replay = self.replay
+        start = self.pos * 2
+        self.pos += num_frames
+        delay = replay.wall_time(self.pos / replay.sample_rate) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        chunk = replay.audio[start:start + num_frames * 2]
+        if len(chunk) < num_frames * 2:
+            if not self.ended:
+                self.ended = True
+                print("[Replay] 录音回放结束，之后输入静音")
+            chunk = chunk + bytes(num_frames * 2 - len(chunk))
+        return chunk
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ReplayVideoCapture:
+    """与 cv2.VideoCapture 的 read 接口一致：按录制时间戳阻塞返回帧，结束后保持最后一帧"""
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.index = 0
+        self.last_frame = None
+        self.interval = (replay.frames[-1][0] - replay.frames[0][0]) / max(1, len(replay.frames) - 1) \
+            if len(replay.frames) > 1 else 0.1
+
+    def isOpened(self):
+        return bool(self.replay.frames)
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        replay = self.replay
+        if self.index < len(replay.frames):
+            t, jpeg = replay.frames[self.index]
+            self.index += 1
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                self.last_frame = frame
+        else:
+            t = replay.duration + (self.index - len(replay.frames) + 1) * self.interval
+            self.index += 1
+        delay = replay.wall_time(t) - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        if self.last_frame is None:
+            return False, None
+        return True, self.last_frame.copy()
+
+    def release(self):
+        pass
+
+
+class TurnLatencyTracker:
+    """
+    逐轮延迟统计：
+    mark_audio 在每次读取音频块后调用（读取返回时即块内最后一个样本的采集时刻），
+    说话结束时按服务端给出的 audio_end_ms（或直接给出的时间）定位该样本的采集时刻，
+    再与首个文本 / 音频回复的到达时间相减
+    """
+
+    def __init__(self, sample_rate=16000, max_marks=6000):
+        self.sample_rate = sample_rate
+        self.max_marks = max_marks
+        self.lock = threading.Lock()
+        self.mark_pos = []   # 每个音频块结束时的累计样本数
+        self.mark_wall = []  # 对应的采集时间
+        self.samples = 0
+        self.turn = None
+        self.turns = []
+
+    def mark_audio(self, n_samples, wall=None):
+        with self.lock:
+            self.samples += n_samples
+            self.mark_pos.append(self.samples)
+            self.mark_wall.append(wall if wall is not None else time.time())
+            if len(self.mark_pos) > self.max_marks:
+                del self.mark_pos[:len(self.mark_pos) - self.max_marks]
+                del self.mark_wall[:len(self.mark_wall) - self.max_marks]
+
+    def _wall_for_sample(self, pos):
+        if not self.mark_pos:
+            return None
+        i = min(bisect.bisect_left(self.mark_pos, pos), len(self.mark_pos) - 1)
+        return self.mark_wall[i] - (self.mark_pos[i] - pos) / self.sample_rate
+
+    def speech_end(self, audio_end_ms=None, wall=None):
+        """一轮开始计时：优先用 audio_end_ms 对应样本的采集时间"""
+        now = time.time()
+        with self.lock:
+            if wall is None and audio_end_ms is not None:
+                wall = self._wall_for_sample(int(audio_end_ms * self.sample_rate / 1000))
+            self.turn = {"index": len(self.turns) + 1, "speech_end": wall if wall is not None else now,
+                         "first_text_ms": None, "first_audio_ms": None, "done_ms": None}
+
+    def _mark(self, key):
+        with self.lock:
+            if self.turn and self.turn[key] is None:
+                self.turn[key] = (time.time() - self.turn["speech_end"]) * 1000
+
+    def first_text(self):
+        self._mark("first_text_ms")
+
+    def first_audio(self):
+        self._mark("first_audio_ms")
+
+    def response_done(self):
+        """一轮结束，返回该轮统计"""
+        with self.lock:
+            turn, self.turn = self.turn, None
+        if turn is None:
+            return None
+        turn["done_ms"] = (time.time() - turn["speech_end"]) * 1000
+        self.turns.append(turn)
+        fmt = lambda v: f"{v:.0f}ms" if v is not None else "-"
+        print(f"[Latency] 第 {turn['index']} 轮: 麦克风→首文本 {fmt(turn['first_text_ms'])} | "
+              f"麦克风→首音频 {fmt(turn['first_audio_ms'])} | 完成 {fmt(turn['done_ms'])}")
+        return turn
+
+    def report(self):
+        summary = {}
+        for key in ("first_text_ms", "first_audio_ms", "done_ms"):
+            values = [t[key] for t in self.turns if t[key] is not None]
+            summary[key] = {
+                "n": len(values),
+                "p50": float(np.percentile(values, 50)) if values else None,
+                "p95": float(np.percentile(values, 95)) if values else None,
+                "max": float(np.max(values)) if values else None,
+            }
+        return {"turns": [{k: v for k, v in t.items() if k != "speech_end"} for t in self.turns],
+                "summary": summary}
+
+    def save(self, path, **extra):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({**extra, **self.report()}, f, ensure_ascii=False, indent=2)
+
+
+# ---------------- 命令行工具 ----------------
+def cmd_info(args):
+    meta, records = read_session(args.path)
+    audio = [p for kind, _, p in records if kind == RECORD_AUDIO]
+    frames = [p for kind, _, p in records if kind == RECORD_FRAME]
+    events = [json.loads(bytes(p)) for kind, _, p in records if kind == RECORD_EVENT]
+    duration = records[-1][1] if records else 0.0
+    print(f"元数据: {meta}")
+    print(f"时长: {duration:.1f}s | 音频块 {len(audio)} ({sum(len(p) for p in audio) / 1024:.0f}KB) | "
+          f"帧 {len(frames)} ({sum(len(p) for p in frames) / 1024:.0f}KB) | 事件 {len(events)}")
+    for event in events[:20]:
+        print(f"   {event}")
+
+
+def cmd_make(args):
+    """由 wav（16kHz 单声道）和可选视频文件生成录制文件，方便无设备时制作回放样本"""
+    import wave
+    with wave.open(args.wav, "rb") as wf:
+        if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+            raise ValueError("需要 16-bit 单声道 PCM wav")
+        sample_rate = wf.getframerate()
+        pcm = wf.readframes(wf.getnframes())
+    recorder = SessionRecorder(args.path, sample_rate=sample_rate, frame_interval=args.frame_interval,
+                               source=f"wav={args.wav} video={args.video}")
+    t0 = recorder.t0
+    chunk = sample_rate * args.chunk_ms // 1000 * 2
+    for i in range(0, len(pcm), chunk):
+        recorder.write_audio(pcm[i:i + chunk], t0 + (i + chunk) / 2 / sample_rate)
+    if args.video:
+        cap = cv2.VideoCapture(args.video)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame.shape[:2] != (480, 640):
+                frame = cv2.resize(frame, (640, 480), interpolation=cv2.INTER_AREA)
+            recorder.write_frame(frame, t0 + index / fps)
+            index += 1
+        cap.release()
+    recorder.close()
+    print(f"已生成 {args.path}")
+
+
+def cmd_ws(args):
+    """把录制文件回放到 qwen_video_server_realtime.py 的 /ws/video，统计逐轮延迟"""
+    import websocket
+    replay = SessionReplay(args.path, speed=args.speed)
+    tracker = TurnLatencyTracker(replay.sample_rate)
+    ws = websocket.create_connection(args.url, timeout=30)
+    while json.loads(ws.recv()).get("type") != "ready":
+        pass
+    send_lock = threading.Lock()
+    closed = threading.Event()
+    downstream = {"audio_bytes": 0}  # 下行 audio.delta 消息字节数（比较 ?audio_codec=pcm / opus）
+
+    def receiver():
+        while not closed.is_set():
+            try:
+                raw = ws.recv()
+                msg = json.loads(raw)
+            except Exception:
+                break
+            msg_type = msg.get("type")
+            if msg_type == "audio.delta":
+                downstream["audio_bytes"] += len(raw)
+            if msg_type == "speech.stopped":
+                tracker.speech_end(audio_end_ms=msg.get("audio_end_ms"))
+            elif msg_type == "text.delta":
+                tracker.first_text()
+            elif msg_type == "audio.delta":
+                tracker.first_audio()
+            elif msg_type == "response.done":
+                tracker.response_done()
+
+    def send_video():
+        capture = replay.video_capture()
+        last_sent = 0.0
+        while not closed.is_set() and not replay.finished():
+            ret, frame = capture.read()
+            now = time.time()
+            if ret and now - last_sent >= args.frame_interval / args.speed:
+                ok, encoded = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+                with send_lock:
+                    ws.send(json.dumps({"type": "video", "data": base64.b64encode(encoded.tobytes()).decode("ascii")}))
+                last_sent = now
+
+    threading.Thread(target=receiver, daemon=True).start()
+    if replay.frames:
+        threading.Thread(target=send_video, daemon=True).start()
+
+    mic = replay.mic_stream()
+    chunk_frames = replay.sample_rate * args.chunk_ms // 1000
+    print(f"回放 {args.path}（{replay.duration:.1f}s，{args.speed}x）→ {args.url}")
+    end_time = replay.wall_time(replay.duration) + args.tail
+    while time.time() < end_time:
+        data = mic.read(chunk_frames)
+        tracker.mark_audio(chunk_frames)
+        with send_lock:
+            ws.send(json.dumps({"type": "audio", "data": base64.b64encode(data).decode("ascii")}))
+    closed.set()
+    with send_lock:
+        ws.send(json.dumps({"type": "close"}))
+    ws.close()
+
+    report = tracker.report()
+    print(json.dumps(report["summary"], ensure_ascii=False, indent=2))
+    print(f"下行音频消息: {downstream['audio_bytes'] / 1024:.1f}KB")
+    if args.output:
+        tracker.save(args.output, recording=args.path, url=args.url, speed=args.speed,
+                     downstream_audio_bytes=downstream["audio_bytes"])
+        print(f"报告已写入 {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话录制文件工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("info", help="查看录制文件")
+    p.add_argument("path")
+    p.set_defaults(func=cmd_info)
+
+    p = sub.add_parser("make", help="由 wav / 视频文件生成录制文件")
+    p.add_argument("path")
+    p.add_argument("--wav", required=True)
+    p.add_argument("--video", default=None)
+    p.add_argument("--chunk-ms", type=int, default=25)
+    p.add_argument("--frame-interval", type=float, default=0.1)
+    p.set_defaults(func=cmd_make)
+
+    p = sub.add_parser("ws", help="回放到实时视频服务 /ws/video 并统计延迟")
+    p.add_argument("path")
+    p.add_argument("--url", default="ws://localhost:5003/ws/video")
+    p.add_argument("--speed", type=float, default=1.0, help="回放倍速")
+    p.add_argument("--chunk-ms", type=int, default=100, help="音频发送块时长")
+    p.add_argument("--frame-interval", type=float, default=0.5, help="视频帧发送间隔（录制时间轴）")
+    p.add_argument("--tail", type=float, default=5.0, help="回放结束后继续等待回复的秒数")
+    p.add_argument("-o", "--output", default=None, help="延迟报告 JSON 路径")
+    p.set_defaults(func=cmd_ws)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+声纹注册索引
+将 CAM++ 注册声纹的 embedding 预先计算一次，持久化为紧凑的 NumPy 矩阵，
+每次验证只需提取一次输入音频的 embedding，再与所有已注册说话人做向量化余弦比对
+"""
+
+import os
+import threading
+import numpy as np
+
+
+def extract_embedding(sv_pipeline, audio):
+    """
+    使用 CAM++ pipeline 提取单条音频的声纹 embedding
+
+    :param sv_pipeline: modelscope speaker-verification pipeline
+    :param audio: wav 文件路径，或 16kHz 单声道音频数组
+    :return: 一维 float32 embedding
+    """
+    result = sv_pipeline([audio], output_emb=True)
+    embs = np.asarray(result['embs'], dtype=np.float32)
+    return embs.reshape(embs.shape[0], -1)[0]
+
+
+class SpeakerIndex:
+    """多说话人声纹索引：names[i] 对应 embs 矩阵第 i 行（已做 L2 归一化）"""
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.names = []
+        self.embs = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self.names)
+
+    def is_empty(self):
+        return len(self.names) == 0
+
+    def load(self):
+        """从磁盘加载索引，文件不存在时为空索引"""
+        if not os.path.isfile(self.index_path):
+            return
+        data = np.load(self.index_path)
+        with self.lock:
+            self.names = [str(name) for name in data['names']]
+            self.embs = data['embs'].astype(np.float32)
+
+    def save(self):
+        """以 float16 矩阵保存索引，体积减半且不影响余弦精度"""
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        with self.lock:
+            tmp_path = self.index_path + '.tmp.npz'
+            np.savez(tmp_path,
+                     names=np.array(self.names),
+                     embs=self.embs.astype(np.float16))
+            os.replace(tmp_path, self.index_path)
+
+    def add(self, name, embedding):
+        """注册（或覆盖）一个说话人，并立即持久化"""
+        emb = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        emb /= max(float(np.linalg.norm(emb)), 1e-12)
+        with self.lock:
+            if name in self.names:
+                self.embs[self.names.index(name)] = emb[0]
+            elif self.embs is None:
+                self.names = [name]
+                self.embs = emb
+            else:
+                self.names.append(name)
+                self.embs = np.vstack([self.embs, emb])
+        self.save()
+
+    def verify(self, embedding, thr):
+        """
+        将输入 embedding 与所有注册说话人比对
+
+        :return: (说话人名称或 None, 最高余弦得分)
+        """
+        with self.lock:
+            if self.embs is None:
+                return None, 0.0
+            emb = np.asarray(embedding, dtype=np.float32).reshape(-1)
+            emb = emb / max(float(np.linalg.norm(emb)), 1e-12)
+            scores = self.embs @ emb
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            name = self.names[best]
+        if score >= thr:
+            return name, score
+        return None, score
+
+    def build_from_dir(self, enroll_dir, embed_fn):
+        """
+        从注册目录中的 wav 文件构建索引（兼容旧版只保存 enroll_0.wav 的目录）
+
+        :param embed_fn: 音频路径 -> embedding 的函数
+        :return: 新加入索引的说话人数量
+        """
+        if not os.path.isdir(enroll_dir):
+            return 0
+        added = 0
+        for entry in sorted(os.listdir(enroll_dir)):
+            name, ext = os.path.splitext(entry)
+            if ext.lower() != '.wav' or name in self.names:
+                continue
+            self.add(name, embed_fn(os.path.join(enroll_dir, entry)))
+            added += 1
+        return added
@@ -0,0 +1,191 @@
+"""
+流式 VAD 引擎
+基于 WebRTC VAD，按 10/20/30ms 精确分帧，使用预分配的 NumPy 环形缓冲区保存音频，
+支持语音起点前的预录（pre-roll）与语音结束后的拖尾（hangover），
+语音开始/结束通过回调事件通知，无需轮询 time.time()
+"""
+
+import time
+import numpy as np
+import webrtcvad
+
+SUPPORTED_RATES = (8000, 16000, 32000, 48000)
+SUPPORTED_FRAME_MS = (10, 20, 30)
+
+
+class StreamingVAD:
+    """
+    流式语音端点检测
+
+    回调:
+        on_speech_start(start_time)             检测到语音开始
+        on_speech_audio(pcm)                    属于当前语音段的新音频（int16 视图，回调返回后失效）
+        on_speech_end(pcm, start_time, end_time) 语音段结束，pcm 为该段 int16 音频的拷贝
+    时间均为 time.time() 时间轴上的秒数
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, mode=3,
+                 pre_roll_ms=300, hangover_ms=1000,
+                 trigger_window_ms=300, trigger_ratio=0.6,
+                 min_speech_ms=200, max_segment_s=30,
+                 on_speech_start=None, on_speech_audio=None, on_speech_end=None):
+        if sample_rate not in SUPPORTED_RATES:
+            raise ValueError(f"不支持的采样率: {sample_rate}，可选 {SUPPORTED_RATES}")
+        if frame_ms not in SUPPORTED_FRAME_MS:
+            raise ValueError(f"不支持的帧长: {frame_ms}ms，可选 {SUPPORTED_FRAME_MS}")
+
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_len = sample_rate * frame_ms // 1000
+        self.pre_roll = sample_rate * pre_roll_ms // 1000
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.window_frames = max(1, trigger_window_ms // frame_ms)
+        self.trigger_frames = max(1, int(round(self.window_frames * trigger_ratio)))
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_segment = int(sample_rate * max_segment_s)
+
+        self.on_speech_start = on_speech_start
+        self.on_speech_audio = on_speech_audio
+        self.on_speech_end = on_speech_end
+
+        self.vad = webrtcvad.Vad(mode)
+
+        # 环形缓冲区长度取帧长整数倍，保证每帧在缓冲区内连续
+        ring_frames = -(-(self.max_segment + self.pre_roll + self.window_frames * self.frame_len) // self.frame_len)
+        self._ring = np.zeros(ring_frames * self.frame_len, dtype=np.int16)
+        self._ring_u8 = self._ring.view(np.uint8)
+        self._history = np.zeros(self.window_frames, dtype=bool)
+        self.reset()
+
+    def reset(self):
+        """清空状态（保留预分配的缓冲区）"""
+        self.t0 = None
+        self._written = 0          # 已写入环形缓冲区的样本总数（绝对位置）
+        self._fill = 0             # 当前未满一帧的样本数，暂存在环形缓冲区写指针处
+        self._history[:] = False
+        self._history_pos = 0
+        self.triggered = False
+        self._speech_start = 0
+        self._emitted = 0          # 已通过 on_speech_audio 推送到的绝对位置
+        self._last_voiced_end = 0
+        self._voiced_frames = 0
+        self._silence_frames = 0
+        self._segment_floor = 0    # 上一段结束位置，新段不得早于此处
+
+    def sample_time(self, sample_index):
+        """绝对样本位置 -> time.time() 时间轴"""
+        return self.t0 + sample_index / self.sample_rate
+
+    @property
+    def current_time(self):
+        return self.sample_time(self._written) if self.t0 is not None else time.time()
+
+    def process(self, chunk, capture_time=None):
+        """
+        输入任意长度的一块 16-bit PCM（bytes 或 int16 数组），内部按帧长精确切分
+
+        :param capture_time: 该块最后一个样本的采集时间，默认取当前时间
+        """
+        samples = np.frombuffer(chunk, dtype=np.int16) if not isinstance(chunk, np.ndarray) else chunk
+        if self.t0 is None:
+            end_time = capture_time if capture_time is not None else time.time()
+            self.t0 = end_time - len(samples) / self.sample_rate
+
+        ring_len = len(self._ring)
+        offset = 0
+        while offset < len(samples):
+            pos = (self._written + self._fill) % ring_len
+            take = min(self.frame_len - self._fill, len(samples) - offset)
+            self._ring[pos:pos + take] = samples[offset:offset + take]
+            self._fill += take
+            offset += take
+            if self._fill == self.frame_len:
+                self._fill = 0
+                self._process_frame()
+
+    def flush(self):
+        """输入结束时调用：丢弃不足一帧的尾部，结束当前语音段"""
+        self._fill = 0
+        if self.triggered:
+            self._end_segment(self._written)
+
+    def _process_frame(self):
+        ring_len = len(self._ring)
+        frame_start = self._written
+        pos = frame_start % ring_len
+        self._written += self.frame_len
+
+        frame_bytes = self._ring_u8[pos * 2:(pos + self.frame_len) * 2]
+        is_speech = self.vad.is_speech(frame_bytes, self.sample_rate)
+
+        self._history[self._history_pos] = is_speech
+        self._history_pos = (self._history_pos + 1) % self.window_frames
+
+        if not self.triggered:
+            if int(self._history.sum()) >= self.trigger_frames:
+                self._start_segment()
+            return
+
+        if is_speech:
+            self._voiced_frames += 1
+            self._silence_frames = 0
+            self._last_voiced_end = self._written
+        else:
+            self._silence_frames += 1
+        self._emit_audio(self._written)
+
+        if self._silence_frames >= self.hangover_frames:
+            # 结束点保留与 pre-roll 等长的静音尾巴
+            self._end_segment(min(self._written, self._last_voiced_end + self.pre_roll))
+        elif self._written - self._speech_start >= self.max_segment:
+            self._end_segment(self._written)
+
+    def _start_segment(self):
+        ring_len = len(self._ring)
+        window_start = self._written - self.window_frames * self.frame_len
+        start = window_start - self.pre_roll
+        start = max(start, self._segment_floor, self._written - ring_len + self.frame_len, 0)
+
+        self.triggered = True
+        self._speech_start = start
+        self._emitted = start
+        self._voiced_frames = int(self._history.sum())
+        self._silence_frames = 0
+        self._last_voiced_end = self._written
+
+        if self.on_speech_start:
+            self.on_speech_start(self.sample_time(start))
+        self._emit_audio(self._written)
+
+    def _emit_audio(self, until):
+        """将 [_emitted, until) 范围的音频推送给 on_speech_audio"""
+        if self.on_speech_audio and until > self._emitted:
+            for view in self._ring_views(self._emitted, until):
+                self.on_speech_audio(view)
+        self._emitted = until
+
+    def _ring_views(self, start, end):
+        """返回环形缓冲区中 [start, end) 的 1~2 个连续视图"""
+        ring_len = len(self._ring)
+        a, b = start % ring_len, end % ring_len
+        if end - start <= 0:
+            return []
+        if a < b:
+            return [self._ring[a:b]]
+        return [self._ring[a:], self._ring[:b]]
+
+    def _end_segment(self, end):
+        start = self._speech_start
+        voiced = self._voiced_frames
+        self.triggered = False
+        self._segment_floor = end
+        self._history[:] = False
+        self._voiced_frames = 0
+        self._silence_frames = 0
+
+        if voiced < self.min_speech_frames or end <= start:
+            return
+        if self.on_speech_end:
+            views = self._ring_views(start, end)
+            pcm = np.concatenate(views) if len(views) > 1 else views[0].copy()
+            self.on_speech_end(pcm, self.sample_time(start), self.sample_time(end))
@@ -80,9 +80,14 @@ print("步骤 5: 测试创建 OmniRealtimeConversation")
 print("-" * 60)
 
 try:
+    # 设置 QWEN_OMNI_REALTIME_URL 时连接本地模拟服务（mock_omni_server.py），不消耗额度
+    omni_url = os.getenv('QWEN_OMNI_REALTIME_URL') or None
+    if omni_url:
+        print(f"使用本地模拟服务: {omni_url}")
     conversation = OmniRealtimeConversation(
         model='qwen3-omni-flash-realtime',
         callback=callback,
+        url=omni_url,
     )
     print("✅ 对话实例创建成功")
 except Exception as e:
@@ -0,0 +1,145 @@
+"""
+StreamingVAD 行为测试
+用合成的浊音（基频缓慢变化的谐波叠加 + 音节包络，比纯正弦更接近人声，WebRTC VAD 能稳定判为语音）
+和低幅噪声拼出已知时间轴的音频，检查语音段边界、pre-roll、hangover 拖尾、停顿合并 / 拆分以及 flush
+
+用法:
+    python test_streaming_vad.py        # 也可用 pytest 运行
+"""
+
+import numpy as np
+from streaming_vad import StreamingVAD
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+PRE_ROLL_S = 0.3
+HANGOVER_S = 0.6
+TRIGGER_WINDOW_S = 0.3
+# WebRTC VAD 在浊音结束后还会多判几帧语音，边界比较允许的误差
+TOLERANCE_S = 0.15
+
+
+def voiced(seconds):
+    """合成浊音：140±20Hz 基频的 14 次谐波，4Hz 音节包络"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    f0 = 140 + 20 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+    harmonics = sum(np.sin(k * phase) / k for k in range(1, 15))
+    return harmonics * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)) * 4000
+
+
+def silence(seconds, rng):
+    return rng.normal(0, 30, int(seconds * SAMPLE_RATE))
+
+
+def build(parts, seed=0):
+    """parts: [("voiced" | "silence", 秒)] → (int16 音频, [(语音开始秒, 语音结束秒)])"""
+    rng = np.random.default_rng(seed)
+    chunks, spans, t = [], [], 0.0
+    for kind, seconds in parts:
+        if kind == "voiced":
+            chunks.append(voiced(seconds))
+            spans.append((t, t + seconds))
+        else:
+            chunks.append(silence(seconds, rng))
+        t += seconds
+    return np.concatenate(chunks).astype(np.int16), spans
+
+
+def run(pcm, chunk=1024, flush=True):
+    """按 chunk 样本分块送入 StreamingVAD，时间轴从音频开头算起；返回各段 (start, end, 回调时刻, pcm)"""
+    segments = []
+    vad = None
+
+    def on_end(segment, start, end):
+        segments.append((start, end, vad.current_time, segment))
+
+    vad = StreamingVAD(SAMPLE_RATE, FRAME_MS, pre_roll_ms=int(PRE_ROLL_S * 1000),
+                       hangover_ms=int(HANGOVER_S * 1000), trigger_window_ms=int(TRIGGER_WINDOW_S * 1000),
+                       on_speech_end=on_end)
+    for i in range(0, len(pcm), chunk):
+        block = pcm[i:i + chunk]
+        vad.process(block, capture_time=(i + len(block)) / SAMPLE_RATE)
+    if flush:
+        vad.flush()
+    return segments
+
+
+def test_segment_boundaries():
+    pcm, [(onset, offset)] = build([("silence", 1.0), ("voiced", 1.5), ("silence", 2.0)])
+    segments = run(pcm)
+    assert len(segments) == 1, segments
+    start, end, ended_at, segment = segments[0]
+
+    # 起点：包含完整的 pre-roll，最多再早一个触发窗口（触发时回溯整个窗口）
+    assert onset - PRE_ROLL_S - TRIGGER_WINDOW_S - TOLERANCE_S <= start <= onset - PRE_ROLL_S, start
+    # 终点：最后一帧语音之后保留与 pre-roll 等长的尾巴
+    assert offset + PRE_ROLL_S <= end <= offset + PRE_ROLL_S + TOLERANCE_S, end
+    assert len(segment) == round((end - start) * SAMPLE_RATE)
+
+
+def test_pre_roll_audio():
+    pcm, [(onset, _)] = build([("silence", 1.0), ("voiced", 1.5), ("silence", 2.0)])
+    start, _, _, segment = run(pcm)[0]
+    # 段开头是语音之前的静音（pre-roll），语音从 onset 处开始
+    lead = int(round((onset - start) * SAMPLE_RATE))
+    assert lead >= PRE_ROLL_S * SAMPLE_RATE
+    assert np.abs(segment[:lead].astype(np.int32)).max() < 300
+    assert np.abs(segment[lead:lead + 1600].astype(np.int32)).max() > 2000
+    assert np.array_equal(segment, pcm[int(round(start * SAMPLE_RATE)):][:len(segment)])
+
+
+def test_hangover():
+    pcm, _ = build([("silence", 1.0), ("voiced", 1.5), ("silence", 2.0)])
+    _, end, ended_at, _ = run(pcm)[0]
+    # 最后一帧语音之后连续静音满 hangover 才结束（结束回调时刻 = 最后语音 + hangover，段终点 = 最后语音 + pre-roll）
+    assert abs((ended_at - end) - (HANGOVER_S - PRE_ROLL_S)) < 1e-6, (ended_at, end)
+
+
+def test_short_pause_merged():
+    pcm, spans = build([("silence", 1.0), ("voiced", 1.0), ("silence", HANGOVER_S / 2), ("voiced", 1.0),
+                        ("silence", 2.0)])
+    segments = run(pcm)
+    assert len(segments) == 1, [(s, e) for s, e, _, _ in segments]
+    assert segments[0][0] <= spans[0][0] - PRE_ROLL_S and segments[0][1] >= spans[1][1]
+
+
+def test_long_pause_split():
+    pcm, spans = build([("silence", 1.0), ("voiced", 1.0), ("silence", HANGOVER_S * 2), ("voiced", 1.0),
+                        ("silence", 2.0)])
+    segments = run(pcm)
+    assert len(segments) == 2, [(s, e) for s, e, _, _ in segments]
+    (start1, end1, _, _), (start2, end2, _, _) = segments
+    assert end1 <= start2, "语音段不应重叠"
+    assert spans[0][1] <= end1 <= spans[0][1] + PRE_ROLL_S + TOLERANCE_S
+    assert start2 <= spans[1][0] and end2 >= spans[1][1]
+
+
+def test_flush_ends_open_segment():
+    pcm, _ = build([("silence", 1.0), ("voiced", 1.0)])
+    assert run(pcm, flush=False) == []
+    segments = run(pcm)
+    assert len(segments) == 1
+    total = len(pcm) / SAMPLE_RATE
+    # 不足一帧的尾部被丢弃
+    assert total - FRAME_MS / 1000 <= segments[0][1] <= total
+
+
+def test_noise_only():
+    pcm, _ = build([("silence", 3.0)])
+    assert run(pcm) == []
+
+
+def test_chunk_size_independent():
+    pcm, _ = build([("silence", 1.0), ("voiced", 1.0), ("silence", 1.2), ("voiced", 0.8), ("silence", 1.5)])
+    expected = [(s, e) for s, e, _, _ in run(pcm, chunk=1024)]
+    for chunk in (160, 480, 4801):
+        assert [(s, e) for s, e, _, _ in run(pcm, chunk=chunk)] == expected, chunk
+
+
+if __name__ == "__main__":
+    tests = [(name, fn) for name, fn in globals().items() if name.startswith("test_") and callable(fn)]
+    for name, fn in tests:
+        fn()
+        print(f"✓ {name}")
+    print(f"全部 {len(tests)} 项通过")
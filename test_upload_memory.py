@@ -0,0 +1,236 @@
+"""
+上传内存占用测试
+向运行中的 qwen_video_server.py 上传不同大小的图像 / 视频，用 psutil 以 10ms 间隔采样服务进程 RSS，
+报告每个请求的峰值 RSS 增量；峰值增量超过 --max-rss-delta-mb 或状态码不符合预期（超过上限的上传应返回 413）的用例失败
+
+上传数据是有效的 JPEG / MP4 后面填充随机字节（解码器忽略尾部数据），客户端用流式 multipart 发送，
+不在本进程中拼出整个请求体
+
+用法:
+    python qwen_video_server.py                     # 另一个终端（需要上游服务，可配合 mock_omni_server.py）
+    python test_upload_memory.py [--sizes 5 50 150] [--concurrency 4] [-o report.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import cv2
+import numpy as np
+import psutil
+import requests
+from load_test_video_api import find_server_pid
+
+BASE_URL = 'http://localhost:5002'
+PAD_CHUNK = 1024 * 1024
+# Werkzeug 开发服务器返回 413 后按 10MB 一次读掉未读完的请求体（serving.py 的 discard），
+# 这部分临时内存与上传处理无关，413 用例的 RSS 上限额外放宽
+DEV_SERVER_DRAIN_MB = 20
+
+
+class MultipartBody:
+    """流式 multipart 请求体：表单字段 + 一个文件字段（从磁盘分块读取），带长度以便发送 Content-Length"""
+
+    def __init__(self, fields, file_field, file_path, filename, content_type):
+        self.boundary = uuid.uuid4().hex
+        head = b''
+        for name, value in fields.items():
+            head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f'{value}\r\n').encode('utf-8')
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                 f'filename="{filename}"\r\nContent-Type: {content_type}\r\n\r\n').encode('utf-8')
+        self.parts = [io.BytesIO(head), open(file_path, 'rb'), io.BytesIO(f'\r\n--{self.boundary}--\r\n'.encode())]
+        self.length = len(head) + os.path.getsize(file_path) + len(self.parts[2].getvalue())
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        out = b''
+        while self.parts and (size < 0 or len(out) < size):
+            chunk = self.parts[0].read(-1 if size < 0 else size - len(out))
+            if not chunk:
+                self.parts.pop(0).close()
+                continue
+            out += chunk
+        return out
+
+
+class RSSPeak:
+    """请求期间以固定间隔采样服务进程 RSS，记录峰值"""
+
+    def __init__(self, pid, interval=0.01):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def rss(self):
+        return self.process.memory_info().rss
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, self.rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.rss()
+        self.peak = self.baseline
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.rss())
+
+
+def make_padded_file(kind, size_mb, directory):
+    """生成有效的 JPEG / MP4 并用随机字节填充到 size_mb"""
+    frame = np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    path = os.path.join(directory, f'{kind}_{size_mb}mb.{"jpg" if kind == "jpeg" else "mp4"}')
+    if kind == 'jpeg':
+        with open(path, 'wb') as f:
+            f.write(cv2.imencode('.jpg', frame)[1].tobytes())
+    else:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 10, (640, 360))
+        for i in range(50):
+            writer.write(cv2.resize(np.roll(frame, i * 40, axis=1), (640, 360)))
+        writer.release()
+    rng = np.random.default_rng(1)
+    with open(path, 'ab') as f:
+        while f.tell() < size_mb * 1024 * 1024:
+            f.write(rng.integers(0, 256, PAD_CHUNK, dtype=np.uint8).tobytes())
+    return path
+
+
+def upload(url, fields, path):
+    kind = 'image/jpeg' if path.endswith('.jpg') else 'video/mp4'
+    body = MultipartBody(fields, 'video', path, os.path.basename(path), kind)
+    t0 = time.perf_counter()
+    try:
+        response = requests.post(url, data=body, headers={'Content-Type': body.content_type}, timeout=300)
+        status = response.status_code
+    except requests.RequestException as e:
+        # 服务端按 Content-Length 提前拒绝时可能在上传过程中关闭连接
+        status = f'error: {type(e).__name__}'
+    return status, time.perf_counter() - t0
+
+
+def wait_jobs_idle(base, timeout=120):
+    """等待后台视频分析任务全部结束，避免任务解码视频的内存计入后续用例"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        jobs = requests.get(f'{base}/api/jobs').json().get('jobs', [])
+        if all(job['status'] in ('done', 'failed', 'cancelled') for job in jobs):
+            return
+        time.sleep(0.2)
+
+
+def run_case(name, pid, url, fields, paths, expect, max_rss_delta_mb):
+    """并发上传 paths 中的文件，返回该用例的结果；状态码符合预期且峰值 RSS 增量不超过 max_rss_delta_mb 时 ok"""
+    results = [None] * len(paths)
+
+    def worker(i):
+        results[i] = upload(url, fields, paths[i])
+
+    with RSSPeak(pid) as rss:
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(paths))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    statuses = [r[0] for r in results]
+    size_mb = sum(os.path.getsize(p) for p in paths) / 1024 / 1024
+    status_ok = all(s == expect or (expect == 413 and str(s).startswith('error')) for s in statuses)
+    rss_delta_mb = (rss.peak - rss.baseline) / 1024 / 1024
+    if expect == 413:
+        max_rss_delta_mb += DEV_SERVER_DRAIN_MB
+    ok = status_ok and rss_delta_mb <= max_rss_delta_mb
+    row = {
+        "case": name,
+        "uploads": len(paths),
+        "upload_mb": round(size_mb, 1),
+        "status": statuses,
+        "expected": expect,
+        "status_ok": status_ok,
+        "ok": ok,
+        "latency_s": round(max(r[1] for r in results), 2),
+        "rss_baseline_mb": round(rss.baseline / 1024 / 1024, 1),
+        "rss_peak_delta_mb": round(rss_delta_mb, 1),
+        "max_rss_delta_mb": max_rss_delta_mb,
+    }
+    print(f"{'✅' if ok else '❌'} {name:<40}{row['upload_mb']:>9.1f}MB  状态 {statuses}  "
+          f"{row['latency_s']:>6.2f}s  峰值 RSS +{row['rss_peak_delta_mb']:.1f}MB"
+          f"{'' if rss_delta_mb <= max_rss_delta_mb else f'（超过 {max_rss_delta_mb}MB）'}")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='上传内存占用测试')
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50, 150], help='上传大小（MB）')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发用例的上传数')
+    parser.add_argument('--over-limit-mb', type=int, default=250, help='超过请求上限的上传大小（MB）')
+    parser.add_argument('--max-rss-delta-mb', type=float, default=20.0,
+                        help='每个用例允许的服务进程峰值 RSS 增量（MB），超出即失败（413 用例另加 DEV_SERVER_DRAIN_MB）')
+    parser.add_argument('--server-pid', type=int, default=None)
+    parser.add_argument('-o', '--output', default=None, help='结果 JSON 输出路径')
+    args = parser.parse_args()
+
+    pid = args.server_pid or find_server_pid(args.base_url)
+    if not pid:
+        raise SystemExit(f'找不到 {args.base_url} 的服务进程，请用 --server-pid 指定')
+    base = args.base_url
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            jpeg = make_padded_file('jpeg', size, tmp)
+            mp4 = make_padded_file('mp4', size, tmp)
+            rows.append(run_case(f'analyze-video frame (jpeg {size}MB)', pid, f'{base}/api/analyze-video',
+                                 {'question': '描述画面'}, [jpeg], 200, args.max_rss_delta_mb))
+            rows.append(run_case(f'analyze-video scene (mp4 {size}MB)', pid, f'{base}/api/analyze-video',
+                                 {'question': '描述画面', 'mode': 'scene', 'max_frames': 2}, [mp4], 200,
+                                 args.max_rss_delta_mb))
+            rows.append(run_case(f'jobs submit (mp4 {size}MB)', pid, f'{base}/api/jobs',
+                                 {'question': '描述画面', 'mode': 'uniform'}, [mp4], 202, args.max_rss_delta_mb))
+            wait_jobs_idle(base)
+
+            session = requests.post(f'{base}/api/session/create', json={}).json()
+            session_id = session.get('session_id')
+            if session_id:
+                rows.append(run_case(f'session video (jpeg {size}MB)', pid, f'{base}/api/session/{session_id}/video',
+                                     {}, [jpeg], 200 if size <= 20 else 413, args.max_rss_delta_mb))
+                requests.post(f'{base}/api/session/{session_id}/close')
+
+            if args.concurrency > 1:
+                rows.append(run_case(f'analyze-video frame x{args.concurrency} (jpeg {size}MB)', pid,
+                                     f'{base}/api/analyze-video', {'question': '描述画面'},
+                                     [jpeg] * args.concurrency, 200, args.max_rss_delta_mb))
+            os.remove(jpeg)
+            os.remove(mp4)
+
+        big = make_padded_file('mp4', args.over_limit_mb, tmp)
+        rows.append(run_case(f'over limit (mp4 {args.over_limit_mb}MB)', pid, f'{base}/api/analyze-video',
+                             {'question': '描述画面'}, [big], 413, args.max_rss_delta_mb))
+
+    failed = [r for r in rows if not r['ok']]
+    print(f"\n{len(rows) - len(failed)}/{len(rows)} 个用例通过（状态码符合预期且峰值 RSS 增量 ≤ {args.max_rss_delta_mb}MB），"
+          f"最大峰值 RSS 增量 {max(r['rss_peak_delta_mb'] for r in rows):.1f}MB")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"server_pid": pid, "rows": rows}, f, ensure_ascii=False, indent=2)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
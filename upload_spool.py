@@ -0,0 +1,114 @@
+"""
+内存有界的上传处理（qwen_video_server.py 的视频 / 图像上传）
+原来 request.files['video'].read() 把整个上传读入内存，之后 np.frombuffer / Base64 / 临时文件各再复制一份。这里：
+- multipart 解析时，超过 UPLOAD_SPOOL_BYTES 的请求直接把文件部分流式写入命名临时文件（按块写入，内存有界），
+  请求结束时删除
+- upload_path() 给出文件路径，视频解码器（cv2.VideoCapture）直接打开，不再复制到新的临时文件
+- 图像解码由 video_frame_utils.process_video_file() 对文件 mmap 后直接 imdecode，不产生整份拷贝
+- MAX_CONTENT_LENGTH 限制整个请求大小，超出返回 413 JSON；单帧接口另有更小的上限（由请求类按接口给出，
+  不给 request.max_content_length 赋值，Flask 3.1 之前该属性只读）
+- 非文件表单字段另有内存上限 UPLOAD_MAX_FORM_BYTES
+
+环境变量:
+    UPLOAD_MAX_MB        请求体上限（默认 200MB）
+    UPLOAD_MAX_FRAME_MB  单帧上传接口（/api/session/<id>/video）的上限（默认 20MB）
+    UPLOAD_SPOOL_KB      小于该值的请求在内存中处理（默认 1024KB）
+    UPLOAD_MAX_FORM_KB   multipart 中非文件字段的内存上限（默认 500KB）
+    UPLOAD_TMP_DIR       临时文件目录（默认系统临时目录）
+"""
+
+import io
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from flask import Request, abort, current_app, g, jsonify, request
+
+UPLOAD_MAX_BYTES = int(float(os.getenv('UPLOAD_MAX_MB', 200)) * 1024 * 1024)
+UPLOAD_MAX_FRAME_BYTES = int(float(os.getenv('UPLOAD_MAX_FRAME_MB', 20)) * 1024 * 1024)
+UPLOAD_SPOOL_BYTES = int(float(os.getenv('UPLOAD_SPOOL_KB', 1024)) * 1024)
+UPLOAD_MAX_FORM_BYTES = int(float(os.getenv('UPLOAD_MAX_FORM_KB', 500)) * 1024)
+UPLOAD_TMP_DIR = os.getenv('UPLOAD_TMP_DIR') or None
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class SpooledUploadRequest(Request):
+    """大请求的文件部分写入命名临时文件（可按路径交给解码器），小请求留在内存"""
+
+    # 类属性覆盖：Werkzeug 3.0 / Flask 3.1 的表单解析都读取它（Flask 3.0 不支持 MAX_FORM_MEMORY_SIZE 配置）
+    max_form_memory_size = UPLOAD_MAX_FORM_BYTES
+
+    @property
+    def max_content_length(self):
+        """当前接口的请求体上限：install_upload_limits 设置的接口上限，否则为 MAX_CONTENT_LENGTH"""
+        limit = current_app.config.get('UPLOAD_ENDPOINT_LIMITS', {}).get(self.endpoint)
+        return limit or super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_SPOOL_BYTES:
+            return io.BytesIO()
+        suffix = os.path.splitext(filename or '')[1][:16]
+        # delete=False：Windows 上打开中的 NamedTemporaryFile 不能被解码器再次打开，改为请求结束时删除
+        spool = tempfile.NamedTemporaryFile(prefix='upload_', suffix=suffix, dir=UPLOAD_TMP_DIR, delete=False)
+        g.setdefault('upload_spools', []).append(spool)
+        return spool
+
+
+def _cleanup_spools(exc=None):
+    for spool in g.pop('upload_spools', []):
+        try:
+            spool.close()
+            os.remove(spool.name)
+        except OSError:
+            pass
+
+
+def _too_large(e):
+    limit = request.max_content_length or UPLOAD_MAX_BYTES
+    return jsonify({"error": f"上传内容过大，上限 {limit // (1024 * 1024)}MB"}), 413
+
+
+def install_upload_limits(app, endpoint_limits=None):
+    """
+    为 Flask 应用启用流式落盘的上传解析、请求大小上限和 413 JSON 响应
+
+    :param endpoint_limits: {视图函数名: 字节数}，为个别接口设置比 UPLOAD_MAX_BYTES 更小的上限
+    """
+    def enforce_limits():
+        # 按 Content-Length 提前拒绝，不读取请求体
+        if request.content_length is not None and request.content_length > request.max_content_length:
+            abort(413)
+        # 在视图之外解析 multipart（无 Content-Length 的分块上传在解析中超限时，由 413 处理器响应）
+        if request.mimetype == 'multipart/form-data':
+            request.files
+
+    app.request_class = SpooledUploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES
+    app.config['UPLOAD_ENDPOINT_LIMITS'] = dict(endpoint_limits or {})
+    app.before_request(enforce_limits)
+    app.teardown_request(_cleanup_spools)
+    app.register_error_handler(413, _too_large)
+
+
+@contextmanager
+def upload_path(storage):
+    """上传文件的磁盘路径：已落盘时直接使用，内存中的小文件写入临时文件"""
+    stream = storage.stream
+    name = getattr(stream, 'name', None)
+    if isinstance(name, str) and os.path.exists(name):
+        stream.flush()
+        yield name
+        return
+    suffix = os.path.splitext(storage.filename or '')[1][:16]
+    fd, temp_path = tempfile.mkstemp(prefix='upload_', suffix=suffix, dir=UPLOAD_TMP_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            stream.seek(0)
+            shutil.copyfileobj(stream, f, COPY_CHUNK_BYTES)
+        yield temp_path
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
@@ -0,0 +1,233 @@
+"""
+视频帧处理流水线（qwen_video_server*.py 与 vad_dash.py 共用）
+解码 → 缩放（默认最大 720p，可按会话指定目标分辨率）→ JPEG 编码（超过 500KB 降质量重编码）→ Base64
+
+JPEG 输入先解析文件头中的尺寸，远大于目标分辨率时用 IMREAD_REDUCED_COLOR_2/4/8 在 DCT 域按
+1/2、1/4、1/8 缩小解码（解码耗时和内存按面积下降），再用 INTER_AREA 缩放到目标尺寸
+
+各阶段拆成独立函数，传入 timings 字典时记录每个阶段耗时（毫秒），供 bench_frame_pipeline.py 使用
+"""
+
+import base64
+import logging
+import mmap
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAX_HEIGHT = 720               # 输出最大高度
+JPEG_QUALITY = 70              # JPEG 质量
+JPEG_FALLBACK_QUALITY = 50     # 超过大小上限时的重编码质量
+MAX_JPEG_BYTES = 500 * 1024    # 单帧 JPEG 大小上限
+RESOLUTION_HEIGHTS = {'360p': 360, '480p': 480, '720p': 720, '1080p': 1080}  # 会话可选的目标分辨率
+
+# DCT 域缩小解码：(缩小倍数, imdecode 标志)，按倍数从大到小尝试
+_REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+# 带尺寸信息的 SOF 段（SOF0-SOF15，排除 DHT / JPG / DAC）
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def resolution_height(resolution, default=MAX_HEIGHT):
+    """'480p' 等分辨率名称 → 目标高度，未知名称返回 default"""
+    return RESOLUTION_HEIGHTS.get(str(resolution).lower(), default)
+
+
+@contextmanager
+def stage(timings, name):
+    """记录一个阶段的耗时（毫秒），timings 为 None 时不计时"""
+    if timings is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+def read_first_frame(path):
+    """读取视频文件的第一帧"""
+    cap = cv2.VideoCapture(path)
+    ret, frame = cap.read()
+    cap.release()
+    return frame if ret else None
+
+
+def decode_video_first_frame(data):
+    """把视频文件（如前端 MediaRecorder 录制的 webm）写入临时文件，读取第一帧"""
+    fd, temp_path = tempfile.mkstemp(suffix=".webm")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return read_first_frame(temp_path)
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def jpeg_dimensions(data):
+    """从 JPEG 文件头的 SOF 段读取 (宽, 高)，不是 JPEG 或头部不完整时返回 None"""
+    data = memoryview(data)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # 填充字节
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # 无长度字段的标记
+            offset += 2
+            continue
+        length = (data[offset + 2] << 8) | data[offset + 3]
+        if marker in _SOF_MARKERS:
+            if offset + 9 > len(data):
+                return None
+            height = (data[offset + 5] << 8) | data[offset + 6]
+            width = (data[offset + 7] << 8) | data[offset + 8]
+            return (width, height) if width and height else None
+        if marker == 0xDA:  # SOS 之后是熵编码数据，不会再出现 SOF
+            return None
+        offset += 2 + length
+    return None
+
+
+def plan_decode(img_bytes, max_height=MAX_HEIGHT):
+    """
+    选择 imdecode 标志：缩小解码后的短边仍不小于 max_height 的最大倍数，之后只需向下缩放
+
+    按短边判断：EXIF 方向为 90° 时解码结果会旋转，文件头中的高度可能是输出的宽度
+
+    :return: (imdecode 标志, 缩小倍数)
+    """
+    size = jpeg_dimensions(img_bytes)
+    if size is not None:
+        short_side = min(size)
+        for factor, flag in _REDUCED_DECODE_FLAGS:
+            # libjpeg 缩小解码的尺寸向上取整
+            if -(-short_side // factor) >= max_height:
+                return flag, factor
+    return cv2.IMREAD_COLOR, 1
+
+
+def decode_frame(img_bytes, max_height=MAX_HEIGHT, video_path=None):
+    """
+    先按图像解码（JPEG 按 max_height 缩小解码），失败时按视频文件取第一帧，返回 BGR 帧或 None
+
+    :param video_path: 数据已在磁盘上时的文件路径，视频回退直接打开它，不再写临时文件
+    """
+    flag, _ = plan_decode(img_bytes, max_height)
+    frame = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), flag)
+    if frame is None:
+        logger.info("尝试作为视频文件处理...")
+        frame = read_first_frame(video_path) if video_path else decode_video_first_frame(img_bytes)
+        if frame is None:
+            logger.error("无法从视频中提取帧")
+        else:
+            logger.info(f"成功从视频提取帧，尺寸: {frame.shape}")
+    return frame
+
+
+def resize_frame(frame, max_height=MAX_HEIGHT):
+    """高度超过 max_height 时等比缩小（INTER_AREA，缩小时不产生混叠）"""
+    height, width = frame.shape[:2]
+    if height > max_height:
+        scale = max_height / height
+        frame = cv2.resize(frame, (int(width * scale), max_height), interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def encode_jpeg(frame, quality=JPEG_QUALITY, fallback_quality=JPEG_FALLBACK_QUALITY, max_bytes=MAX_JPEG_BYTES):
+    """编码为 JPEG，超过 max_bytes 时用 fallback_quality 重编码，返回字节或 None"""
+    success, encoded = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not success:
+        return None
+    if encoded.nbytes > max_bytes:
+        success, encoded = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), fallback_quality])
+        if not success:
+            return None
+    return encoded.tobytes()
+
+
+def encode_frame(frame, timings=None, max_height=MAX_HEIGHT):
+    """
+    将已捕获的视频帧编码为 Base64 JPEG（摄像头采集路径）
+
+    :return: (img_b64, 缩放后的帧)，编码失败返回 None
+    """
+    with stage(timings, "resize"):
+        frame = resize_frame(frame, max_height)
+    with stage(timings, "encode"):
+        jpeg = encode_jpeg(frame)
+    if jpeg is None:
+        return None
+    with stage(timings, "b64encode"):
+        img_b64 = base64.b64encode(jpeg).decode('ascii')
+    return img_b64, frame
+
+
+def process_video_frame(frame_data, timings=None, max_height=MAX_HEIGHT):
+    """
+    处理上传的视频帧数据（服务端路径）
+
+    :param frame_data: Base64 编码的图像数据、原始图像字节或视频文件
+    :param max_height: 输出最大高度（会话目标分辨率）
+    :return: 调整大小并压缩的 Base64 编码 JPEG，失败返回 None
+    """
+    try:
+        # 如果是 Base64 字符串，先解码
+        with stage(timings, "b64decode"):
+            img_bytes = base64.b64decode(frame_data) if isinstance(frame_data, str) else frame_data
+        logger.info(f"处理视频帧，数据大小: {len(img_bytes)} bytes")
+
+        with stage(timings, "decode"):
+            frame = decode_frame(img_bytes, max_height)
+        if frame is None:
+            return None
+
+        result = encode_frame(frame, timings, max_height)
+        return result[0] if result else None
+
+    except Exception as e:
+        logger.error(f"视频帧处理错误: {e}")
+        return None
+
+
+def process_video_file(path, timings=None, max_height=MAX_HEIGHT):
+    """
+    处理已落盘的上传文件（图像或视频）：mmap 后按图像解码，失败时直接打开该路径取视频第一帧，
+    整个过程不把文件内容读入 Python 内存
+
+    :return: 调整大小并压缩的 Base64 编码 JPEG，失败返回 None
+    """
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return None
+            logger.info(f"处理上传文件，数据大小: {size} bytes")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                with stage(timings, "decode"):
+                    frame = decode_frame(buf, max_height, video_path=path)
+        if frame is None:
+            return None
+
+        result = encode_frame(frame, timings, max_height)
+        return result[0] if result else None
+
+    except Exception as e:
+        logger.error(f"视频帧处理错误: {e}")
+        return None
@@ -0,0 +1,289 @@
+"""
+长视频分析后台任务队列
+/api/analyze-video 同步等待最多 30 秒，长视频会超时。任务模式下：
+- 提交视频后立即返回 job_id，可轮询状态或通过 SSE 订阅进度和结果
+- 任务在有界线程池中执行：按 segment_seconds 把视频切成若干片段，每个片段提取关键帧后
+  在独立的上游会话上分析（片段线程池限制同时打开的上游会话数），最后按时间顺序合并各片段回答
+- 任务状态写入 JOB_DIR/<job_id>/job.json（原子替换），服务重启后未完成的任务自动恢复，
+  已完成的片段不会重新分析；任务结束后删除上传的视频文件
+
+任务状态: queued → running → done / failed / cancelled
+"""
+
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from video_keyframes import extract_keyframes_from_file, probe_duration
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("done", "failed", "cancelled")
+SEGMENT_RETRIES = 1  # 片段分析失败后的重试次数
+
+
+def format_ts(seconds):
+    """秒 → mm:ss"""
+    seconds = int(seconds)
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class JobManager:
+    """
+    视频分析任务管理器
+
+    :param analyze: 片段分析函数 analyze(keyframes, job, segment) -> 回答文本，失败时抛出异常；
+                    keyframes 为 [(时间戳秒, Base64 JPEG)]
+    :param workers: 同时执行的任务数
+    :param segment_workers: 所有任务共享的片段并发数（即同时打开的上游会话数上限）
+    :param max_queued: 未完成任务数上限，超出时拒绝提交
+    """
+
+    def __init__(self, job_dir, analyze, workers=2, segment_workers=4, max_queued=16):
+        self.job_dir = job_dir
+        self.analyze = analyze
+        self.max_queued = max_queued
+        self.jobs = {}
+        self.cancelled = set()
+        self.cond = threading.Condition()
+        self.job_pool = ThreadPoolExecutor(workers, thread_name_prefix="video-job")
+        self.segment_pool = ThreadPoolExecutor(segment_workers, thread_name_prefix="video-segment")
+        os.makedirs(job_dir, exist_ok=True)
+
+    # ---------------- 持久化 ----------------
+
+    def _path(self, job_id, name="job.json"):
+        return os.path.join(self.job_dir, job_id, name)
+
+    def _save(self, job):
+        """原子写入任务状态（调用方持有 self.cond）"""
+        path = self._path(job["job_id"])
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def _update(self, job_id, segment=None, **fields):
+        """更新任务（或其中一个片段）的字段，持久化并唤醒等待进度的订阅者"""
+        with self.cond:
+            job = self.jobs[job_id]
+            target = job["segments"][segment] if segment is not None else job
+            target.update(fields)
+            if job["segments"]:
+                finished = sum(1 for s in job["segments"] if s["status"] == "done")
+                job["progress"] = round(finished / len(job["segments"]), 3)
+            job["updated_at"] = time.time()
+            job["version"] += 1
+            self._save(job)
+            self.cond.notify_all()
+
+    def resume(self):
+        """加载磁盘上的任务，未完成的重新排队，返回恢复的任务数"""
+        resumed = 0
+        for job_id in sorted(os.listdir(self.job_dir)):
+            try:
+                with open(self._path(job_id), encoding="utf-8") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            with self.cond:
+                self.jobs[job_id] = job
+            if job["status"] in FINAL_STATUSES:
+                continue
+            for index, segment in enumerate(job["segments"]):
+                if segment["status"] != "done":
+                    self._update(job_id, index, status="pending")
+            self._update(job_id, status="queued")
+            self.job_pool.submit(self._run, job_id)
+            resumed += 1
+        if resumed:
+            logger.info(f"恢复了 {resumed} 个未完成的视频分析任务")
+        return resumed
+
+    # ---------------- 对外接口 ----------------
+
+    def submit(self, video_stream, question, mode="scene", max_frames=4, segment_seconds=30.0,
+               max_height=480, suffix=".webm"):
+        """提交任务（video_stream 为可读的二进制文件对象，分块复制到任务目录），返回任务状态；未完成任务过多时返回 None"""
+        with self.cond:
+            active = sum(1 for job in self.jobs.values() if job["status"] not in FINAL_STATUSES)
+            if active >= self.max_queued:
+                return None
+        job_id = f"job_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
+        os.makedirs(os.path.join(self.job_dir, job_id))
+        video_name = "video" + suffix
+        with open(self._path(job_id, video_name), "wb") as f:
+            video_stream.seek(0)
+            shutil.copyfileobj(video_stream, f, 1024 * 1024)
+            video_size = f.tell()
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "question": question,
+            "mode": mode,
+            "max_frames": max_frames,
+            "segment_seconds": segment_seconds,
+            "max_height": max_height,
+            "video": video_name,
+            "duration": None,
+            "segments": [],
+            "progress": 0.0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "version": 0,
+        }
+        with self.cond:
+            self.jobs[job_id] = job
+            self._save(job)
+        self.job_pool.submit(self._run, job_id)
+        logger.info(f"视频分析任务已提交: {job_id}（{video_size} bytes）")
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def list(self):
+        with self.cond:
+            return [{k: job[k] for k in ("job_id", "status", "progress", "created_at", "updated_at")}
+                    for job in self.jobs.values()]
+
+    def cancel(self, job_id):
+        """取消任务：未开始的片段不再分析，返回是否找到未结束的任务"""
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if not job or job["status"] in FINAL_STATUSES:
+                return False
+            if job["status"] == "queued":
+                # 还没被 _run 取走：在锁内直接结束，_run 取到时看到终态即返回
+                self._finish(job_id, "cancelled")
+            else:
+                # 已在执行：只做标记，由 _run 在片段结束后结束任务
+                self.cancelled.add(job_id)
+        return True
+
+    def wait(self, job_id, version, timeout=15.0):
+        """等待任务版本号大于 version（或超时），返回最新状态"""
+        with self.cond:
+            self.cond.wait_for(lambda: job_id not in self.jobs or self.jobs[job_id]["version"] > version
+                               or self.jobs[job_id]["status"] in FINAL_STATUSES, timeout)
+        return self.get(job_id)
+
+    # ---------------- 执行 ----------------
+
+    def _run(self, job_id):
+        # 在锁内判断并转为 running，与 cancel() 互斥；此后只有 _run 会结束这个任务
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return
+            self._update(job_id, status="running")
+            job = self.get(job_id)
+        try:
+            video_path = self._path(job_id, job["video"])
+            if not job["segments"]:
+                self._plan_segments(job_id, video_path)
+                job = self.get(job_id)
+
+            pending = [i for i, s in enumerate(job["segments"]) if s["status"] != "done"]
+            futures = [self.segment_pool.submit(self._run_segment, job_id, i, video_path) for i in pending]
+            wait(futures)
+
+            job = self.get(job_id)
+            if job_id in self.cancelled:
+                self._finish(job_id, "cancelled")
+                return
+            failed = [s for s in job["segments"] if s["status"] != "done"]
+            if failed:
+                error = "; ".join(f"片段 {s['index']}: {s.get('error')}" for s in failed)
+                self._finish(job_id, "failed", error=error, result=self._merge(job))
+            else:
+                self._finish(job_id, "done", result=self._merge(job))
+        except Exception as e:
+            logger.error(f"视频分析任务 {job_id} 失败: {e}", exc_info=True)
+            self._finish(job_id, "failed", error=str(e))
+
+    def _plan_segments(self, job_id, video_path):
+        job = self.get(job_id)
+        duration = probe_duration(video_path)
+        if duration is None:
+            # 时长未知（如 MediaRecorder 录制的 webm）：整段作为一个片段
+            bounds = [(0.0, None)]
+        else:
+            count = max(1, math.ceil(duration / job["segment_seconds"]))
+            step = duration / count
+            bounds = [(round(i * step, 3), round((i + 1) * step, 3)) for i in range(count)]
+        segments = [{"index": i, "start": start, "end": end, "status": "pending",
+                     "keyframes": [], "answer": None, "error": None}
+                    for i, (start, end) in enumerate(bounds)]
+        self._update(job_id, duration=duration, segments=segments)
+
+    def _run_segment(self, job_id, index, video_path):
+        if job_id in self.cancelled:
+            return
+        job = self.get(job_id)
+        segment = job["segments"][index]
+        self._update(job_id, index, status="running", error=None)
+        try:
+            keyframes = extract_keyframes_from_file(video_path, job["max_frames"], job["mode"], job["max_height"],
+                                                    start_s=segment["start"], end_s=segment["end"])
+            if not keyframes:
+                raise ValueError("片段中没有可解码的视频帧")
+            self._update(job_id, index, keyframes=[t for t, _ in keyframes])
+            for attempt in range(SEGMENT_RETRIES + 1):
+                try:
+                    answer = self.analyze(keyframes, job, segment)
+                    break
+                except Exception as e:
+                    if attempt == SEGMENT_RETRIES or job_id in self.cancelled:
+                        raise
+                    logger.warning(f"任务 {job_id} 片段 {index} 分析失败，重试: {e}")
+            self._update(job_id, index, status="done", answer=answer)
+        except Exception as e:
+            logger.error(f"任务 {job_id} 片段 {index} 失败: {e}")
+            self._update(job_id, index, status="failed", error=str(e))
+
+    @staticmethod
+    def _merge(job):
+        """按时间顺序合并各片段回答"""
+        done = [s for s in job["segments"] if s["status"] == "done"]
+        if len(job["segments"]) == 1 and done:
+            return done[0]["answer"]
+        lines = []
+        for s in done:
+            end = format_ts(s["end"]) if s["end"] is not None else "结尾"
+            lines.append(f"[{format_ts(s['start'])}-{end}] {s['answer']}")
+        return "\n".join(lines) or None
+
+    def _finish(self, job_id, status, **fields):
+        # 持锁完成：结束状态写入和删除视频之间不会被 delete() 删掉任务目录
+        with self.cond:
+            self._update(job_id, status=status, **fields)
+            self.cancelled.discard(job_id)
+            job_dir = os.path.join(self.job_dir, job_id)
+            for name in os.listdir(job_dir):
+                if name.startswith("video"):
+                    try:
+                        os.remove(os.path.join(job_dir, name))
+                    except OSError:
+                        pass
+        logger.info(f"视频分析任务 {job_id} 结束: {status}")
+
+    def delete(self, job_id):
+        """删除已结束任务的记录"""
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if not job or job["status"] not in FINAL_STATUSES:
+                return False
+            del self.jobs[job_id]
+        shutil.rmtree(os.path.join(self.job_dir, job_id), ignore_errors=True)
+        return True
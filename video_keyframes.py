@@ -0,0 +1,188 @@
+"""
+上传视频片段的关键帧提取（/api/analyze-video 的片段模式）
+原来只取 webm / mp4 的第一帧，这里按流式方式解码整个片段，在帧预算内选出关键帧并按时间顺序返回：
+- scene:   与上一个选中关键帧的 HSV 直方图差异超过阈值即视为新场景（缓慢平移累计到阈值也会选中），
+           超出预算时淘汰差异最小的关键帧
+- uniform: 在片段时长上均匀取帧；时长未知（MediaRecorder 录制的 webm 常没有时长信息）时按固定间隔采样，
+           超出预算就隔一丢一并加倍间隔
+
+分析采样率有上限，长片段的采样间隔超过 SEEK_MIN_GAP_S 时用 seek 跳到下一个采样点，不必解码全片；
+短片段顺序 grab() 跳过中间帧（只解码不转换颜色）
+"""
+
+import logging
+import os
+import tempfile
+import cv2
+from video_frame_utils import MAX_HEIGHT, encode_frame, resize_frame, stage
+
+logger = logging.getLogger(__name__)
+
+KEYFRAME_MODES = ("scene", "uniform")
+ANALYSIS_FPS = 4.0              # 分析采样率上限（帧/秒）
+MAX_ANALYSIS_SAMPLES = 240      # 单个片段最多分析的采样帧数，长片段自动加大采样间隔
+SEEK_MIN_GAP_S = 2.0            # 采样间隔超过该值且时长已知时用 seek 跳转
+SCENE_THRESHOLD = 0.35          # 场景切换阈值（Bhattacharyya 距离，0~1）
+THUMB_SIZE = (96, 54)           # 计算直方图用的缩略图尺寸
+
+
+def _histogram(frame):
+    thumb = cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(thumb, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist)
+
+
+def _probe(cap):
+    """返回 (帧率, 时长秒)，无法获得可靠时长时为 None"""
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if not 0 < fps <= 240:
+        fps = 30.0
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    duration = frame_count / fps if 0 < frame_count < 1e7 else None
+    return fps, duration
+
+
+def _iter_samples(cap, fps, duration, interval, timings, start_s=0.0, end_s=None):
+    """按 interval 秒的间隔产出 [start_s, end_s) 内的 (时间戳秒, 帧)"""
+    end_s = duration if end_s is None else end_s
+    if duration is not None and interval >= SEEK_MIN_GAP_S:
+        t = start_s
+        while t < end_s:
+            with stage(timings, "seek"):
+                cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+            with stage(timings, "decode"):
+                ok, frame = cap.read()
+            if not ok:
+                break
+            pos = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            yield (pos if pos > 0 else t), frame
+            t += interval
+        return
+
+    step = max(1, round(interval * fps))
+    index = 0
+    if start_s > 0:
+        with stage(timings, "seek"):
+            cap.set(cv2.CAP_PROP_POS_MSEC, start_s * 1000)
+        index = round(start_s * fps)
+    while True:
+        with stage(timings, "decode"):
+            ok, frame = cap.read()
+        if not ok or (end_s is not None and index / fps >= end_s):
+            break
+        yield index / fps, frame
+        # 跳过中间帧：grab 只解码，不做颜色转换和拷贝
+        with stage(timings, "skip"):
+            for _ in range(step - 1):
+                if not cap.grab():
+                    return
+        index += step
+
+
+def _select_scene(samples, max_frames, threshold, max_height, timings):
+    selected = []  # [时间戳, 得分, 帧, 直方图]
+    reference = None
+    for t, frame in samples:
+        with stage(timings, "score"):
+            hist = _histogram(frame)
+            score = 1.0 if reference is None else cv2.compareHist(reference, hist, cv2.HISTCMP_BHATTACHARYYA)
+        if reference is not None and score < threshold:
+            continue
+        reference = hist
+        selected.append([t, score, resize_frame(frame, max_height), hist])
+        if len(selected) > max_frames:
+            # 第一帧始终保留，淘汰与前一关键帧差异最小的
+            drop = min(range(1, len(selected)), key=lambda i: selected[i][1])
+            del selected[drop]
+    return [(t, frame) for t, _, frame, _ in selected]
+
+
+def _select_uniform(samples, max_frames, start_s, end_s, max_height):
+    if end_s is not None:
+        span = end_s - start_s
+        targets = [start_s + (i + 0.5) * span / max_frames for i in range(max_frames)]
+        picked = {}
+        for t, frame in samples:
+            nearest = min(range(max_frames), key=lambda i: abs(targets[i] - t))
+            if nearest not in picked or abs(targets[nearest] - t) < abs(targets[nearest] - picked[nearest][0]):
+                picked[nearest] = (t, resize_frame(frame, max_height))
+        return [picked[i] for i in sorted(picked)]
+
+    kept, stride, count = [], 1, 0
+    for t, frame in samples:
+        if count % stride == 0:
+            kept.append((t, resize_frame(frame, max_height)))
+            if len(kept) > max_frames * 2:
+                kept = kept[::2]
+                stride *= 2
+        count += 1
+    if len(kept) <= max_frames:
+        return kept
+    return [kept[int((i + 0.5) * len(kept) / max_frames)] for i in range(max_frames)]
+
+
+def probe_duration(path):
+    """视频文件时长（秒），无法获得可靠时长时返回 None"""
+    cap = cv2.VideoCapture(path)
+    try:
+        return _probe(cap)[1] if cap.isOpened() else None
+    finally:
+        cap.release()
+
+
+def extract_keyframes_from_file(path, max_frames=8, mode="scene", max_height=MAX_HEIGHT,
+                                threshold=SCENE_THRESHOLD, timings=None, start_s=0.0, end_s=None):
+    """
+    从视频文件中选出 [start_s, end_s) 范围内的关键帧（end_s 为 None 表示到结尾）
+
+    :param mode: scene（场景切换）或 uniform（均匀采样）
+    :return: [(时间戳秒, Base64 JPEG)]，按时间顺序；无法解码时返回空列表
+    """
+    if mode not in KEYFRAME_MODES:
+        raise ValueError(f"不支持的关键帧模式: {mode}")
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            return []
+        fps, duration = _probe(cap)
+        if duration is not None:
+            end_s = duration if end_s is None else min(end_s, duration)
+        interval = 1 / ANALYSIS_FPS
+        if end_s is not None:
+            span = end_s - start_s
+            interval = max(interval, span / MAX_ANALYSIS_SAMPLES)
+            if mode == "uniform":
+                # 均匀模式只需每个目标点附近的帧
+                interval = max(interval, span / (max_frames * 4))
+        samples = _iter_samples(cap, fps, duration, interval, timings, start_s, end_s)
+        if mode == "scene":
+            frames = _select_scene(samples, max_frames, threshold, max_height, timings)
+        else:
+            frames = _select_uniform(samples, max_frames, start_s, end_s, max_height)
+    finally:
+        cap.release()
+
+    keyframes = []
+    for t, frame in frames:
+        result = encode_frame(frame, timings, max_height)
+        if result:
+            keyframes.append((round(t, 3), result[0]))
+    logger.info(f"关键帧提取（{mode}）: 范围 {start_s:.1f}~{end_s if end_s is not None else '结尾'}s, "
+                f"采样间隔 {interval:.2f}s, 选出 {len(keyframes)} 帧")
+    return keyframes
+
+
+def extract_keyframes(video_bytes, max_frames=8, mode="scene", max_height=MAX_HEIGHT,
+                      threshold=SCENE_THRESHOLD, timings=None):
+    """从视频文件字节中选出关键帧（写入临时文件后调用 extract_keyframes_from_file）"""
+    fd, temp_path = tempfile.mkstemp(suffix=".webm")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(video_bytes)
+        return extract_keyframes_from_file(temp_path, max_frames, mode, max_height, threshold, timings)
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass